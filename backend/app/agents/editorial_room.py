@@ -1,12 +1,21 @@
-from typing import List, TypedDict, Annotated, Dict, Any, Union
+from typing import AsyncGenerator, List, Optional, Tuple, TypedDict, Annotated, Dict, Any, Union
 import operator
 import json
 import asyncio
+import difflib
+import re
+import time
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
 
 from app.config import settings
+from app.services.http_pool import http_session_pool
+from app.services.llm_ledger import llm_ledger
+from app.services.llm_scheduler import LLMPriority, llm_scheduler
+from app.services.tokens import estimate_tokens
+from app.services.think_filter import ThinkTagFilter, strip_think
 
 # --- State Definition ---
 
@@ -24,16 +33,84 @@ class EditorialState(TypedDict):
     # Logs for the user
     logs: Annotated[List[str], operator.add]
 
+    # 审稿使用的模型（由 API 传入的 editorial_model，留空用默认）
+    model: str
+
+    # 增量复审：各 Agent 最新评分/意见、下一轮需要重跑的 Agent
+    incremental: bool
+    agent_scores: Dict[str, float]
+    agent_critiques: Dict[str, str]
+    # 各 Agent 指出的问题段落编号（从 1 开始，空表示针对全篇）
+    agent_paragraphs: Dict[str, List[int]]
+    pending_agents: List[str]
+    critique_calls: int
+    saved_calls: int
+
+    # 提前结束：monotonic 截止时间与 token 上限（0 表示不限）
+    deadline: float
+    token_budget: int
+
+    # 问题集中在少数段落时只重写这些段落，否则整篇重写
+    paragraph_revision: bool
+    tokens_used: int
+    stop_reason: str
+
 # --- Agents Setup ---
 
-def get_llm():
-    return ChatOpenAI(
-        api_key=settings.openai_api_key,
-        base_url=settings.openai_base_url,
-        model=settings.openai_model,
+# (model, base_url, api_key) -> (httpx client, ChatOpenAI)；客户端共享进程级连接池，按模型复用
+_llm_registry: Dict[Tuple[str, str, str], Tuple[Any, ChatOpenAI]] = {}
+# (模板名, model, base_url, api_key) -> 已组装的 prompt | llm 链
+_chain_registry: Dict[Tuple[str, str, str, str], Any] = {}
+
+
+def _llm_config() -> Tuple[str, str]:
+    from app.services.generator import llm_client
+    # 与写作/摘要使用同一份配置（含设置页中保存到数据库的覆盖值）
+    api_key = llm_client.api_key or settings.openai_api_key or ""
+    base_url = llm_client.base_url or settings.openai_base_url or ""
+    return api_key, base_url
+
+
+def resolve_model(model: Optional[str] = None) -> str:
+    from app.services.generator import llm_client
+    return model or getattr(llm_client, "editorial_model", None) or llm_client.model or settings.openai_model
+
+
+def get_llm(model: Optional[str] = None) -> ChatOpenAI:
+    """按模型返回缓存的 ChatOpenAI 客户端（须在事件循环内调用）"""
+    model = resolve_model(model)
+    api_key, base_url = _llm_config()
+    key = (model, base_url, api_key)
+    http_client = http_session_pool.httpx_client()
+    entry = _llm_registry.get(key)
+    if entry and entry[0] is http_client:
+        return entry[1]
+    llm = ChatOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        model=model,
         temperature=0.7,
-        max_tokens=4000
+        max_tokens=4000,
+        http_async_client=http_client,
+        stream_usage=True,
     )
+    _llm_registry[key] = (http_client, llm)
+    # 连接池重建后旧链全部作废
+    for chain_key in [k for k in _chain_registry if k[1:] == key]:
+        del _chain_registry[chain_key]
+    return llm
+
+
+def get_chain(name: str, model: Optional[str] = None):
+    """返回预编译模板与缓存客户端组装好的链"""
+    model = resolve_model(model)
+    llm = get_llm(model)
+    api_key, base_url = _llm_config()
+    key = (name, model, base_url, api_key)
+    chain = _chain_registry.get(key)
+    if chain is None:
+        chain = _chain_registry[key] = COMPILED_PROMPTS[name] | llm
+    return chain
 
 # --- Prompts ---
 
@@ -48,12 +125,14 @@ PROMPT_A = """你是一个严苛的小说编辑，代号【Agent A：节奏与
 
 请给出你的评分（0-10分）和批判意见。
 如果评分低于8分，必须给出具体的修改建议。
+正文已按段落编号（[1]、[2]…）。如果问题集中在个别段落，请在 paragraphs 中列出需要修改的段落编号；问题涉及全篇则留空。
 
 请严格按照以下JSON格式输出：
 {{
     "score": 7.5,
     "critique": "战力体系有点崩坏，主角明明...",
-    "suggestion": "建议削弱主角的..."
+    "suggestion": "建议削弱主角的...",
+    "paragraphs": [2]
 }}
 """
 
@@ -68,12 +147,14 @@ PROMPT_B = """你是一个热血的小说读者兼评论家，代号【Agent B
 
 请给出你的评分（0-10分）和批判意见。
 如果评分低于8分，必须指出哪里让人觉得无聊或憋屈。
+正文已按段落编号（[1]、[2]…）。如果问题集中在个别段落，请在 paragraphs 中列出需要修改的段落编号；问题涉及全篇则留空。
 
 请严格按照以下JSON格式输出：
 {{
     "score": 6.0,
     "critique": "期待感不足，反派的嘲讽不够...",
-    "suggestion": "增加反派的嚣张气焰，让打脸更爽..."
+    "suggestion": "增加反派的嚣张气焰，让打脸更爽...",
+    "paragraphs": [3, 4]
 }}
 """
 
@@ -90,12 +171,14 @@ PROMPT_C = """你是一个深刻的文学导师，代号【Agent C：思想升
 
 请给出你的评分（0-10分）和批判意见。
 如果评分低于8分，必须指出情节如何偏离了主题或显得肤浅。
+正文已按段落编号（[1]、[2]…）。如果问题集中在个别段落，请在 paragraphs 中列出需要修改的段落编号；问题涉及全篇则留空。
 
 请严格按照以下JSON格式输出：
 {{
     "score": 8.5,
     "critique": "虽然情节紧凑，但没有体现出‘天道无情’的主题...",
-    "suggestion": "在结尾处增加主角对命运的无奈感叹..."
+    "suggestion": "在结尾处增加主角对命运的无奈感叹...",
+    "paragraphs": []
 }}
 """
 
@@ -117,19 +200,161 @@ REVISION_PROMPT = """你是一个专业的小说家。
 注意：直接输出正文，不要包含任何解释或“好的，我来修改”之类的废话。
 """
 
+PARAGRAPH_REVISION_PROMPT = """你是一个专业的小说家。
+编辑委员会认为下面的小说片段只有部分段落需要修改，请只重写指定段落。
+
+当前草稿（已按段落编号）：
+{draft}
+
+上下文信息：
+{context}
+
+哲学思想内核：{philosophical_theme}
+
+编辑委员会反馈（请重点参考）：
+{critiques}
+
+需要重写的段落：{targets}
+
+请只输出重写后的段落，每段以原编号开头，例如：
+[2] 重写后的第2段正文
+[5] 重写后的第5段正文
+注意：不要输出未要求修改的段落，修改后的段落要与前后文自然衔接，不要包含任何解释。
+"""
+
+# 模板只在导入时解析一次
+PROMPT_TEMPLATES = {
+    "A": PROMPT_A,
+    "B": PROMPT_B,
+    "C": PROMPT_C,
+    "revision": REVISION_PROMPT,
+    "paragraph_revision": PARAGRAPH_REVISION_PROMPT,
+}
+COMPILED_PROMPTS = {name: ChatPromptTemplate.from_template(text) for name, text in PROMPT_TEMPLATES.items()}
+
+# (key, 显示名)；按此顺序输出评分，scores[-3:] 始终对应 A/B/C
+AGENTS = [("A", "Agent A (逻辑)"), ("B", "Agent B (爽点)"), ("C", "Agent C (思想)")]
+PASS_SCORE = 8.0
+MAX_REVISIONS = 2
+
 # --- Helper Functions ---
 
-async def run_agent(name: str, prompt_template: str, state: EditorialState) -> Dict:
-    llm = get_llm()
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-    chain = prompt | llm
+def _record_usage(trace, response) -> None:
+    """把 LangChain 返回的 token 用量写入调用账本（缺失时按输出估算）"""
+    usage = getattr(response, "usage_metadata", None) or (
+        getattr(response, "response_metadata", None) or {}
+    ).get("token_usage")
+    trace.set_usage(usage)
+    trace.add_completion(response.content or "")
+
+def change_ratio(old: str, new: str) -> float:
+    """两版正文的改动比例（0 为未改动，1 为完全重写）"""
+    if old == new:
+        return 0.0
+    # 关闭 autojunk：中文里高频字（的、。）否则会被当作噪声忽略，导致小改动也被算成大改
+    return 1.0 - difflib.SequenceMatcher(None, old, new, autojunk=False).ratio()
+
+
+def split_paragraphs(text: str) -> Tuple[List[str], str]:
+    """按空行（没有空行时按换行）切分段落，返回 (段落列表, 分隔符)"""
+    sep = "\n\n" if "\n\n" in text else "\n"
+    return [p.strip() for p in text.split(sep) if p.strip()], sep
+
+
+def number_paragraphs(text: str) -> str:
+    paragraphs, _ = split_paragraphs(text)
+    return "\n\n".join(f"[{i}] {p}" for i, p in enumerate(paragraphs, 1))
+
+
+_PARAGRAPH_MARK = re.compile(r"^\s*\[(\d+)\]\s*", re.M)
+
+
+def parse_paragraph_revision(text: str, targets: List[int]) -> Dict[int, str]:
+    """解析 "[n] 正文" 格式的段落重写结果，只保留要求重写的编号"""
+    text = strip_think(text)
+    marks = list(_PARAGRAPH_MARK.finditer(text))
+    rewrites: Dict[int, str] = {}
+    for i, mark in enumerate(marks):
+        index = int(mark.group(1))
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+        # 单段内的换行合并，避免改变段落编号
+        body = "".join(line.strip() for line in text[mark.end():end].splitlines())
+        if index in targets and body:
+            rewrites[index] = body
+    return rewrites
+
+
+def _parse_indices(value: Any) -> List[int]:
+    if not isinstance(value, list):
+        return []
+    indices = []
+    for item in value:
+        try:
+            indices.append(int(item))
+        except (TypeError, ValueError):
+            continue
+    return indices
+
+
+def revision_targets(state: EditorialState) -> List[int]:
+    """段落修订的目标段落；返回空列表表示应整篇重写"""
+    if not state.get("paragraph_revision"):
+        return []
+    paragraphs, _ = split_paragraphs(state["draft"])
+    if len(paragraphs) < 2:
+        return []
+    agent_scores = state.get("agent_scores") or {}
+    agent_paragraphs = state.get("agent_paragraphs") or {}
+    targets = set()
+    for key, _ in AGENTS:
+        if agent_scores.get(key, 0.0) >= PASS_SCORE:
+            continue
+        indices = [i for i in agent_paragraphs.get(key) or [] if 1 <= i <= len(paragraphs)]
+        if not indices:
+            # 该 Agent 的意见针对全篇
+            return []
+        targets.update(indices)
+    if not targets or len(targets) > len(paragraphs) * settings.editorial_paragraph_max_ratio:
+        return []
+    return sorted(targets)
+
+
+def _stream_writer():
+    """当前图运行的 custom 流写入器；直接调用节点函数（不在图中）时返回空操作"""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda chunk: None
+
+
+def _deadline_reason(state: EditorialState) -> str:
+    deadline = state.get("deadline") or 0.0
+    if deadline and time.monotonic() >= deadline:
+        return "deadline"
+    budget = state.get("token_budget") or 0
+    if budget and state.get("tokens_used", 0) >= budget:
+        return "token_budget"
+    return ""
+
+
+async def run_agent(name: str, prompt_key: str, state: EditorialState) -> Dict:
+    model = resolve_model(state.get("model"))
+    tokens = 0
     
     try:
-        response = await chain.ainvoke({
-            "draft": state["draft"],
-            "context": state["context"],
-            "philosophical_theme": state["philosophical_theme"]
-        })
+        chain = get_chain(prompt_key, model)
+        prompt_tokens = estimate_tokens(PROMPT_TEMPLATES[prompt_key]) + estimate_tokens(state["draft"]) + estimate_tokens(state["context"])
+        async with llm_scheduler.slot(model, LLMPriority.EDITORIAL, prompt_tokens) as slot:
+            with llm_ledger.trace(
+                "editorial_critique", model, prompt_tokens, queue_wait=slot.wait_seconds
+            ) as trace:
+                response = await chain.ainvoke({
+                    "draft": number_paragraphs(state["draft"]),
+                    "context": state["context"],
+                    "philosophical_theme": state["philosophical_theme"]
+                })
+                _record_usage(trace, response)
+            tokens = trace.prompt_tokens + trace.completion_tokens
         
         content = response.content
         if "```json" in content:
@@ -144,6 +369,7 @@ async def run_agent(name: str, prompt_template: str, state: EditorialState) -> D
         score = float(data.get("score", 0))
         critique = data.get("critique", "")
         suggestion = data.get("suggestion", "")
+        paragraphs = _parse_indices(data.get("paragraphs"))
         
         log = f"【{name}】(评分 {score}): {critique} -> 建议: {suggestion}"
         full_critique = f"{name}: {critique} (建议: {suggestion})"
@@ -151,66 +377,181 @@ async def run_agent(name: str, prompt_template: str, state: EditorialState) -> D
         return {
             "score": score,
             "critique": full_critique,
-            "log": log
+            "log": log,
+            "paragraphs": paragraphs,
+            "tokens": tokens,
         }
     except Exception as e:
         print(f"{name} error: {e}")
         return {
             "score": 5.0,
             "critique": f"{name} 执行出错: {str(e)}",
-            "log": f"【{name}】执行出错: {str(e)}"
+            "log": f"【{name}】执行出错: {str(e)}",
+            "paragraphs": [],
+            "tokens": tokens,
         }
 
 # --- Node Functions ---
 
 async def critique_node(state: EditorialState):
-    """Run all 3 agents in parallel"""
-    
-    results = await asyncio.gather(
-        run_agent("Agent A (逻辑)", PROMPT_A, state),
-        run_agent("Agent B (爽点)", PROMPT_B, state),
-        run_agent("Agent C (思想)", PROMPT_C, state)
-    )
-    
-    scores = [r["score"] for r in results]
-    critiques = [r["critique"] for r in results]
-    logs = [r["log"] for r in results]
-    
+    """Run the pending agents in parallel; agents that already passed keep their score"""
+    prev_scores = state.get("agent_scores") or {}
+    prev_critiques = state.get("agent_critiques") or {}
+    prev_paragraphs = state.get("agent_paragraphs") or {}
+    pending = state.get("pending_agents") or [key for key, _ in AGENTS]
+    stop_reason = _deadline_reason(state)
+    skipped = len(AGENTS) - len(pending)
+    if stop_reason and prev_scores:
+        # 已超时/超预算：不再复审，沿用上轮结论直接结束（不计入增量节省）
+        pending, skipped = [], 0
+    to_run = [(key, name) for key, name in AGENTS if key in pending]
+
+    # 每个 Agent 出结论即推送到流（非流式调用时 writer 为空操作）
+    writer = _stream_writer()
+
+    async def run(key: str, name: str):
+        result = await run_agent(name, key, state)
+        writer({"type": "log", "content": result["log"]})
+        return key, result
+
+    fresh = dict(await asyncio.gather(*(run(key, name) for key, name in to_run)))
+    results = list(fresh.values())
+
+    agent_scores, agent_critiques, agent_paragraphs, logs = {}, {}, {}, []
+    for key, name in AGENTS:
+        if key in fresh:
+            agent_scores[key] = fresh[key]["score"]
+            agent_critiques[key] = fresh[key]["critique"]
+            agent_paragraphs[key] = fresh[key]["paragraphs"]
+            logs.append(fresh[key]["log"])
+        else:
+            agent_scores[key] = prev_scores.get(key, 0.0)
+            agent_critiques[key] = prev_critiques.get(key, "")
+            agent_paragraphs[key] = prev_paragraphs.get(key, [])
+            logs.append(f"【{name}】沿用上轮评分 {agent_scores[key]}")
+            writer({"type": "log", "content": logs[-1]})
+
+    tokens_used = state.get("tokens_used", 0) + sum(r["tokens"] for r in results)
     return {
-        "scores": scores,
-        "critiques": critiques,
-        "logs": logs
+        "scores": [agent_scores[key] for key, _ in AGENTS],
+        "critiques": [agent_critiques[key] for key, _ in AGENTS],
+        "logs": logs,
+        "agent_scores": agent_scores,
+        "agent_critiques": agent_critiques,
+        "agent_paragraphs": agent_paragraphs,
+        "critique_calls": state.get("critique_calls", 0) + len(to_run),
+        "saved_calls": state.get("saved_calls", 0) + skipped,
+        "tokens_used": tokens_used,
+        "stop_reason": stop_reason or _deadline_reason({**state, "tokens_used": tokens_used}),
     }
 
-import re
+async def _revise_full(state: EditorialState, model: str, critiques_text: str, writer) -> Tuple[str, int]:
+    """整篇重写，边生成边推送正文"""
+    chain = get_chain("revision", model)
+    # 新一版正文从头推送，前端据此清空上一版
+    writer({"type": "reset"})
+
+    prompt_tokens = estimate_tokens(state["draft"]) + estimate_tokens(state["context"]) + estimate_tokens(critiques_text)
+    think_filter = ThinkTagFilter(strip_bold=True)
+    pieces: List[str] = []
+    async with llm_scheduler.slot(model, LLMPriority.EDITORIAL, prompt_tokens) as slot:
+        with llm_ledger.trace(
+            "editorial_revision", model, prompt_tokens, stream=True, queue_wait=slot.wait_seconds
+        ) as trace:
+            response = None
+            async for chunk in chain.astream({
+                "draft": state["draft"],
+                "context": state["context"],
+                "philosophical_theme": state["philosophical_theme"],
+                "critiques": critiques_text
+            }):
+                trace.mark_first_token()
+                response = chunk if response is None else response + chunk
+                # Remove <think> tags and markdown bold
+                text = think_filter.feed(chunk.content or "")
+                if text:
+                    pieces.append(text)
+                    writer({"type": "content", "content": text})
+            tail = think_filter.flush()
+            if tail:
+                pieces.append(tail)
+                writer({"type": "content", "content": tail})
+            if response is not None:
+                _record_usage(trace, response)
+    return "".join(pieces).strip(), trace.prompt_tokens + trace.completion_tokens
+
+
+async def _revise_paragraphs(
+    state: EditorialState, model: str, critiques_text: str, targets: List[int], writer
+) -> Tuple[Optional[str], int]:
+    """只重写目标段落并拼回原文；解析不出任何目标段落时返回 None"""
+    chain = get_chain("paragraph_revision", model)
+    numbered = number_paragraphs(state["draft"])
+    prompt_tokens = estimate_tokens(numbered) + estimate_tokens(state["context"]) + estimate_tokens(critiques_text)
+    async with llm_scheduler.slot(model, LLMPriority.EDITORIAL, prompt_tokens) as slot:
+        with llm_ledger.trace(
+            "editorial_paragraph_revision", model, prompt_tokens, queue_wait=slot.wait_seconds
+        ) as trace:
+            response = await chain.ainvoke({
+                "draft": numbered,
+                "context": state["context"],
+                "philosophical_theme": state["philosophical_theme"],
+                "critiques": critiques_text,
+                "targets": "、".join(f"[{i}]" for i in targets),
+            })
+            _record_usage(trace, response)
+    tokens = trace.prompt_tokens + trace.completion_tokens
+
+    rewrites = parse_paragraph_revision(response.content or "", targets)
+    if not rewrites:
+        return None, tokens
+    paragraphs, sep = split_paragraphs(state["draft"])
+    for index, text in rewrites.items():
+        paragraphs[index - 1] = strip_think(text).strip()
+    content = sep.join(paragraphs)
+    writer({"type": "reset"})
+    writer({"type": "content", "content": content})
+    return content, tokens
 
-# ...
 
 async def revision_node(state: EditorialState):
-    llm = get_llm()
-    prompt = ChatPromptTemplate.from_template(REVISION_PROMPT)
-    chain = prompt | llm
+    model = resolve_model(state.get("model"))
     
     # Get the critiques from the last round (last 3)
     current_critiques = state["critiques"][-3:]
     critiques_text = "\n".join(current_critiques)
-    
-    response = await chain.ainvoke({
-        "draft": state["draft"],
-        "context": state["context"],
-        "philosophical_theme": state["philosophical_theme"],
-        "critiques": critiques_text
-    })
-    
-    content = response.content
-    # Remove <think> tags and markdown bold
-    clean_content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
-    clean_content = re.sub(r'\*\*', '', clean_content).strip()
+
+    writer = _stream_writer()
+    writer({"type": "system", "content": f"正在根据审稿意见修改第 {state['iteration_count'] + 1} 版..."})
+
+    clean_content, tokens, mode = None, 0, "整篇重写"
+    targets = revision_targets(state)
+    if targets:
+        clean_content, tokens = await _revise_paragraphs(state, model, critiques_text, targets, writer)
+        mode = f"重写段落 {'、'.join(map(str, targets))}"
+    if clean_content is None:
+        # 段落模式未返回可用结果时退回整篇重写
+        clean_content, full_tokens = await _revise_full(state, model, critiques_text, writer)
+        tokens += full_tokens
+        mode = "整篇重写"
+
+    # 只重跑未通过的 Agent；改动过大时已通过的结论也不再可信
+    agent_scores = state.get("agent_scores") or {}
+    ratio = change_ratio(state["draft"], clean_content)
+    if not state.get("incremental") or ratio >= settings.editorial_recritique_change_ratio:
+        pending = [key for key, _ in AGENTS]
+    else:
+        pending = [key for key, _ in AGENTS if agent_scores.get(key, 0.0) < PASS_SCORE]
     
     return {
         "draft": clean_content,
         "iteration_count": state["iteration_count"] + 1,
-        "logs": [f"【系统】已根据意见完成第 {state['iteration_count'] + 1} 版修改。"]
+        "pending_agents": pending,
+        "tokens_used": state.get("tokens_used", 0) + tokens,
+        "logs": [
+            f"【系统】已根据意见完成第 {state['iteration_count'] + 1} 版修改"
+            f"（{mode}，改动 {ratio:.0%}，复审 {'/'.join(pending)}）。"
+        ]
     }
 
 def decision_node(state: EditorialState):
@@ -221,6 +562,9 @@ def decision_node(state: EditorialState):
     current_scores = scores[-3:] if scores else []
     
     print(f"DEBUG: Iteration {iteration}, Scores: {current_scores}")
+
+    if state.get("stop_reason"):
+        return "end"
     
     # Check max retries (2 retries = max iteration 2?)
     # Initial draft (iter 0) -> Critique -> Decision (iter 0) -> Revision -> iter 1
@@ -229,11 +573,11 @@ def decision_node(state: EditorialState):
     # User said: "Retry limit set to 2 times".
     # So max 2 revisions.
     
-    if iteration >= 2:
+    if iteration >= MAX_REVISIONS:
         return "end"
     
     # If any score < 8, revise
-    if any(s < 8.0 for s in current_scores):
+    if any(s < PASS_SCORE for s in current_scores):
         return "revise"
     
     return "end"
@@ -267,12 +611,32 @@ class EditorialRoom:
     """多智能体审稿委员会"""
     
     @staticmethod
-    async def review_and_revise(draft: str, context: str, philosophical_theme: str) -> Dict[str, Any]:
+    async def stream_review(
+        draft: str,
+        context: str,
+        philosophical_theme: str,
+        model: Optional[str] = None,
+        incremental: Optional[bool] = None,
+        deadline_seconds: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        paragraph_revision: Optional[bool] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
-        运行审稿委员会工作流
+        流式运行审稿委员会：边跑边产出 log/system/reset/content 事件，最后产出 {"type": "result"}
+
+        reset 表示开始推送新一版正文（应丢弃之前推送的正文）；result 的内容同 review_and_revise。
         """
+        if incremental is None:
+            incremental = settings.editorial_incremental_critique
+        if deadline_seconds is None:
+            deadline_seconds = settings.editorial_deadline_seconds
+        if token_budget is None:
+            token_budget = settings.editorial_token_budget
+        if paragraph_revision is None:
+            paragraph_revision = settings.editorial_paragraph_revision
+
         # Clean initial draft
-        draft = re.sub(r'<think>.*?</think>', '', draft, flags=re.DOTALL).strip()
+        draft = strip_think(draft, strip_bold=False).strip()
         
         initial_state = {
             "draft": draft,
@@ -281,19 +645,81 @@ class EditorialRoom:
             "critiques": [],
             "scores": [],
             "iteration_count": 0,
-            "logs": ["【系统】初稿提交审稿委员会..."]
+            "logs": ["【系统】初稿提交审稿委员会..."],
+            "model": resolve_model(model),
+            "incremental": incremental,
+            "agent_scores": {},
+            "agent_critiques": {},
+            "agent_paragraphs": {},
+            "pending_agents": [key for key, _ in AGENTS],
+            "critique_calls": 0,
+            "saved_calls": 0,
+            "deadline": time.monotonic() + deadline_seconds if deadline_seconds > 0 else 0.0,
+            "token_budget": token_budget,
+            "tokens_used": 0,
+            "stop_reason": "",
+            "paragraph_revision": paragraph_revision,
         }
-        
-        # Use ainvoke for async execution
-        final_state = await editorial_graph.ainvoke(initial_state)
+        yield {"type": "log", "content": initial_state["logs"][0]}
+
+        final_state = initial_state
+        async for mode, payload in editorial_graph.astream(initial_state, stream_mode=["custom", "values"]):
+            if mode == "custom":
+                yield payload
+            else:
+                final_state = payload
         
         # Clean final content again just in case
         final_content = final_state["draft"]
-        final_content = re.sub(r'<think>.*?</think>', '', final_content, flags=re.DOTALL).strip()
-        final_content = re.sub(r'\*\*', '', final_content).strip()
+        final_content = strip_think(final_content).strip()
+
+        logs = list(final_state["logs"])
+        summary = []
+        stop_reason = final_state.get("stop_reason") or ""
+        if stop_reason:
+            reason = "达到时间上限" if stop_reason == "deadline" else "达到 token 上限"
+            summary.append(f"【系统】{reason}，提前结束审稿。")
+        summary.append(
+            f"【系统】审稿调用 {final_state['critique_calls']} 次，"
+            f"增量复审节省 {final_state['saved_calls']} 次。"
+        )
+        for line in summary:
+            yield {"type": "log", "content": line}
         
-        return {
+        yield {
+            "type": "result",
             "content": final_content,
-            "logs": final_state["logs"],
-            "final_scores": final_state["scores"][-3:] if final_state["scores"] else []
+            "logs": logs + summary,
+            "final_scores": final_state["scores"][-3:] if final_state["scores"] else [],
+            "critique_calls": final_state["critique_calls"],
+            "saved_calls": final_state["saved_calls"],
+            "revisions": final_state["iteration_count"],
+            "tokens_used": final_state["tokens_used"],
+            "stop_reason": stop_reason,
         }
+
+    @staticmethod
+    async def review_and_revise(
+        draft: str,
+        context: str,
+        philosophical_theme: str,
+        model: Optional[str] = None,
+        incremental: Optional[bool] = None,
+        deadline_seconds: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        paragraph_revision: Optional[bool] = None,
+    ) -> Dict[str, Any]:
+        """
+        运行审稿委员会工作流；model 为审稿模型（留空用默认）
+
+        incremental/deadline_seconds/token_budget/paragraph_revision 留空时取 editorial_* 配置。
+        """
+        result: Dict[str, Any] = {}
+        async for event in EditorialRoom.stream_review(
+            draft, context, philosophical_theme, model,
+            incremental=incremental, deadline_seconds=deadline_seconds, token_budget=token_budget,
+            paragraph_revision=paragraph_revision,
+        ):
+            if event["type"] == "result":
+                result = {k: v for k, v in event.items() if k != "type"}
+        return result
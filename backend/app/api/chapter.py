@@ -11,6 +11,8 @@ from app.database import get_db
 from app.models import Chapter, Novel, Scene
 from app.services import outline_generator, scene_generator
 from app.services.chapter_usecases import summarize_chapter_content
+from app.services.scene_context_cache import chapter_scenes_tag, mark_changed
+from app.services.think_filter import strip_think
 
 from pydantic import BaseModel
 
@@ -139,7 +141,7 @@ async def generate_beats(
 ]
 """
     try:
-        response = await scene_generator.llm.generate(prompt)
+        response = await scene_generator.llm.generate(prompt, call_site="beats")
         scenes_data = parse_beats_response(response, request.get("num_beats", 5))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -149,6 +151,8 @@ async def generate_beats(
     await db.execute(
         delete(Scene).where(Scene.chapter_id == chapter_id)
     )
+    # 批量 delete 不经过 ORM 对象，手动登记场景上下文缓存的失效
+    mark_changed(db, chapter_scenes_tag(chapter_id))
 
     created_scenes = []
     for i, scene_data in enumerate(scenes_data):
@@ -231,11 +235,10 @@ def parse_beats_response(response: str, num_beats: int = 5) -> List[Dict[str, An
     scenes = []
 
     # 清理响应 (支持多行思考内容)
-    response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
+    response = strip_think(response)
     response = re.sub(r'章：[^\n]*', '', response)
     response = re.sub(r'节：[^\n]*', '', response)
     response = re.sub(r'分\d+个场景[^\n]*', '', response)
-    response = re.sub(r'\*\*', '', response)
 
     if not response or len(response.strip()) < 10:
         raise ValueError("生成内容为空，生成失败")
@@ -6,6 +6,7 @@ from pydantic import BaseModel
 from typing import Optional
 from app.database import get_db
 from app.models import Lore
+from app.services.knowledge_index import index_lore, remove_lore
 
 router = APIRouter()
 
@@ -21,6 +22,12 @@ class LoreCreate(LoreBase):
     pass
 
 
+class LoreUpdate(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None
+    category: Optional[str] = None
+
+
 class LoreResponse(LoreBase):
     id: str
 
@@ -35,6 +42,7 @@ async def create_lore(lore: LoreCreate, db: AsyncSession = Depends(get_db)):
     db.add(db_lore)
     await db.commit()
     await db.refresh(db_lore)
+    await index_lore([db_lore])
     return db_lore
 
 
@@ -58,6 +66,23 @@ async def get_lore(lore_id: str, db: AsyncSession = Depends(get_db)):
     return lore
 
 
+@router.put("/{lore_id}", response_model=LoreResponse)
+async def update_lore(lore_id: str, lore: LoreUpdate, db: AsyncSession = Depends(get_db)):
+    """更新世界观设定"""
+    result = await db.execute(select(Lore).where(Lore.id == lore_id))
+    db_lore = result.scalar_one_or_none()
+    if not db_lore:
+        raise HTTPException(status_code=404, detail="Lore not found")
+
+    for key, value in lore.model_dump(exclude_unset=True).items():
+        setattr(db_lore, key, value)
+
+    await db.commit()
+    await db.refresh(db_lore)
+    await index_lore([db_lore])
+    return db_lore
+
+
 @router.delete("/{lore_id}")
 async def delete_lore(lore_id: str, db: AsyncSession = Depends(get_db)):
     """删除世界观设定"""
@@ -67,4 +92,5 @@ async def delete_lore(lore_id: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Lore not found")
     await db.delete(lore)
     await db.commit()
+    await remove_lore([lore_id], lore.novel_id)
     return {"message": "Lore deleted"}
@@ -0,0 +1,64 @@
+"""Metrics API - LLM 调用与 RAG 相关的运行时指标"""
+import asyncio
+
+from fastapi import APIRouter, Query
+
+from app.rag.embedding_cache import embedding_cache
+from app.services.llm_cache import llm_response_cache
+from app.services.llm_ledger import llm_ledger
+from app.services.llm_scheduler import llm_scheduler
+from app.services.llm_singleflight import llm_single_flight
+from app.services.scene_context_cache import scene_context_cache
+
+router = APIRouter()
+
+
+@router.get("/llm/cache")
+async def get_llm_cache_stats():
+    """LLM 响应缓存命中/未命中统计"""
+    return llm_response_cache.stats()
+
+
+@router.delete("/llm/cache")
+async def clear_llm_cache():
+    """清空 LLM 响应缓存并重置统计"""
+    await asyncio.to_thread(llm_response_cache.clear)
+    llm_response_cache.reset_stats()
+    return {"message": "LLM cache cleared"}
+
+
+@router.get("/llm/coalescing")
+async def get_llm_coalescing_stats():
+    """相同在途请求合并（single-flight）统计：leaders 为实际上游请求数，coalesced 为被合并的调用数"""
+    return llm_single_flight.stats()
+
+
+@router.get("/llm/scheduler")
+async def get_llm_scheduler_stats():
+    """全局 LLM 调度器状态：各模型并发上限、运行中/排队数（按优先级）与累计排队时长"""
+    return llm_scheduler.stats()
+
+
+@router.get("/llm/ledger")
+async def get_llm_ledger(recent: int = Query(0, ge=0, le=200)):
+    """按调用点与模型汇总的 token、成本、排队/首 token/总延迟；recent>0 时附带最近 N 次调用明细"""
+    return llm_ledger.stats(recent=recent)
+
+
+@router.delete("/llm/ledger")
+async def reset_llm_ledger():
+    """清空内存中的调用账本汇总（已持久化到 llm_call_ledger 表的记录不受影响）"""
+    llm_ledger.reset()
+    return {"message": "LLM ledger reset"}
+
+
+@router.get("/rag/embedding-cache")
+async def get_embedding_cache_stats():
+    """嵌入缓存命中/未命中统计"""
+    return embedding_cache.stats()
+
+
+@router.get("/scene-context-cache")
+async def get_scene_context_cache_stats():
+    """场景上下文缓存命中/失效统计"""
+    return scene_context_cache.stats()
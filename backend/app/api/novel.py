@@ -1,5 +1,5 @@
 """Novel API"""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
@@ -115,9 +115,19 @@ async def update_novel(
 
 
 @router.get("/{novel_id}/rag/summaries")
-async def get_rag_summaries(novel_id: str, db: AsyncSession = Depends(get_db)):
-    """获取小说在 RAG 中的所有摘要"""
-    return await get_rag_summaries_for_novel(novel_id, db)
+async def get_rag_summaries(
+    novel_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    include_text: bool = True,
+    db: AsyncSession = Depends(get_db)
+):
+    """分页获取小说在 RAG 中的摘要；还有下一页时通过 X-Next-Offset 响应头给出起点"""
+    page = await get_rag_summaries_for_novel(novel_id, db, limit=limit, offset=offset, include_text=include_text)
+    if page["next_offset"] is not None:
+        response.headers["X-Next-Offset"] = str(page["next_offset"])
+    return page["items"]
 
 
 class RagSummaryUpdate(BaseModel):
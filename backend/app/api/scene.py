@@ -1,5 +1,4 @@
 import json
-import re
 import asyncio
 from typing import Optional
 
@@ -94,7 +93,7 @@ async def get_scene(scene_id: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Scene not found")
         
     # 动态计算前情提要
-    context = await scene_generator._build_context(scene, db)
+    context = await scene_generator.get_context(scene, db)
     context_summary = "\n".join(context.get("prev_summaries", []))
     
     # 构造响应
@@ -198,17 +197,19 @@ async def generate_scene_content(
                     full_content += item["content"]
                     yield f"data: {json.dumps({'chunk': item['content']})}\n\n"
                     
+                elif item["type"] == "reset":
+                    # 审稿修订开始推送新一版正文，丢弃之前的正文
+                    full_content = ""
+                    yield f"data: {json.dumps({'reset': True})}\n\n"
+
                 elif item["type"] == "log":
                     yield f"data: {json.dumps({'log': item['content']})}\n\n"
                     
                 elif item["type"] == "system":
                     yield f"data: {json.dumps({'system': item['content']})}\n\n"
 
-            # 保存生成的内容到数据库（过滤思考内容）
-            # 先过滤思考内容 (支持多行)
-            clean_content = re.sub(r'<think>.*?</think>', '', full_content, flags=re.DOTALL)
-            clean_content = re.sub(r'\*\*', '', clean_content)  # 移除Markdown加粗
-            scene.content = clean_content.strip()
+            # 保存生成的内容到数据库（思考内容与加粗已在生成阶段过滤）
+            scene.content = full_content.strip()
             await db.commit()
 
             # 触发后台状态分析 (Fire-and-forget)
@@ -6,7 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.models import Scene, Chapter
 from app.services.generator import assistant
-from app.rag import rag_service
+from app.rag import async_rag
 
 router = APIRouter()
 
@@ -64,7 +64,7 @@ async def chat_with_assistant(
     rag_snippets = []
     if novel_id:
         try:
-            for item in rag_service.retrieve_all_by_novel(novel_id, "scene_summary", top_k=2):
+            for item in await async_rag.retrieve_all_by_novel(novel_id, "scene_summary", top_k=2):
                 rag_snippets.append((item.get("text") or "")[:250])
         except Exception:
             pass
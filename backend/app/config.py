@@ -1,6 +1,6 @@
 """配置管理"""
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 import os
 
 
@@ -35,11 +35,96 @@ class Settings(BaseSettings):
     minimax_api_key: Optional[str] = None
     minimax_base_url: Optional[str] = None
 
-    # Embedding 模型
+    # LLM HTTP 连接池（进程级复用，按 base_url 区分）
+    llm_http_limit: int = 100
+    llm_http_limit_per_host: int = 20
+    llm_http_keepalive_timeout: float = 60.0
+    llm_http_dns_cache_ttl: int = 300
+    llm_http_timeout: float = 300.0
+    llm_http_warmup: bool = False
+
+    # LLM 响应缓存（仅对显式开启缓存的确定性调用生效；llm_cache_path 置空则只用内存）
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = "./data/llm_cache.sqlite3"
+    llm_cache_memory_items: int = 512
+    llm_cache_max_entries: int = 5000
+    llm_cache_ttl_seconds: float = 7 * 24 * 3600
+
+    # LLM 全局调度：按模型限制并发，rpm/tpm 为 0 表示不限速
+    llm_max_concurrency: int = 8
+    llm_model_concurrency: Dict[str, int] = {}
+    llm_rpm_limit: int = 0
+    llm_tpm_limit: int = 0
+
+    # LLM 重试与对冲：429/5xx/网络错误按抖动指数退避重试（优先遵循 Retry-After）
+    llm_retry_max_retries: int = 3
+    llm_retry_base_delay: float = 0.5
+    llm_retry_max_delay: float = 20.0
+    llm_hedge_after_seconds: float = 0.0
+
+    # LLM 调用账本：按调用点统计 token/延迟/成本；价格为每 1K token，如 {"gpt-4o": {"prompt": 0.0025, "completion": 0.01}}
+    llm_token_prices: Dict[str, Dict[str, float]] = {}
+    llm_ledger_persist: bool = False
+    llm_ledger_flush_interval: float = 30.0
+
+    # 离线模拟 LLM（压测/无网络开发）：开启后 LLMClient 使用进程内模拟上游
+    llm_fake_enabled: bool = False
+    llm_fake_ttft: float = 0.2
+    llm_fake_tokens_per_second: float = 50.0
+    llm_fake_error_rate: float = 0.0
+    llm_fake_seed: int = 0
+    llm_fake_corpus_path: Optional[str] = None
+
+    # 场景写作 Prompt 的上下文 token 预算（按模型覆盖，如 {"gpt-4o-mini": 12000}）
+    scene_context_token_budget: int = 6000
+    scene_context_token_budgets: Dict[str, int] = {}
+    # 写作 Prompt 中作品设定（系统消息，可被服务商前缀缓存）里世界观的 token 上限
+    scene_bible_worldbuilding_tokens: int = 600
+
+    # 审稿委员会：增量复审只重跑上轮未通过的 Agent（改动比例超过阈值时全部重跑）；截止时间/token 预算为 0 表示不限
+    editorial_incremental_critique: bool = True
+    editorial_recritique_change_ratio: float = 0.35
+    editorial_deadline_seconds: float = 0.0
+    editorial_token_budget: int = 0
+    # 段落修订：问题集中在少数段落时只重写这些段落；目标段落超过该比例则整篇重写
+    editorial_paragraph_revision: bool = True
+    editorial_paragraph_max_ratio: float = 0.5
+
+    # Embedding 模型：backend 为 default（Chroma 内置 MiniLM）/ onnx / sentence_transformers；
+    # 非 default 时 embedding_model 为本地目录，或 embedding_model_dir 下的模型名（不联网下载）
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_backend: str = "default"
+    embedding_model_dir: str = "./models"
+    embedding_batch_size: int = 32
+    embedding_threads: int = 0
+    embedding_quantized: bool = False
+    embedding_max_length: int = 512
+    embedding_pooling: str = "mean"
+    embedding_preload: bool = False
+    # 嵌入缓存：按 模型 + 文本哈希 缓存向量（内存 LRU + 可选 SQLite；embedding_cache_path 置空则只用内存）
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: str = "./data/embedding_cache.sqlite3"
+    embedding_cache_memory_items: int = 4096
+    embedding_cache_max_entries: int = 100000
+    # 场景上下文缓存：按场景缓存组装好的上下文，前序摘要/章节顺序/角色/关系/设定变更后按依赖失效
+    scene_context_cache_enabled: bool = True
+    scene_context_cache_items: int = 1024
 
     # ChromaDB 配置
     chromadb_persist_directory: str = "./chroma_data"
+    # RAG 调用（嵌入推理 + Chroma 读写）在独立线程池执行，不阻塞事件循环；超时为 0 表示不限
+    # 读取用短超时；写入（批量嵌入可能很慢，超时后线程仍在写）单独设置，回填脚本始终不限
+    rag_max_workers: int = 2
+    rag_timeout_seconds: float = 10.0
+    rag_write_timeout_seconds: float = 300.0
+    # 混合检索：向量结果与内存 BM25（中文字二元组）结果按倒数排名融合（RRF，k 越大名次差异影响越小）
+    rag_hybrid_enabled: bool = True
+    rag_rrf_k: int = 60
+    # 向量分区：global 为所有小说共用集合并按 novel_id 过滤；novel 为每部小说独立集合（句柄 LRU 池上限见 pool_size）
+    # 从 global 切到 novel 前先执行 python migrate_rag_partitions.py 搬迁已有向量
+    rag_partition_mode: str = "global"
+    rag_partition_pool_size: int = 64
+    rag_partition_search_ef: int = 64
 
     class Config:
         env_file = ".env"
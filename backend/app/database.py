@@ -37,6 +37,7 @@ async def init_db():
                 "ALTER TABLE scenes ADD COLUMN video_task_id VARCHAR(128)",
                 "ALTER TABLE scenes ADD COLUMN video_url VARCHAR(512)",
                 "ALTER TABLE scenes ADD COLUMN video_prompt TEXT",
+                "ALTER TABLE llm_call_ledger ADD COLUMN cached_tokens INTEGER NOT NULL DEFAULT 0",
             ):
                 try:
                     await conn.execute(sqlalchemy.text(col_sql))
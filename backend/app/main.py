@@ -11,17 +11,23 @@ from fastapi import FastAPI
 from fastapi import HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import novel, character, chapter, scene, lore, settings, relationship
+from app.api import novel, character, chapter, scene, lore, settings, relationship, metrics
 from app.errors import (
     http_exception_handler,
     unhandled_exception_handler,
     validation_exception_handler,
 )
-from app.logging import reset_request_id, set_request_id, setup_logging
+from app.logging import get_logger, reset_request_id, set_request_id, setup_logging
 from app.models import Lore, SystemConfig, SceneVersion  # 导入模型以创建数据库表
 from app.database import init_db
+from app.config import settings as app_settings
+from app.services.generator import llm_client
+from app.services.http_pool import http_session_pool
+from app.services.llm_ledger import llm_ledger
+from app.rag import async_rag
 
 setup_logging()
+logger = get_logger(__name__)
 
 app = FastAPI(
     title="StoryWeaver API",
@@ -54,6 +60,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Offset"],
 )
 
 # 注册路由
@@ -64,6 +71,7 @@ app.include_router(scene.router, prefix="/api/scenes", tags=["Scene"])
 app.include_router(lore.router, prefix="/api/lore", tags=["Lore"])
 app.include_router(settings.router, prefix="/api/settings", tags=["Settings"])
 app.include_router(relationship.router, prefix="/api/relationships", tags=["Relationship"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Metrics"])
 
 
 @app.get("/")
@@ -80,3 +88,20 @@ async def health():
 async def startup_event():
     """应用启动时初始化数据库"""
     await init_db()
+    if app_settings.llm_http_warmup:
+        await http_session_pool.warmup([llm_client.base_url])
+    llm_ledger.start(app_settings.llm_ledger_flush_interval)
+    if app_settings.embedding_preload:
+        try:
+            await async_rag.preload_embedder()
+        except Exception:
+            # 模型缺失/加载失败不阻止启动，首次检索时会再次尝试并报错
+            logger.exception("Embedding model preload failed")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """写出剩余的 LLM 调用账本，关闭进程级 LLM HTTP 连接池与 RAG 线程池"""
+    await llm_ledger.stop()
+    await http_session_pool.close()
+    async_rag.shutdown()
@@ -7,5 +7,6 @@ from app.models.scene_version import SceneVersion
 from app.models.lore import Lore
 from app.models.system import SystemConfig
 from app.models.relationship import Relationship
+from app.models.llm_call import LLMCallRecord
 
-__all__ = ["Novel", "Character", "Chapter", "Scene", "SceneVersion", "Lore", "SystemConfig", "Relationship"]
+__all__ = ["Novel", "Character", "Chapter", "Scene", "SceneVersion", "Lore", "SystemConfig", "Relationship", "LLMCallRecord"]
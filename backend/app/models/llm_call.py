@@ -0,0 +1,29 @@
+"""LLM 调用账本表 - 用于离线分析各调用点的 token、延迟与成本"""
+import uuid
+from sqlalchemy import Column, String, Text, Integer, Float, Boolean, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class LLMCallRecord(Base):
+    """每次上游 LLM 调用一行（仅在 LLM_LEDGER_PERSIST 开启时写入）"""
+    __tablename__ = "llm_call_ledger"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    call_site = Column(String(64), nullable=False, index=True)
+    model = Column(String(128), nullable=False)
+    stream = Column(Boolean, nullable=False, default=False)
+    status = Column(String(16), nullable=False)
+    error = Column(Text, nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)  # 命中服务商前缀缓存的 prompt token
+    usage_reported = Column(Boolean, nullable=False, default=False)
+    cost = Column(Float, nullable=False, default=0.0)
+    queue_wait = Column(Float, nullable=False, default=0.0)
+    ttft = Column(Float, nullable=True)
+    latency = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<LLMCallRecord {self.call_site} {self.model} {self.latency:.2f}s>"
@@ -1,4 +1,5 @@
 """RAG package"""
 from app.rag.service import RAGService, rag_service
+from app.rag.async_service import AsyncRAGService, RAGTimeoutError, async_rag
 
-__all__ = ["RAGService", "rag_service"]
+__all__ = ["RAGService", "rag_service", "AsyncRAGService", "RAGTimeoutError", "async_rag"]
@@ -0,0 +1,115 @@
+"""Async facade over :class:`RAGService`.
+
+Chroma calls are synchronous and run embedding inference inline, so calling
+them from a handler or an SSE generator blocks the whole event loop.  The
+facade runs them on a small dedicated thread pool (ONNX inference releases
+the GIL) and bounds how long a caller waits.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.config import settings
+from app.logging import get_logger
+from app.rag.service import RAGService, rag_service
+
+logger = get_logger(__name__)
+
+
+class RAGTimeoutError(TimeoutError):
+    """A RAG call did not finish within its timeout."""
+
+
+class AsyncRAGService:
+    """Run ``RAGService`` methods on a bounded thread pool with per-call timeouts.
+
+    A timeout only stops the caller from waiting: the worker thread cannot be
+    interrupted and finishes the Chroma call in the background.  Calls queued
+    behind a full pool count against the same timeout.  Writes therefore get
+    their own, much larger ``write_timeout`` (0 = wait indefinitely): giving up
+    on a write that is still running would misreport what was indexed.
+    """
+
+    def __init__(
+        self, service: RAGService, max_workers: int = 2, timeout: float = 10.0, write_timeout: float = 0.0
+    ):
+        self.service = service
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rag")
+        return self._executor
+
+    async def _run(self, method: str, *args, timeout: Optional[float] = None, write: bool = False, **kwargs) -> Any:
+        # 在调用时取方法，便于测试 patch 底层 RAGService
+        fn = functools.partial(getattr(self.service, method), *args, **kwargs)
+        if timeout is None:
+            timeout = self.write_timeout if write else self.timeout
+        limit = timeout
+        started = time.monotonic()
+        future = asyncio.get_running_loop().run_in_executor(self._pool(), fn)
+        try:
+            if limit and limit > 0:
+                return await asyncio.wait_for(future, limit)
+            return await future
+        except asyncio.TimeoutError:
+            logger.warning("RAG %s timed out after %.2fs", method, time.monotonic() - started)
+            raise RAGTimeoutError(f"RAG {method} timed out after {limit}s") from None
+
+    async def add_knowledge(
+        self, text: str, doc_id: str, type: str, metadata: Optional[Dict[str, Any]] = None, **kwargs
+    ) -> None:
+        await self._run("add_knowledge", text=text, doc_id=doc_id, type=type, metadata=metadata, write=True, **kwargs)
+
+    async def add_knowledge_many(self, texts: Sequence[str], doc_ids: Sequence[str], type: str, **kwargs) -> int:
+        return await self._run("add_knowledge_many", texts=texts, doc_ids=doc_ids, type=type, write=True, **kwargs)
+
+    async def retrieve_context(self, query: str, type: str, **kwargs) -> List[Dict[str, Any]]:
+        return await self._run("retrieve_context", query=query, type=type, **kwargs)
+
+    async def retrieve_context_many(self, queries: Sequence[str], type: str, **kwargs) -> List[List[Dict[str, Any]]]:
+        return await self._run("retrieve_context_many", queries, type=type, **kwargs)
+
+    async def retrieve_hybrid_many(self, queries: Sequence[str], type: str, **kwargs) -> List[Dict[str, Any]]:
+        return await self._run("retrieve_hybrid_many", queries, type=type, **kwargs)
+
+    async def retrieve_all_by_novel(self, novel_id: str, type: str, **kwargs) -> List[Dict[str, Any]]:
+        return await self._run("retrieve_all_by_novel", novel_id, type, **kwargs)
+
+    async def list_by_novel(self, novel_id: str, type: str, **kwargs) -> Dict[str, Any]:
+        return await self._run("list_by_novel", novel_id, type, **kwargs)
+
+    async def get_by_ids(self, doc_ids: Sequence[str], type: str, **kwargs) -> List[Dict[str, Any]]:
+        return await self._run("get_by_ids", doc_ids, type, **kwargs)
+
+    async def delete_knowledge(self, doc_id: str, type: str, **kwargs) -> None:
+        await self._run("delete_knowledge", doc_id, type, write=True, **kwargs)
+
+    async def delete_knowledge_many(self, doc_ids: Sequence[str], type: str, **kwargs) -> None:
+        await self._run("delete_knowledge_many", doc_ids, type, write=True, **kwargs)
+
+    async def preload_embedder(self) -> None:
+        # 模型加载可能远超单次调用超时，不设超时
+        await self._run("preload_embedder", timeout=0)
+
+    merge_results = staticmethod(RAGService.merge_results)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            # 不等待进行中的 Chroma 调用，避免关停被慢查询卡住
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+async_rag = AsyncRAGService(
+    rag_service,
+    max_workers=settings.rag_max_workers,
+    timeout=settings.rag_timeout_seconds,
+    write_timeout=settings.rag_write_timeout_seconds,
+)
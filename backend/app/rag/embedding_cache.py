@@ -0,0 +1,198 @@
+"""Content-addressed embedding cache (memory LRU + SQLite tier) in front of the embedder."""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.config import settings
+from app.logging import get_logger
+
+logger = get_logger(__name__)
+
+Vector = List[float]
+
+
+class EmbeddingCache:
+    """Two-tier cache of text embeddings keyed by ``(model, sha256(text))``.
+
+    Vectors are stored as float32 blobs (Chroma stores float32 anyway).  The
+    memory tier is a bounded LRU; the optional SQLite tier survives restarts
+    and is bounded by entry count.  Embeddings are deterministic, so there is
+    no TTL.
+    """
+
+    _EVICT_EVERY = 500
+
+    def __init__(self, path: Optional[str] = None, memory_items: int = 4096, max_entries: int = 100_000):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, Vector]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self.reset_stats()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def reset_stats(self) -> None:
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "writes": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / total, 4) if total else 0.0,
+            "memory_size": len(self._memory),
+        }
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_embedding_cache_accessed ON embedding_cache (accessed_at)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, vector: Vector) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[Vector]]:
+        keys = [self.make_key(model, text) for text in texts]
+        found: List[Optional[Vector]] = [None] * len(keys)
+        with self._lock:
+            missing = []
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                    self._stats["memory_hits"] += 1
+                else:
+                    missing.append(i)
+
+            if missing:
+                try:
+                    conn = self._db()
+                    if conn is not None:
+                        wanted = list({keys[i] for i in missing})
+                        rows: Dict[str, bytes] = {}
+                        # SQLite 参数个数有上限，分批查询
+                        for start in range(0, len(wanted), 500):
+                            chunk = wanted[start:start + 500]
+                            placeholders = ",".join("?" * len(chunk))
+                            rows.update(conn.execute(
+                                f"SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})", chunk
+                            ).fetchall())
+                        if rows:
+                            conn.executemany(
+                                "UPDATE embedding_cache SET accessed_at = ? WHERE key = ?",
+                                [(time.time(), key) for key in rows],
+                            )
+                            conn.commit()
+                        for i in missing:
+                            blob = rows.get(keys[i])
+                            if blob is not None:
+                                found[i] = np.frombuffer(blob, dtype=np.float32).tolist()
+                                self._remember(keys[i], found[i])
+                                self._stats["disk_hits"] += 1
+                except sqlite3.Error:
+                    logger.exception("Embedding cache read failed")
+
+            hits = sum(v is not None for v in found)
+            self._stats["hits"] += hits
+            self._stats["misses"] += len(found) - hits
+        return found
+
+    def set_many(self, model: str, texts: Sequence[str], vectors: Sequence[Vector]) -> None:
+        if not texts:
+            return
+        now = time.time()
+        keys = [self.make_key(model, text) for text in texts]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, list(vector))
+            self._stats["writes"] += len(keys)
+            try:
+                conn = self._db()
+                if conn is None:
+                    return
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (key, vector, accessed_at) VALUES (?, ?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in zip(keys, vectors)],
+                )
+                conn.commit()
+                self._writes_since_evict += len(keys)
+                if self._writes_since_evict >= self._EVICT_EVERY:
+                    self._evict(conn)
+            except sqlite3.Error:
+                logger.exception("Embedding cache write failed")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        self._writes_since_evict = 0
+        conn.execute(
+            "DELETE FROM embedding_cache WHERE key IN ("
+            " SELECT key FROM embedding_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            conn = self._db()
+            if conn is not None:
+                conn.execute("DELETE FROM embedding_cache")
+                conn.commit()
+
+
+class CachedEmbeddingFunction:
+    """Chroma ``EmbeddingFunction`` that only sends cache misses to the wrapped embedder.
+
+    Duplicate texts within one call are embedded once.
+    """
+
+    def __init__(self, inner: Any, model: str, cache: EmbeddingCache):
+        self.inner = inner
+        self.model = model
+        self.cache = cache
+
+    def __call__(self, input: Sequence[str]) -> List[Vector]:
+        texts = list(input)
+        vectors = self.cache.get_many(self.model, texts)
+        misses = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if misses:
+            computed = [list(map(float, v)) for v in self.inner(misses)]
+            self.cache.set_many(self.model, misses, computed)
+            by_text = dict(zip(misses, computed))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+
+embedding_cache = EmbeddingCache(
+    path=settings.embedding_cache_path or None,
+    memory_items=settings.embedding_cache_memory_items,
+    max_entries=settings.embedding_cache_max_entries,
+)
@@ -0,0 +1,208 @@
+"""Pluggable local embedders for the RAG collections.
+
+``settings.embedding_backend`` picks the implementation:
+
+- ``default``: Chroma's bundled all-MiniLM-L6-v2 (downloads on first use).
+- ``onnx``: any sentence-embedding model exported to ONNX on local disk
+  (``model.onnx`` or ``model_quantized.onnx`` + ``tokenizer.json``), run with
+  onnxruntime on CPU.  No network access and no torch needed.
+- ``sentence_transformers``: optional dependency, loaded from a local path.
+
+All embedders follow Chroma's ``EmbeddingFunction`` protocol, load lazily
+(or eagerly via :meth:`preload`) and are safe to call from the RAG thread pool.
+"""
+import os
+import threading
+from typing import List, Optional, Sequence
+
+from app.config import settings
+from app.logging import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# 按优先级查找的 ONNX 文件名（quantized=True 时量化版本优先）
+_ONNX_FILES = ("model.onnx", "onnx/model.onnx")
+_QUANTIZED_ONNX_FILES = ("model_quantized.onnx", "onnx/model_quantized.onnx", "model_int8.onnx", "onnx/model_int8.onnx")
+
+
+def resolve_model_path(model: str, model_dir: str) -> str:
+    """``model`` may be a directory, or a name looked up under ``model_dir`` ("org/name" or "org--name")."""
+    if os.path.isdir(model):
+        return model
+    for candidate in (os.path.join(model_dir, model), os.path.join(model_dir, model.replace("/", "--"))):
+        if os.path.isdir(candidate):
+            return candidate
+    raise FileNotFoundError(
+        f"Embedding model '{model}' not found on disk (looked in '{model_dir}'); "
+        "copy the exported model directory there or set EMBEDDING_MODEL to its path"
+    )
+
+
+class Embedder:
+    """Base class: batched ``__call__`` plus thread-safe lazy loading."""
+
+    # 写入集合元数据并作为集合名后缀，换模型后不会与旧向量（维度不同）混用
+    name = "default"
+
+    def __init__(self, batch_size: int = 32):
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def preload(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self) -> None:
+        raise NotImplementedError
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def __call__(self, input: Sequence[str]) -> List[List[float]]:
+        self.preload()
+        texts = list(input)
+        embeddings: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self._embed(texts[start:start + self.batch_size]))
+        return embeddings
+
+
+class OnnxEmbedder(Embedder):
+    """Transformer encoder exported to ONNX, pooled to one normalized vector per text.
+
+    ``pooling`` is ``"mean"`` (sentence-transformers MiniLM/text2vec) or
+    ``"cls"`` (BGE family).
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        batch_size: int = 32,
+        threads: int = 0,
+        quantized: bool = False,
+        max_length: int = 512,
+        pooling: str = "mean",
+    ):
+        super().__init__(batch_size)
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Unknown pooling: {pooling}")
+        self.model_path = model_path
+        self.threads = threads
+        self.quantized = quantized
+        self.max_length = max_length
+        self.pooling = pooling
+        self.name = os.path.basename(os.path.normpath(model_path)) + ("-q" if quantized else "")
+        self._tokenizer = None
+        self._session = None
+        self._input_names: List[str] = []
+
+    def _model_file(self) -> str:
+        names = (_QUANTIZED_ONNX_FILES + _ONNX_FILES) if self.quantized else _ONNX_FILES
+        for name in names:
+            path = os.path.join(self.model_path, name)
+            if os.path.isfile(path):
+                return path
+        raise FileNotFoundError(f"No ONNX model file in {self.model_path} (tried {', '.join(names)})")
+
+    def _load(self) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_file = self._model_file()
+        tokenizer = Tokenizer.from_file(os.path.join(self.model_path, "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=self.max_length)
+        if tokenizer.padding is None:
+            # 导出的 tokenizer.json 通常自带 padding 配置（pad_id 因模型而异），没有时才按 BERT 默认补齐
+            tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        if self.threads > 0:
+            # 限制单次推理的线程数，避免与 RAG 线程池、事件循环抢占全部 CPU
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        session = ort.InferenceSession(model_file, sess_options=options, providers=["CPUExecutionProvider"])
+
+        self._tokenizer = tokenizer
+        self._session = session
+        self._input_names = [i.name for i in session.get_inputs()]
+        logger.info("Loaded ONNX embedder %s (threads=%s)", model_file, self.threads or "auto")
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encoded], dtype=np.int64)
+        hidden = self._session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return (pooled / norms).astype(float).tolist()
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """sentence-transformers model from a local path (optional dependency, pulls in torch)."""
+
+    def __init__(self, model_path: str, batch_size: int = 32, threads: int = 0):
+        super().__init__(batch_size)
+        self.model_path = model_path
+        self.threads = threads
+        self.name = os.path.basename(os.path.normpath(model_path))
+        self._model = None
+
+    def _load(self) -> None:
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as exc:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=sentence_transformers requires `pip install sentence-transformers`"
+            ) from exc
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        self._model = SentenceTransformer(self.model_path, device="cpu")
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = self._model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True)
+        return vectors.tolist()
+
+
+def build_embedder() -> Optional[Embedder]:
+    """Embedder for the configured backend; ``None`` means Chroma's built-in default."""
+    backend = settings.embedding_backend
+    if backend == "default":
+        if settings.embedding_model != DEFAULT_MODEL:
+            logger.warning(
+                "EMBEDDING_MODEL=%s ignored with EMBEDDING_BACKEND=default; use 'onnx' or 'sentence_transformers'",
+                settings.embedding_model,
+            )
+        return None
+    path = resolve_model_path(settings.embedding_model, settings.embedding_model_dir)
+    if backend == "onnx":
+        return OnnxEmbedder(
+            path,
+            batch_size=settings.embedding_batch_size,
+            threads=settings.embedding_threads,
+            quantized=settings.embedding_quantized,
+            max_length=settings.embedding_max_length,
+            pooling=settings.embedding_pooling,
+        )
+    if backend == "sentence_transformers":
+        return SentenceTransformerEmbedder(
+            path, batch_size=settings.embedding_batch_size, threads=settings.embedding_threads
+        )
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
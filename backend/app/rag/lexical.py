@@ -0,0 +1,117 @@
+"""In-process BM25 index over character n-grams, and reciprocal rank fusion.
+
+Vector search is weak on proper nouns (sect, artifact and realm names);
+a lexical index over CJK character bigrams catches exact-name hits without
+any external tokenizer.  One index is kept per Chroma collection and is
+rebuilt lazily from the collection's stored documents after a restart.
+"""
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_CJK_RUN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """CJK 连续片段切成字二元组（单字片段保留单字），拉丁字母/数字按词切分"""
+    text = (text or "").lower()
+    tokens: List[str] = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD.findall(text))
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index; ``search`` filters on metadata equality."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._docs: Dict[str, Tuple[str, Dict[str, Any], int]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _remove(self, doc_id: str) -> None:
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+        self._total_length -= entry[2]
+        for term in set(tokenize(entry[0])):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def add(self, doc_ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]]) -> None:
+        with self._lock:
+            for doc_id, text, meta in zip(doc_ids, texts, metadatas):
+                self._remove(doc_id)
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self._docs[doc_id] = (text, dict(meta or {}), length)
+                self._total_length += length
+                for term, tf in counts.items():
+                    self._postings[term][doc_id] = tf
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._total_length = 0
+
+    def search(self, query: str, top_k: int, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """返回 [{"id", "text", "metadata", "score"}]，按 BM25 分数降序"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avgdl = self._total_length / n or 1.0
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self._docs[doc_id][2]
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avgdl))
+            ranked = []
+            for doc_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                text, meta, _ = self._docs[doc_id]
+                if where and any(meta.get(k) != v for k, v in where.items()):
+                    continue
+                ranked.append({"id": doc_id, "text": text, "metadata": meta, "score": score})
+                if len(ranked) >= top_k:
+                    break
+            return ranked
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Dict[str, Any]]], top_k: int, k: int = 60) -> List[Dict[str, Any]]:
+    """RRF：每个文档得分为 Σ 1/(k + 名次)，在各路排名中越靠前、出现越多越高；字段优先取带向量距离的那条"""
+    fused: Dict[str, float] = defaultdict(float)
+    items: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item["id"]] += 1.0 / (k + rank)
+            if item["id"] not in items or items[item["id"]].get("distance") is None:
+                items[item["id"]] = item
+    ordered = sorted(fused, key=lambda doc_id: fused[doc_id], reverse=True)[:top_k]
+    return [{"distance": None, **items[doc_id], "score": round(fused[doc_id], 6)} for doc_id in ordered]
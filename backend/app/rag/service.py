@@ -1,41 +1,166 @@
 """RAG Service - 向量检索服务"""
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from chromadb.utils import embedding_functions
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Sequence
+import hashlib
 import os
+import re
+import threading
 from app.config import settings
+from app.rag.embedding_cache import CachedEmbeddingFunction, EmbeddingCache, embedding_cache as default_embedding_cache
+from app.rag.embeddings import Embedder, build_embedder
+from app.rag.lexical import BM25Index, reciprocal_rank_fusion
+
+# 知识类型 -> (集合基础名, 描述)
+_COLLECTIONS = {
+    "character": ("characters", "角色信息"),
+    "characters": ("characters", "角色信息"),
+    "lore": ("lore", "世界观设定"),
+    "summary": ("scene_summaries", "场景摘要"),
+    "scene_summary": ("scene_summaries", "场景摘要"),
+}
 
 
 class RAGService:
     """RAG 服务类 - 管理向量数据库"""
 
-    def __init__(self, persist_directory: Optional[str] = None):
-        """初始化 ChromaDB 客户端；persist_directory 为空时使用配置中的目录（测试可传入临时目录）。"""
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        embedder: Optional[Embedder] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        partition_mode: Optional[str] = None,
+        partition_pool_size: Optional[int] = None,
+    ):
+        """初始化 ChromaDB 客户端；persist_directory 为空时使用配置中的目录（测试可传入临时目录）。
+
+        embedder 为空时按配置（EMBEDDING_BACKEND / EMBEDDING_MODEL）构建，配置为 default 则用 Chroma 内置模型；
+        embedding_cache 为空时按配置使用进程级嵌入缓存。
+        partition_mode 为 "novel" 时每部小说使用独立集合（按需创建，句柄放在有界 LRU 池中），
+        为 "global" 时所有小说共用全局集合并按 novel_id 过滤。
+        """
+        self.partition_mode = partition_mode or settings.rag_partition_mode
+        if self.partition_mode not in ("global", "novel"):
+            raise ValueError(f"Unknown RAG partition mode: {self.partition_mode}")
+        self.partition_pool_size = max(1, partition_pool_size or settings.rag_partition_pool_size)
+        self._partitions: "OrderedDict[str, Any]" = OrderedDict()
+        self._partitions_lock = threading.Lock()
         persist_dir = persist_directory or settings.chromadb_persist_directory
         os.makedirs(persist_dir, exist_ok=True)
 
         self.client = chromadb.PersistentClient(path=persist_dir)
+        self.embedder = embedder if embedder is not None else build_embedder()
+        self._raw_embedding_function = self.embedder or embedding_functions.DefaultEmbeddingFunction()
+        if embedding_cache is None and settings.embedding_cache_enabled:
+            embedding_cache = default_embedding_cache
+        self.embedding_function = self._raw_embedding_function
+        # 每个集合一份内存 BM25 索引（按集合名），首次检索时从 Chroma 已存文档构建
+        self._lexical: Dict[str, BM25Index] = {}
+        self._lexical_lock = threading.Lock()
+        if embedding_cache is not None:
+            self.embedding_function = CachedEmbeddingFunction(
+                self._raw_embedding_function, self.embedder_name, embedding_cache
+            )
         self._init_collections()
 
+    @property
+    def embedder_name(self) -> str:
+        return self.embedder.name if self.embedder else "default"
+
+    def _collection_name(self, base: str) -> str:
+        # 非默认模型的向量维度/语义空间不同，使用独立集合；切换模型后用 backfill_rag.py 重建
+        if self.embedder is None:
+            return base
+        suffix = re.sub(r"[^a-zA-Z0-9_-]+", "-", self.embedder.name).strip("-_")
+        return f"{base}__{suffix}"[:63].rstrip("-_")
+
+    def _get_or_create(self, base: str, description: str):
+        return self.client.get_or_create_collection(
+            name=self._collection_name(base),
+            metadata={"description": description, "embedder": self.embedder_name},
+            embedding_function=self.embedding_function,
+        )
+
+    @property
+    def partitioned(self) -> bool:
+        return self.partition_mode == "novel"
+
+    def _partition_name(self, base: str, novel_id: str) -> str:
+        # novel_id 可能是任意字符串，取哈希保证集合名合法且不超过 63 字符
+        digest = hashlib.sha1(novel_id.encode("utf-8")).hexdigest()[:16]
+        return f"{self._collection_name(base)[:44]}__n{digest}"
+
+    def _collection(self, type: str, novel_id: Optional[str] = None, create: bool = False):
+        """按类型（与分区模式下的小说）取集合；分区不存在且 create=False 时返回 None"""
+        if not (self.partitioned and novel_id):
+            return self._get_collection(type)
+        if type not in _COLLECTIONS:
+            raise ValueError(f"Unknown type: {type}. Available: {list(_COLLECTIONS.keys())}")
+        base, description = _COLLECTIONS[type]
+        name = self._partition_name(base, novel_id)
+        with self._partitions_lock:
+            collection = self._partitions.get(name)
+            if collection is not None:
+                self._partitions.move_to_end(name)
+                return collection
+            if create:
+                collection = self.client.get_or_create_collection(
+                    name=name,
+                    metadata={
+                        "description": description,
+                        "embedder": self.embedder_name,
+                        "base": base,
+                        "novel_id": novel_id,
+                        # 分区很小，提高搜索宽度几乎不增加耗时，但能把召回率拉回到全局过滤的水平
+                        "hnsw:search_ef": settings.rag_partition_search_ef,
+                    },
+                    embedding_function=self.embedding_function,
+                )
+            else:
+                try:
+                    collection = self.client.get_collection(name=name, embedding_function=self.embedding_function)
+                except ValueError:
+                    return None
+            self._partitions[name] = collection
+            while len(self._partitions) > self.partition_pool_size:
+                evicted, _ = self._partitions.popitem(last=False)
+                # BM25 索引随句柄一起淘汰，下次访问时重建
+                self._lexical.pop(evicted, None)
+            return collection
+
+    def _where(self, novel_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        # 分区集合只含该小说的文档，不再需要元数据过滤
+        if novel_id and not self.partitioned:
+            return {"novel_id": novel_id}
+        return None
+
+    def _partitions_of(self, type: str) -> List[Any]:
+        """该类型下所有已存在的小说分区（当前嵌入模型）"""
+        base = _COLLECTIONS[type][0]
+        return [
+            c for c in self.client.list_collections()
+            if (c.metadata or {}).get("base") == base and (c.metadata or {}).get("embedder") == self.embedder_name
+        ]
+
     def _init_collections(self):
         """初始化集合"""
         # 角色集合
-        self.characters_collection = self.client.get_or_create_collection(
-            name="characters",
-            metadata={"description": "角色信息"}
-        )
+        self.characters_collection = self._get_or_create("characters", "角色信息")
 
         # 世界观集合
-        self.lore_collection = self.client.get_or_create_collection(
-            name="lore",
-            metadata={"description": "世界观设定"}
-        )
+        self.lore_collection = self._get_or_create("lore", "世界观设定")
 
         # 场景摘要集合
-        self.summaries_collection = self.client.get_or_create_collection(
-            name="scene_summaries",
-            metadata={"description": "场景摘要"}
-        )
+        self.summaries_collection = self._get_or_create("scene_summaries", "场景摘要")
+
+    def preload_embedder(self) -> None:
+        """启动时加载嵌入模型，避免首个请求承担加载耗时"""
+        if self.embedder is not None:
+            self.embedder.preload()
+        else:
+            self._raw_embedding_function(["预热"])
 
     def add_knowledge(
         self,
@@ -43,9 +168,9 @@ class RAGService:
         doc_id: str,
         type: str,
         metadata: Optional[Dict[str, Any]] = None
-    ):
+    ) -> int:
         """
-        添加知识到向量数据库
+        添加知识到向量数据库；文本与元数据都未变化时跳过写入，返回实际写入条数
 
         Args:
             text: 要向量化的文本
@@ -53,16 +178,70 @@ class RAGService:
             type: 类型 (character/lore/summary)
             metadata: 附加元数据
         """
-        collection = self._get_collection(type)
+        return self.add_knowledge_many([text], [doc_id], type, [metadata])
 
-        meta = metadata or {}
-        meta["type"] = type
+    def add_knowledge_many(
+        self,
+        texts: Sequence[str],
+        doc_ids: Sequence[str],
+        type: str,
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+        batch_size: int = 256,
+    ) -> int:
+        """
+        批量添加知识：每批一次 upsert（一次嵌入计算），未变化的文档跳过，返回实际写入条数
 
-        collection.upsert(
-            documents=[text],
-            ids=[doc_id],
-            metadatas=[meta]
-        )
+        Args:
+            texts: 文本列表
+            doc_ids: 与 texts 一一对应的文档 ID
+            type: 类型 (character/lore/summary)
+            metadatas: 可选，与 texts 一一对应的元数据
+            batch_size: 每批条数（Chroma 对单次 upsert 有上限）
+        """
+        if len(texts) != len(doc_ids) or (metadatas is not None and len(metadatas) != len(texts)):
+            raise ValueError("texts, doc_ids and metadatas must have the same length")
+
+        metas = []
+        for i in range(len(texts)):
+            meta = dict((metadatas[i] if metadatas is not None else None) or {})
+            meta["type"] = type
+            metas.append(meta)
+
+        # 分区模式下按 metadata 中的 novel_id 分组写入各自的集合
+        groups: Dict[Optional[str], List[int]] = {}
+        for i, meta in enumerate(metas):
+            groups.setdefault(meta.get("novel_id") if self.partitioned else None, []).append(i)
+
+        written = 0
+        for novel_id, indices in groups.items():
+            collection = self._collection(type, novel_id, create=True)
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start + batch_size]
+                changed = self._changed(
+                    collection, [doc_ids[i] for i in chunk], [texts[i] for i in chunk], [metas[i] for i in chunk]
+                )
+                if not changed:
+                    continue
+                batch_ids = [doc_ids[chunk[i]] for i in changed]
+                batch_texts = [texts[chunk[i]] for i in changed]
+                batch_metas = [metas[chunk[i]] for i in changed]
+                collection.upsert(documents=batch_texts, ids=batch_ids, metadatas=batch_metas)
+                self._sync_lexical(collection, batch_ids, batch_texts, batch_metas)
+                written += len(changed)
+        return written
+
+    @staticmethod
+    def _changed(collection, doc_ids: Sequence[str], texts: Sequence[str], metas: Sequence[Dict[str, Any]]) -> List[int]:
+        """返回需要写入的下标：新文档，或文本/元数据与库中不同的文档（get 不计算向量，远比重新嵌入便宜）"""
+        existing = collection.get(ids=list(doc_ids), include=["documents", "metadatas"])
+        stored = {
+            doc_id: (existing["documents"][i], (existing.get("metadatas") or [None] * len(existing["ids"]))[i])
+            for i, doc_id in enumerate(existing.get("ids") or [])
+        }
+        return [
+            i for i, doc_id in enumerate(doc_ids)
+            if stored.get(doc_id) != (texts[i], metas[i])
+        ]
 
     def retrieve_context(
         self,
@@ -83,15 +262,109 @@ class RAGService:
         Returns:
             检索结果列表
         """
-        collection = self._get_collection(type)
+        return self.retrieve_context_many([query], type, top_k=top_k, novel_id=novel_id)[0]
 
-        kwargs = {"query_texts": [query], "n_results": top_k}
-        if novel_id:
-            kwargs["where"] = {"novel_id": novel_id}
+    def retrieve_context_many(
+        self,
+        queries: Sequence[str],
+        type: str,
+        top_k: int = 3,
+        novel_id: Optional[str] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量检索：多条查询文本一次 query 调用（一次嵌入计算），按查询顺序返回各自的结果
+
+        Args:
+            queries: 查询文本列表
+            type: 要检索的类型 (character/lore/summary)
+            top_k: 每条查询返回结果数量
+            novel_id: 可选，小说 ID，检索时按此过滤 metadata
+        """
+        if not queries:
+            return []
+        collection = self._collection(type, novel_id)
+        if collection is None:
+            return [[] for _ in queries]
+
+        kwargs = {"query_texts": list(queries), "n_results": top_k}
+        where = self._where(novel_id)
+        if where:
+            kwargs["where"] = where
 
         results = collection.query(**kwargs)
 
-        return self._format_results(results)
+        return [self._format_results(results, i) for i in range(len(queries))]
+
+    @staticmethod
+    def merge_results(result_lists: Sequence[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+        """合并多条查询的结果：按 ID 去重保留最近距离，再按距离取前 top_k"""
+        best: Dict[str, Dict[str, Any]] = {}
+        for results in result_lists:
+            for item in results:
+                current = best.get(item["id"])
+                if current is None or (item.get("distance") or 0.0) < (current.get("distance") or 0.0):
+                    best[item["id"]] = item
+        return sorted(best.values(), key=lambda item: item.get("distance") or 0.0)[:top_k]
+
+    def _lexical_index(self, collection) -> BM25Index:
+        index = self._lexical.get(collection.name)
+        if index is not None:
+            return index
+        with self._lexical_lock:
+            index = self._lexical.get(collection.name)
+            if index is None:
+                # 只取文本与元数据，不计算向量
+                stored = collection.get(include=["documents", "metadatas"])
+                index = BM25Index()
+                index.add(stored.get("ids") or [], stored.get("documents") or [], stored.get("metadatas") or [])
+                self._lexical[collection.name] = index
+            return index
+
+    def _sync_lexical(self, collection, doc_ids=(), texts=(), metas=(), removed=()) -> None:
+        # 尚未构建的索引无需维护，首次检索时会从 Chroma 全量构建
+        index = self._lexical.get(collection.name)
+        if index is None:
+            return
+        if removed:
+            index.remove(removed)
+        if doc_ids:
+            index.add(doc_ids, texts, metas)
+
+    def retrieve_hybrid_many(
+        self,
+        queries: Sequence[str],
+        type: str,
+        top_k: int = 3,
+        novel_id: Optional[str] = None,
+        candidates: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        混合检索：多条查询各取向量与 BM25（字二元组）候选，一次 query 调用后用 RRF 融合
+
+        专有名词（宗门、法宝、境界名）靠字面命中，语义相近的描述靠向量命中。
+
+        Args:
+            queries: 查询文本列表
+            type: 要检索的类型 (character/lore/summary)
+            top_k: 融合后返回数量
+            novel_id: 可选，小说 ID，检索时按此过滤 metadata
+            candidates: 每路每条查询的候选数，默认 top_k 的两倍
+        """
+        queries = [q for q in queries if q and q.strip()]
+        if not queries:
+            return []
+        n = candidates or top_k * 2
+        collection = self._collection(type, novel_id)
+        if collection is None:
+            return []
+        where = self._where(novel_id)
+        rankings = []
+        if settings.rag_hybrid_enabled:
+            # 字面排名放在前面：RRF 同分时专有名词的精确命中优先
+            index = self._lexical_index(collection)
+            rankings += [index.search(q, n, where) for q in queries]
+        rankings += self.retrieve_context_many(queries, type, top_k=n, novel_id=novel_id)
+        return reciprocal_rank_fusion(rankings, top_k, k=settings.rag_rrf_k)
 
     def retrieve_all_by_novel(
         self,
@@ -110,26 +383,86 @@ class RAGService:
         Returns:
             检索结果
         """
-        collection = self._get_collection(type)
+        return self.list_by_novel(novel_id, type, limit=top_k)["items"]
+
+    @staticmethod
+    def _include(include_documents: bool) -> List[str]:
+        return ["documents", "metadatas"] if include_documents else ["metadatas"]
+
+    @staticmethod
+    def _format_got(results: Dict) -> List[Dict[str, Any]]:
+        """格式化 collection.get 的结果；未取正文时不带 text 字段"""
+        documents = results.get("documents")
+        metadatas = results.get("metadatas")
+        formatted = []
+        for i, doc_id in enumerate(results.get("ids") or []):
+            item = {"id": doc_id, "metadata": (metadatas[i] if metadatas else None) or {}}
+            if documents is not None:
+                item["text"] = documents[i]
+            formatted.append(item)
+        return formatted
+
+    def list_by_novel(
+        self,
+        novel_id: str,
+        type: str,
+        limit: Optional[int] = 50,
+        offset: int = 0,
+        include_documents: bool = True,
+    ) -> Dict[str, Any]:
+        """按小说分页列出文档，limit/offset 直接下推给 Chroma
 
+        Returns:
+            {"items": [...], "next_offset": 下一页起点，没有更多时为 None}
+        """
+        collection = self._collection(type, novel_id)
+        if collection is None:
+            return {"items": [], "next_offset": None}
+        # 多取一条用来判断是否还有下一页
         results = collection.get(
-            where={"novel_id": novel_id}
+            where=self._where(novel_id),
+            limit=limit + 1 if limit is not None else None,
+            offset=offset or None,
+            include=self._include(include_documents),
         )
+        items = self._format_got(results)
+        has_more = limit is not None and len(items) > limit
+        return {
+            "items": items[:limit] if has_more else items,
+            "next_offset": offset + limit if has_more else None,
+        }
 
-        # 简单返回所有匹配的文档
-        formatted = []
-        if results.get("documents"):
-            for i, doc in enumerate(results["documents"]):
-                formatted.append({
-                    "id": results["ids"][i],
-                    "text": doc,
-                    "metadata": results["metadatas"][i] if results.get("metadatas") else {}
-                })
+    def get_by_ids(
+        self,
+        doc_ids: Sequence[str],
+        type: str,
+        novel_id: Optional[str] = None,
+        include_documents: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """按 ID 直接取文档（不存在的 ID 忽略），结果按传入顺序排列
 
-        return formatted[:top_k]
+        传入 novel_id 时只返回属于该小说的文档；分区模式下不传 novel_id 会遍历该类型的所有分区。
+        """
+        if not doc_ids:
+            return []
+        # 全局集合（分区模式下为遗留文档）靠元数据过滤，小说分区本身已按小说隔离
+        scoped = [(self._get_collection(type), {"novel_id": novel_id} if novel_id else None)]
+        if self.partitioned:
+            if novel_id:
+                scoped.append((self._collection(type, novel_id), None))
+            else:
+                scoped.extend((partition, None) for partition in self._partitions_of(type))
+        found: Dict[str, Dict[str, Any]] = {}
+        for collection, where in scoped:
+            if collection is None:
+                continue
+            results = collection.get(ids=list(doc_ids), where=where, include=self._include(include_documents))
+            for item in self._format_got(results):
+                found.setdefault(item["id"], item)
+        return [found[doc_id] for doc_id in dict.fromkeys(doc_ids) if doc_id in found]
 
     def _get_collection(self, type: str):
-        """根据类型获取对应的集合"""
+        """根据类型获取对应的全局集合"""
         collections = {
             "character": self.characters_collection,
             "characters": self.characters_collection,
@@ -141,32 +474,102 @@ class RAGService:
             raise ValueError(f"Unknown type: {type}. Available: {list(collections.keys())}")
         return collections[type]
 
-    def _format_results(self, results: Dict) -> List[Dict[str, Any]]:
-        """格式化检索结果"""
+    def _format_results(self, results: Dict, query_index: int = 0) -> List[Dict[str, Any]]:
+        """格式化检索结果；query_index 为批量查询中第几条查询"""
         formatted = []
 
         if not results.get("documents"):
             return formatted
 
-        for i in range(len(results["documents"][0])):
+        q = query_index
+        for i in range(len(results["documents"][q])):
             formatted.append({
-                "id": results["ids"][0][i],
-                "text": results["documents"][0][i],
-                "distance": results["distances"][0][i] if "distances" in results else None,
-                "metadata": results["metadatas"][0][i] if results.get("metadatas") else {}
+                "id": results["ids"][q][i],
+                "text": results["documents"][q][i],
+                "distance": results["distances"][q][i] if results.get("distances") else None,
+                "metadata": results["metadatas"][q][i] if results.get("metadatas") else {}
             })
 
         return formatted
 
-    def delete_knowledge(self, doc_id: str, type: str):
+    def delete_knowledge(self, doc_id: str, type: str, novel_id: Optional[str] = None):
         """删除知识"""
-        collection = self._get_collection(type)
-        collection.delete(ids=[doc_id])
+        self.delete_knowledge_many([doc_id], type, novel_id=novel_id)
+
+    def delete_knowledge_many(self, doc_ids: Sequence[str], type: str, novel_id: Optional[str] = None):
+        """批量删除知识（不存在的 ID 忽略）
+
+        分区模式下传入 novel_id 只删该小说分区（及全局集合中的遗留文档），否则遍历该类型的所有分区。
+        """
+        if not doc_ids:
+            return
+        collections = [self._get_collection(type)]
+        if self.partitioned:
+            if novel_id:
+                collections.append(self._collection(type, novel_id))
+            else:
+                collections.extend(self._partitions_of(type))
+        for collection in collections:
+            if collection is None:
+                continue
+            collection.delete(ids=list(doc_ids))
+            self._sync_lexical(collection, removed=doc_ids)
 
     def clear_collection(self, type: str):
-        """清空集合"""
+        """清空集合（分区模式下包括所有小说分区）"""
         collection = self._get_collection(type)
         collection.delete(where={})
+        self._lexical.pop(collection.name, None)
+        if self.partitioned:
+            for partition in self._partitions_of(type):
+                self.client.delete_collection(partition.name)
+                self._lexical.pop(partition.name, None)
+            with self._partitions_lock:
+                self._partitions.clear()
+
+    def migrate_to_partitions(self, batch_size: int = 500, delete_source: bool = False) -> Dict[str, int]:
+        """把全局集合中的文档按 novel_id 搬到各小说分区（连同已有向量，不重新嵌入）
+
+        没有 novel_id 的文档留在全局集合。可重复执行；delete_source=True 时搬完删除源文档。
+        返回 {类型: 搬迁条数}。
+        """
+        if not self.partitioned:
+            raise ValueError("migrate_to_partitions requires partition_mode='novel'")
+        report: Dict[str, int] = {}
+        for type in ("character", "lore", "scene_summary"):
+            source = self._get_collection(type)
+            moved = 0
+            offset = 0
+            while True:
+                page = source.get(
+                    include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset
+                )
+                ids = page.get("ids") or []
+                if not ids:
+                    break
+                groups: Dict[str, List[int]] = {}
+                for i, meta in enumerate(page["metadatas"]):
+                    if (meta or {}).get("novel_id"):
+                        groups.setdefault(meta["novel_id"], []).append(i)
+                for novel_id, indices in groups.items():
+                    self._collection(type, novel_id, create=True).upsert(
+                        ids=[ids[i] for i in indices],
+                        documents=[page["documents"][i] for i in indices],
+                        metadatas=[page["metadatas"][i] for i in indices],
+                        embeddings=[page["embeddings"][i] for i in indices],
+                    )
+                    self._lexical.pop(self._partition_name(_COLLECTIONS[type][0], novel_id), None)
+                migrated = [ids[i] for indices in groups.values() for i in indices]
+                moved += len(migrated)
+                if delete_source and migrated:
+                    source.delete(ids=migrated)
+                    # 源文档被删除后后续页前移
+                    offset += len(ids) - len(migrated)
+                else:
+                    offset += len(ids)
+            self._lexical.pop(source.name, None)
+            report[type] = moved
+        return report
 
 
 # 全局单例
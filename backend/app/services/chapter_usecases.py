@@ -1,15 +1,16 @@
 """Chapter-oriented usecases to keep router thin."""
-import re
-
 from fastapi import HTTPException
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import Chapter, Scene
 from app.services import scene_generator
+from app.services.think_filter import strip_think
 
 
-async def summarize_chapter_content(chapter_id: str, db: AsyncSession) -> dict[str, str]:
+async def summarize_chapter_content(
+    chapter_id: str, db: AsyncSession, cache: bool = True
+) -> dict[str, str]:
     """Generate chapter summary from all scenes and persist it."""
     result = await db.execute(select(Chapter).where(Chapter.id == chapter_id))
     chapter = result.scalar_one_or_none()
@@ -47,9 +48,10 @@ async def summarize_chapter_content(chapter_id: str, db: AsyncSession) -> dict[s
 
 请输出摘要内容（不要包含思考过程）："""
 
+    # 所有场景拼进同一个 prompt，整章只有一次调用，没有可并发的多条请求
     try:
-        summary = await scene_generator.llm.generate(prompt)
-        summary = re.sub(r"<think>.*?</think>", "", summary, flags=re.DOTALL).strip()
+        summary = await scene_generator.llm.generate(prompt, cache=cache, call_site="chapter_summary")
+        summary = strip_think(summary, strip_bold=False).strip()
         chapter.summary = summary
         await db.commit()
         return {"id": chapter.id, "summary": summary}
@@ -0,0 +1,97 @@
+"""Token-budgeted packing of scene-writing context."""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.config import settings
+from app.services.tokens import estimate_tokens, truncate_to_tokens
+
+# 截断后剩余不足该 token 数的条目直接丢弃，避免塞进半句无意义的内容
+MIN_TRUNCATED_TOKENS = 24
+
+
+@dataclass
+class PackItem:
+    """One piece of context; ``compact`` is a shorter rendering tried before truncation."""
+
+    text: str
+    compact: Optional[str] = None
+    label: str = ""
+
+
+@dataclass
+class PackSection:
+    name: str
+    items: Sequence[PackItem]
+    required: bool = False  # 必选段落（如动作指令）不受预算裁剪，但会占用预算
+
+
+@dataclass
+class PackedContext:
+    budget: int
+    used_tokens: int = 0
+    sections: Dict[str, List[str]] = field(default_factory=dict)
+    cuts: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.cuts)
+
+    def report(self) -> Dict[str, Any]:
+        return {"budget": self.budget, "used_tokens": self.used_tokens, "cuts": self.cuts}
+
+
+def context_budget_for(model: Optional[str]) -> int:
+    """Token budget for the packed context of a writing prompt for ``model``."""
+    if model and model in settings.scene_context_token_budgets:
+        return settings.scene_context_token_budgets[model]
+    return settings.scene_context_token_budget
+
+
+class ContextPacker:
+    """Fill sections in priority order until the token budget is spent.
+
+    Sections are processed in the order given and items within a section in
+    their own preference order.  An item that does not fit is first replaced
+    by its ``compact`` form, then truncated to the remaining budget; once the
+    budget is exhausted every later item is dropped.  The result is therefore
+    fully determined by the inputs, and every compaction, truncation and drop
+    is listed in :attr:`PackedContext.cuts`.
+    """
+
+    def __init__(self, budget: int, min_truncated_tokens: int = MIN_TRUNCATED_TOKENS):
+        self.budget = budget
+        self.min_truncated_tokens = min_truncated_tokens
+
+    def pack(self, sections: Sequence[PackSection]) -> PackedContext:
+        result = PackedContext(budget=self.budget)
+        remaining = self.budget
+        for section in sections:
+            kept = result.sections.setdefault(section.name, [])
+            for index, item in enumerate(section.items):
+                tokens = estimate_tokens(item.text)
+                if section.required or tokens <= remaining:
+                    kept.append(item.text)
+                    remaining -= tokens
+                    continue
+
+                cut = {"section": section.name, "index": index, "label": item.label, "tokens": tokens}
+                compact_tokens = estimate_tokens(item.compact) if item.compact else None
+                if compact_tokens is not None and compact_tokens <= remaining:
+                    kept.append(item.compact)
+                    remaining -= compact_tokens
+                    result.cuts.append({**cut, "action": "compacted", "kept_tokens": compact_tokens})
+                    continue
+
+                if remaining >= self.min_truncated_tokens:
+                    text = truncate_to_tokens(item.compact or item.text, remaining)
+                    kept_tokens = estimate_tokens(text)
+                    kept.append(text)
+                    remaining -= kept_tokens
+                    result.cuts.append({**cut, "action": "truncated", "kept_tokens": kept_tokens})
+                    continue
+
+                result.cuts.append({**cut, "action": "dropped", "kept_tokens": 0})
+                # 预算已耗尽，后续条目按顺序全部丢弃，保证结果确定
+                remaining = 0
+        result.used_tokens = sum(estimate_tokens(text) for texts in result.sections.values() for text in texts)
+        return result
@@ -0,0 +1,371 @@
+"""Offline stand-in for an OpenAI-compatible LLM endpoint.
+
+Used for load and latency testing without network access: an aiohttp
+``/chat/completions`` server (see ``fake_llm_server.py``) and
+:class:`FakeLLMClient`, an in-process transport with the same interface as
+``OpenAICompatClient``.  Both simulate time-to-first-token, tokens per second
+and an error rate, and answer StoryWeaver's structured prompts (beats, state,
+relationships, storyboard, editorial critique and paragraph revision,
+outline) with payloads the
+real parsers accept.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from aiohttp import web
+
+from app.config import settings
+from app.services.generator import OpenAICompatClient
+from app.services.llm_ledger import LLMCallTrace
+from app.services.llm_retry import LLMAPIError, RetryPolicy
+from app.services.prompt_messages import Messages, Prompt, prompt_text, to_messages
+from app.services.tokens import estimate_tokens
+
+DEFAULT_CORPUS = [
+    "夜雨敲打着青石板，林远贴着墙根前行，指节因握剑过紧而发白。",
+    "远处钟声三响，藏经阁的禁制泛起一层淡金色的涟漪，又缓缓归于沉寂。",
+    "他屏住呼吸，听见自己的心跳与檐角滴水声渐渐重合。",
+    "秦霜从阴影里走出，目光冷得像冬日的湖面，却在看到他肩上的血迹时微微一颤。",
+    "“你不该来。”她低声说，声音里有责备，也有藏不住的担忧。",
+    "林远没有回答，只是将怀中那卷残破的剑谱递了过去。",
+    "风穿过回廊，吹灭了最后一盏灯笼，黑暗像潮水一样漫上台阶。",
+    "他想起师父临终前的话：剑心不在锋刃，而在收鞘的那一瞬。",
+    "脚步声由远及近，巡夜弟子的灯火在雨幕中摇晃成一片模糊的光晕。",
+    "两人对视一眼，同时闪身没入书架之间，衣袂带起一缕陈年的墨香。",
+]
+
+
+@dataclass
+class FakeLLMConfig:
+    ttft: float = 0.2  # 首 token 延迟（秒）
+    tokens_per_second: float = 50.0  # <=0 表示不限速
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: int = 0
+    chunk_tokens: int = 4
+    corpus: List[str] = field(default_factory=lambda: list(DEFAULT_CORPUS))
+
+    @classmethod
+    def from_settings(cls) -> "FakeLLMConfig":
+        config = cls(
+            ttft=settings.llm_fake_ttft,
+            tokens_per_second=settings.llm_fake_tokens_per_second,
+            error_rate=settings.llm_fake_error_rate,
+            seed=settings.llm_fake_seed,
+        )
+        if settings.llm_fake_corpus_path:
+            config.corpus = load_corpus(settings.llm_fake_corpus_path)
+        return config
+
+
+def load_corpus(path: str) -> List[str]:
+    """One paragraph per non-empty line."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return lines or list(DEFAULT_CORPUS)
+
+
+class FakeResponder:
+    """Deterministic responses: the same prompt and seed always give the same answer."""
+
+    def __init__(self, config: FakeLLMConfig):
+        self.config = config
+        self._errors = random.Random(config.seed)
+
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.config.seed}:{prompt}".encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def should_fail(self) -> bool:
+        return self.config.error_rate > 0 and self._errors.random() < self.config.error_rate
+
+    def prose(self, rng: random.Random, chars: int) -> str:
+        corpus = self.config.corpus
+        out: List[str] = []
+        size = 0
+        while size < chars:
+            sentence = corpus[rng.randrange(len(corpus))]
+            out.append(sentence)
+            size += len(sentence)
+            if rng.random() < 0.2:
+                out.append("\n\n")
+        return "".join(out).strip()
+
+    def respond(self, prompt: str) -> str:
+        rng = self._rng(prompt)
+        if "场景细纲" in prompt:
+            return self._beats(rng)
+        if "更新角色的状态" in prompt:
+            return self._state(prompt, rng)
+        if "人际关系分析师" in prompt:
+            return self._relationships(prompt, rng)
+        if "storyboard" in prompt:
+            return json.dumps([self.prose(rng, 40) for _ in range(3)], ensure_ascii=False)
+        if "只重写指定段落" in prompt:
+            return self._paragraph_revision(prompt, rng)
+        if "请给出你的评分" in prompt:
+            return self._critique(prompt, rng)
+        if "【章节概要】" in prompt:
+            return self._outline(prompt, rng)
+        if "摘要" in prompt:
+            return self.prose(rng, 200)
+        return self.prose(rng, 1000)
+
+    def _beats(self, rng: random.Random) -> str:
+        locations = ["青云门广场", "藏经阁", "后山竹林", "山门石阶", "炼丹房", "悬崖栈道"]
+        beats = []
+        for i in range(rng.randint(4, 6)):
+            beats.append({
+                "location": locations[i % len(locations)],
+                "characters_present": ["林远", "秦霜"][: rng.randint(1, 2)],
+                "beat_description": self.prose(rng, 40),
+                "tension_level": rng.randint(2, 10),
+                "emotional_target": "压抑中的期待",
+            })
+        return json.dumps(beats, ensure_ascii=False)
+
+    def _state(self, prompt: str, rng: random.Random) -> str:
+        state: Dict[str, Any] = {}
+        match = re.search(r"当前状态：(.*)", prompt)
+        if match:
+            try:
+                state = json.loads(match.group(1)) or {}
+            except json.JSONDecodeError:
+                state = {}
+        state.setdefault("realm", "练气一层")
+        state.setdefault("bottleneck", "灵力不稳")
+        state.setdefault("inventory", [])
+        state.setdefault("core_skills", [])
+        if rng.random() < 0.5:
+            state["inventory"] = list(state["inventory"]) + [{"item": "回气丹", "uses_left": rng.randint(1, 3)}]
+        return json.dumps(state, ensure_ascii=False)
+
+    def _relationships(self, prompt: str, rng: random.Random) -> str:
+        ids = re.findall(r"\(ID: ([^)]+)\)", prompt)
+        updates = []
+        for i in range(0, len(ids) - 1, 2):
+            updates.append({
+                "char_a_id": ids[i],
+                "char_b_id": ids[i + 1],
+                "affinity_change": rng.randint(-10, 10),
+                "new_conflict": self.prose(rng, 20),
+            })
+        return json.dumps(updates, ensure_ascii=False)
+
+    def _critique(self, prompt: str, rng: random.Random) -> str:
+        score = round(rng.uniform(6.0, 9.5), 1)
+        # 正文按 [n] 编号时，大多数意见只针对其中一两段
+        numbered = sorted({int(n) for n in re.findall(r"^\[(\d+)\]", prompt, re.M)})
+        paragraphs = sorted(rng.sample(numbered, min(len(numbered), rng.randint(0, 2)))) if numbered else []
+        return json.dumps({
+            "score": score,
+            "critique": self.prose(rng, 40),
+            "suggestion": self.prose(rng, 30),
+            "paragraphs": paragraphs,
+        }, ensure_ascii=False)
+
+    def _paragraph_revision(self, prompt: str, rng: random.Random) -> str:
+        match = re.search(r"需要重写的段落：(.*)", prompt)
+        targets = re.findall(r"\[(\d+)\]", match.group(1)) if match else []
+        return "\n".join(f"[{n}] {self.prose(rng, 120)}" for n in targets)
+
+    def _outline(self, prompt: str, rng: random.Random) -> str:
+        match = re.search(r"章节数：(\d+)", prompt) or re.search(r"剩下的 (\d+) 章", prompt)
+        count = int(match.group(1)) if match else 10
+        lines = ["【章节概要】"]
+        for i in range(1, count + 1):
+            lines.append(f"{i}. 第{i}章 风起|{self.prose(rng, 40)}")
+        if "【角色】" in prompt:
+            lines += ["", "【角色】", "林远|青云门外门弟子，与秦霜青梅竹马|隐忍坚毅|练气一层",
+                      "秦霜|青云门内门天才|外冷内热|筑基初期"]
+        if "【世界观】" in prompt:
+            lines += ["", "【世界观】", "青云门|东洲三大仙门之一，以剑道闻名"]
+        return "\n".join(lines)
+
+
+class FakePrefixCache:
+    """Simulates provider prompt-prefix caching at message boundaries.
+
+    A request whose leading messages exactly repeat an earlier request's
+    leading messages reports their tokens as ``cached_tokens``.  The last
+    message is never counted, matching providers that cache the shared prefix only.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._seen: Dict[str, None] = {}
+
+    def lookup(self, messages: Messages) -> int:
+        cached = 0
+        tokens = 0
+        digest = hashlib.sha1()
+        for message in messages[:-1]:
+            digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            tokens += estimate_tokens(message["content"])
+            key = digest.hexdigest()
+            if key in self._seen:
+                cached = tokens
+            self._seen[key] = None
+        while len(self._seen) > self.max_entries:
+            self._seen.pop(next(iter(self._seen)))
+        return cached
+
+
+class FakeLLMClient(OpenAICompatClient):
+    """In-process transport: same interface as ``OpenAICompatClient`` but never touches the network.
+
+    Retries, hedging, the scheduler and the call ledger all run exactly as
+    they would against a real endpoint.
+    """
+
+    def __init__(
+        self,
+        model: str = "fake",
+        config: Optional[FakeLLMConfig] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        hedge_after: Optional[float] = None,
+    ):
+        super().__init__(
+            api_key="fake",
+            base_url="fake://local",
+            model=model,
+            retry_policy=retry_policy,
+            hedge_after=hedge_after,
+        )
+        self.config = config or FakeLLMConfig.from_settings()
+        self.responder = FakeResponder(self.config)
+        self.prefix_cache = FakePrefixCache()
+
+    def _fail(self) -> None:
+        if self.responder.should_fail():
+            raise LLMAPIError(self.config.error_status, "fake upstream error", retry_after=0.0)
+
+    async def _generate_once(self, prompt: Prompt, trace: Optional[LLMCallTrace] = None) -> str:
+        self._fail()
+        # 与 HTTP 模拟服务一致：按线上消息列表展开后再生成，同一 prompt 两种传输得到相同响应
+        messages = to_messages(prompt)
+        text = prompt_text(messages)
+        content = self.responder.respond(text)
+        cached = self.prefix_cache.lookup(messages)
+        await asyncio.sleep(self.config.ttft + generation_seconds(content, self.config))
+        if trace is not None:
+            trace.set_usage(usage_for(text, content, cached))
+        return content
+
+    async def _generate_stream_once(
+        self, prompt: Prompt, trace: Optional[LLMCallTrace] = None
+    ) -> AsyncGenerator[str, None]:
+        self._fail()
+        messages = to_messages(prompt)
+        text = prompt_text(messages)
+        content = self.responder.respond(text)
+        cached = self.prefix_cache.lookup(messages)
+        await asyncio.sleep(self.config.ttft)
+        for chunk, delay in paced_chunks(content, self.config):
+            yield chunk
+            await asyncio.sleep(delay)
+        if trace is not None:
+            trace.set_usage(usage_for(text, content, cached))
+
+
+def usage_for(prompt: str, content: str, cached_tokens: int = 0) -> Dict[str, Any]:
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = estimate_tokens(content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+def generation_seconds(content: str, config: FakeLLMConfig) -> float:
+    if config.tokens_per_second <= 0:
+        return 0.0
+    return estimate_tokens(content) / config.tokens_per_second
+
+
+def paced_chunks(content: str, config: FakeLLMConfig):
+    """Split ``content`` into chunks of roughly ``chunk_tokens`` tokens with the delay after each."""
+    step = max(1, config.chunk_tokens)
+    for start in range(0, len(content), step):
+        chunk = content[start:start + step]
+        yield chunk, generation_seconds(chunk, config)
+
+
+def create_fake_llm_app(config: Optional[FakeLLMConfig] = None) -> web.Application:
+    """aiohttp application exposing ``/chat/completions`` and ``/models`` (also under ``/v1``)."""
+    config = config or FakeLLMConfig.from_settings()
+    responder = FakeResponder(config)
+    prefix_cache = FakePrefixCache()
+
+    def error_response() -> web.Response:
+        return web.json_response(
+            {"error": {"message": "fake upstream error", "type": "server_error"}},
+            status=config.error_status,
+            headers={"Retry-After": "0"},
+        )
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        messages = [
+            {"role": str(m.get("role", "user")), "content": str(m.get("content", ""))}
+            for m in body.get("messages") or []
+        ]
+        prompt = prompt_text(messages)
+        model = body.get("model", "fake")
+        if responder.should_fail():
+            return error_response()
+
+        content = responder.respond(prompt)
+        cached = prefix_cache.lookup(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        await asyncio.sleep(config.ttft)
+
+        if not body.get("stream"):
+            await asyncio.sleep(generation_seconds(content, config))
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage_for(prompt, content, cached),
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        async def send(payload: Dict[str, Any]) -> None:
+            await response.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+        for chunk, delay in paced_chunks(content, config):
+            await send({**base, "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]})
+            await asyncio.sleep(delay)
+        await send({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        await send({**base, "choices": [], "usage": usage_for(prompt, content, cached)})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def models(request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "fake", "object": "model"}]})
+
+    app = web.Application()
+    for prefix in ("", "/v1"):
+        app.router.add_post(f"{prefix}/chat/completions", completions)
+        app.router.add_get(f"{prefix}/models", models)
+    return app
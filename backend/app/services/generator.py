@@ -3,15 +3,64 @@ import asyncio
 import json
 import re
 import os
-from typing import Any, AsyncGenerator, Dict, List, Optional
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import aiohttp
-from sqlalchemy import select, or_, and_
+from sqlalchemy import and_, false, func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from app.models import Character, Scene, Relationship
-from app.rag import rag_service
+from app.rag import async_rag
 from app.config import settings
+from app.logging import get_logger
+from app.services.context_packer import ContextPacker, PackedContext, PackItem, PackSection, context_budget_for
+from app.services.http_pool import http_session_pool
+from app.services.llm_cache import llm_response_cache
+from app.services.llm_ledger import LLMCallTrace, llm_ledger
+from app.services.llm_retry import (
+    LLMAPIError,
+    RetryPolicy,
+    call_with_retry,
+    default_policy,
+    hedged_call,
+    hedged_stream,
+    parse_retry_after,
+    stream_with_retry,
+)
+from app.services.llm_scheduler import LLMPriority, llm_scheduler
+from app.services.llm_singleflight import llm_single_flight
+from app.services.prompt_messages import Messages, Prompt, layered_messages, prompt_text, to_messages
+from app.services.scene_context_cache import (
+    chapter_order_tag,
+    chapter_scenes_tag,
+    character_tag,
+    lore_tag,
+    novel_tag,
+    relationship_tag,
+    scene_context_cache,
+    scene_tag,
+)
+from app.services.think_filter import filter_stream, strip_think
+from app.services.tokens import estimate_tokens, truncate_to_tokens
+
+logger = get_logger(__name__)
+
+# 每次上游尝试前调用，返回占用调度名额的上下文（见 LLMScheduler.admission）
+Admit = Callable[[], AsyncContextManager[Any]]
 
 
 class Assistant:
@@ -33,22 +82,139 @@ class Assistant:
         if context:
             user_prompt += f"\n\n【当前上下文参考】\n{context}"
 
-        prompt = f"{system_prompt}\n\n用户：{user_prompt}"
+        # 固定的系统提示放在最前，便于服务商按前缀缓存
+        prompt = layered_messages(system_prompt, volatile=user_prompt)
 
-        async for chunk in self.llm.generate_stream(prompt):
+        async for chunk in self.llm.generate_stream(prompt, call_site="chat"):
             yield chunk
 
 
 class OpenAICompatClient:
     """OpenAI 兼容 API 客户端"""
 
-    def __init__(self, api_key: str, base_url: str, model: str):
+    temperature = 0.7
+    max_tokens = 4096
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str,
+        retry_policy: Optional[RetryPolicy] = None,
+        hedge_after: Optional[float] = None,
+    ):
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
+        self.retry_policy = retry_policy or default_policy()
+        # 首个 token 超过该秒数仍未返回则发起对冲请求，<=0 关闭
+        self.hedge_after = settings.llm_hedge_after_seconds if hedge_after is None else hedge_after
+
+    def sampling_params(self) -> Dict[str, Any]:
+        """影响输出的请求参数，用作响应缓存键的一部分"""
+        return {
+            "base_url": self.base_url,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+    @staticmethod
+    def _timeout() -> aiohttp.ClientTimeout:
+        # 连接池中的 session 长期复用，超时按请求单独设置
+        return aiohttp.ClientTimeout(total=settings.llm_http_timeout)
+
+    async def generate(
+        self, prompt: Prompt, trace: Optional[LLMCallTrace] = None, admit: Optional[Admit] = None
+    ) -> str:
+        """同步生成（429/5xx/网络错误按退避策略重试，可选对冲请求）；trace 用于回填上游 usage
+
+        prompt 为字符串时作为单条 user 消息发送，也可直接传 system/user 分层的消息列表。
+        admit 包住每一次上游请求（每次重试、每个对冲请求各占一个调度名额），退避等待期间不占名额；
+        对冲计时从主请求拿到名额后开始，排队再久也不会触发对冲。
+        """
+
+        async def attempt() -> str:
+            admitted = asyncio.Event()
+            content, usage = await hedged_call(
+                lambda: self._attempt(prompt, admit, trace, admitted),
+                self.hedge_after,
+                hedge=lambda: self._attempt(prompt, admit),
+                admitted=admitted,
+            )
+            # 只记胜出请求的 usage
+            if trace is not None:
+                trace.set_usage(usage)
+            return content
+
+        return await call_with_retry(attempt, self.retry_policy)
+
+    async def generate_stream(
+        self, prompt: Prompt, trace: Optional[LLMCallTrace] = None, admit: Optional[Admit] = None
+    ) -> AsyncGenerator[str, None]:
+        """流式生成（仅在尚未输出任何内容时重试，可选按首 token 延迟对冲）；每条上游流在其生命周期内占一个名额"""
+
+        def attempt() -> AsyncGenerator[str, None]:
+            admitted = asyncio.Event()
+            # 落败的流在首 token 之前就被关闭，不会写入 usage；排队时间只记主请求
+            return hedged_stream(
+                lambda: self._attempt_stream(prompt, trace, self._slot(admit, trace, admitted)),
+                self.hedge_after,
+                hedge=lambda: self._attempt_stream(prompt, trace, self._slot(admit)),
+                admitted=admitted,
+            )
+
+        async for chunk in stream_with_retry(attempt, self.retry_policy):
+            yield chunk
 
-    async def generate(self, prompt: str) -> str:
-        """同步生成"""
+    @staticmethod
+    @asynccontextmanager
+    async def _slot(
+        admit: Optional[Admit],
+        trace: Optional[LLMCallTrace] = None,
+        admitted: Optional[asyncio.Event] = None,
+    ) -> AsyncIterator[None]:
+        """占一个调度名额；trace 记入排队时间（只传给主请求），admitted 在放行后置位"""
+        if admit is None:
+            if admitted is not None:
+                admitted.set()
+            yield
+            return
+        async with admit() as slot:
+            if trace is not None:
+                trace.queue_wait += slot.wait_seconds
+            if admitted is not None:
+                admitted.set()
+            yield
+
+    async def _attempt(
+        self,
+        prompt: Prompt,
+        admit: Optional[Admit],
+        trace: Optional[LLMCallTrace] = None,
+        admitted: Optional[asyncio.Event] = None,
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        async with self._slot(admit, trace, admitted):
+            return await self._generate_once(prompt)
+
+    async def _attempt_stream(
+        self, prompt: Prompt, trace: Optional[LLMCallTrace], slot: AsyncContextManager[None]
+    ) -> AsyncGenerator[str, None]:
+        async with slot:
+            async for chunk in self._generate_stream_once(prompt, trace):
+                yield chunk
+
+    @staticmethod
+    async def _raise_for_status(response: aiohttp.ClientResponse) -> None:
+        if response.status != 200:
+            error = await response.text()
+            raise LLMAPIError(
+                response.status,
+                error,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
+
+    async def _generate_once(self, prompt: Prompt) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """单次上游请求，返回 (正文, usage)"""
         url = f"{self.base_url}/chat/completions"
 
         headers = {
@@ -58,27 +224,22 @@ class OpenAICompatClient:
 
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 4096,
+            "messages": to_messages(prompt),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
             "thinking": {"type": "off"}
         }
 
-        # 设置超时时间为 300 秒
-        timeout = aiohttp.ClientTimeout(total=300)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                if response.status != 200:
-                    error = await response.text()
-                    raise Exception(f"API error: {error}")
+        session = http_session_pool.get(self.base_url)
+        async with session.post(url, json=payload, headers=headers, timeout=self._timeout()) as response:
+            await self._raise_for_status(response)
 
-                data = await response.json()
-                return data.get("choices", [{}])[0].get("message", {}).get("content", "")
+            data = await response.json()
+            return data.get("choices", [{}])[0].get("message", {}).get("content", ""), data.get("usage")
 
-    async def generate_stream(self, prompt: str) -> AsyncGenerator[str, None]:
-        """流式生成"""
+    async def _generate_stream_once(
+        self, prompt: Prompt, trace: Optional[LLMCallTrace] = None
+    ) -> AsyncGenerator[str, None]:
         url = f"{self.base_url}/chat/completions"
 
         headers = {
@@ -88,40 +249,50 @@ class OpenAICompatClient:
 
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 4096,
+            "messages": to_messages(prompt),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
             "thinking": {"type": "off"},
             "stream": True
         }
 
-        # 设置超时时间为 300 秒
-        timeout = aiohttp.ClientTimeout(total=300)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                if response.status != 200:
-                    error = await response.text()
-                    raise Exception(f"API error: {error}")
-
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    if not line or not line.startswith('data:'):
-                        continue
+        session = http_session_pool.get(self.base_url)
+        async with session.post(url, json=payload, headers=headers, timeout=self._timeout()) as response:
+            await self._raise_for_status(response)
 
-                    json_str = line[5:].strip()
-                    if json_str == "[DONE]":
-                        break
+            async for line in response.content:
+                line = line.decode('utf-8').strip()
+                if not line or not line.startswith('data:'):
+                    continue
 
-                    try:
-                        data = json.loads(json_str)
-                        delta = data.get("choices", [{}])[0].get("delta", {})
-                        content = delta.get("content", "")
-                        if content:
-                            yield content
-                    except json.JSONDecodeError:
-                        continue
+                json_str = line[5:].strip()
+                if json_str == "[DONE]":
+                    break
+
+                try:
+                    data = json.loads(json_str)
+                    # 部分服务商会在最后一个数据块附带 usage
+                    if trace is not None and data.get("usage"):
+                        trace.set_usage(data["usage"])
+                    delta = (data.get("choices") or [{}])[0].get("delta", {})
+                    content = delta.get("content", "")
+                    if content:
+                        yield content
+                except json.JSONDecodeError:
+                    continue
+
+
+@dataclass
+class BatchResult:
+    """generate_many 的单条结果"""
+
+    index: int
+    content: str
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 class LLMClient:
@@ -133,17 +304,22 @@ class LLMClient:
         self.model = settings.openai_model
 
         self.client = None
+        self._clients: Dict[str, OpenAICompatClient] = {}
         self._init_client()
 
     def _init_client(self):
+        # 配置变化后旧的按模型缓存的客户端全部作废
+        self._clients = {}
+        self.client = self._new_client(self.model)
+
+    def _new_client(self, model: str) -> Optional[OpenAICompatClient]:
+        if settings.llm_fake_enabled:
+            # 离线压测：进程内模拟上游，仍经过调度、重试与账本
+            from app.services.fake_llm import FakeLLMClient
+            return FakeLLMClient(model=model or "fake")
         if self.api_key and self.base_url:
-            self.client = OpenAICompatClient(
-                api_key=self.api_key,
-                base_url=self.base_url,
-                model=self.model
-            )
-        else:
-            self.client = None
+            return OpenAICompatClient(api_key=self.api_key, base_url=self.base_url, model=model)
+        return None
 
     async def refresh_config(self, db: AsyncSession):
         """从数据库刷新配置"""
@@ -167,77 +343,192 @@ class LLMClient:
 
     def _client_for_model(self, model: Optional[str] = None):
         """返回用于指定模型的客户端（不传则用默认）"""
-        if not self.api_key or not self.base_url:
+        if self.client is None:
             return None
         m = (model or self.model).strip() if (model or self.model) else self.model
-        return OpenAICompatClient(api_key=self.api_key, base_url=self.base_url, model=m)
-
-    async def generate(self, prompt: str, model_override: Optional[str] = None) -> str:
-        """同步生成文本，可选 model_override（写作/摘要/审稿区分）"""
-        client = self._client_for_model(model_override) if model_override else self.client
-        if not client:
-            return self._mock_response(prompt)
+        if self.client and m == self.client.model:
+            return self.client
+        client = self._clients.get(m)
+        if client is None:
+            client = self._new_client(m)
+            self._clients[m] = client
+        return client
+
+    async def generate(
+        self,
+        prompt: Prompt,
+        model_override: Optional[str] = None,
+        cache: bool = False,
+        coalesce: bool = True,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        call_site: str = "default",
+    ) -> str:
+        """同步生成文本，可选 model_override（写作/摘要/审稿区分）。
+
+        cache=True 时按 (模型, prompt 哈希, 采样参数) 命中响应缓存，
+        仅供输入不变则结果可复用的后台分析类调用开启。
+        coalesce=True 时相同请求在途期间只向上游发送一次，其余调用方共享结果。
+        priority 决定在全局调度器中的放行顺序，后台任务应传 BACKGROUND/BATCH。
+        call_site 为调用点标签，用于在 LLM 调用账本中分项统计 token 与延迟。
+        prompt 可为字符串或分层消息列表（见 app.services.prompt_messages）。
+        """
         try:
-            return await client.generate(prompt)
+            return await self._generate_or_raise(prompt, model_override, cache, coalesce, priority, call_site)
         except Exception as e:
             print(f"Error generating text: {e}")
             return ""
 
-    async def generate_stream(self, prompt: str, model_override: Optional[str] = None) -> AsyncGenerator[str, None]:
-        """流式生成文本，可选 model_override"""
+    async def _generate_or_raise(
+        self,
+        prompt: Prompt,
+        model_override: Optional[str],
+        cache: bool,
+        coalesce: bool,
+        priority: LLMPriority,
+        call_site: str,
+    ) -> str:
+        client = self._client_for_model(model_override) if model_override else self.client
+        if not client:
+            return self._mock_response(prompt_text(prompt))
+
+        key = llm_response_cache.make_key(client.model, prompt_text(prompt), client.sampling_params())
+        use_cache = cache and settings.llm_cache_enabled
+        if use_cache:
+            cached = await llm_response_cache.aget(key)
+            if cached is not None:
+                return cached
+
+        if coalesce:
+            response = await llm_single_flight.do(
+                key, lambda: self._scheduled_generate(client, prompt, priority, call_site)
+            )
+        else:
+            response = await self._scheduled_generate(client, prompt, priority, call_site)
+        if use_cache and response:
+            await llm_response_cache.aset(key, response)
+        return response
+
+    async def generate_many(
+        self,
+        prompts: Sequence[Prompt],
+        model_override: Optional[str] = None,
+        cache: bool = False,
+        coalesce: bool = True,
+        priority: LLMPriority = LLMPriority.BACKGROUND,
+        call_site: str = "default",
+        concurrency: Optional[int] = None,
+    ) -> List["BatchResult"]:
+        """批量生成：并发提交、按输入顺序返回；单条失败记录在对应结果的 error 中，不影响其他条目"""
+        results: List[Optional[BatchResult]] = [None] * len(prompts)
+        async for item in self.generate_many_as_completed(
+            prompts, model_override, cache, coalesce, priority, call_site, concurrency
+        ):
+            results[item.index] = item
+        return results
+
+    async def generate_many_as_completed(
+        self,
+        prompts: Sequence[Prompt],
+        model_override: Optional[str] = None,
+        cache: bool = False,
+        coalesce: bool = True,
+        priority: LLMPriority = LLMPriority.BACKGROUND,
+        call_site: str = "default",
+        concurrency: Optional[int] = None,
+    ) -> AsyncGenerator["BatchResult", None]:
+        """与 generate_many 相同，但按完成先后逐条产出结果（BatchResult.index 为输入下标）。
+
+        并发上限由全局调度器按模型控制；concurrency 可额外限制本批次同时在途的条数。
+        提前退出迭代时未完成的请求会被取消。
+        """
+        semaphore = asyncio.Semaphore(concurrency) if concurrency and concurrency > 0 else None
+
+        async def run(index: int, prompt: Prompt) -> BatchResult:
+            try:
+                if semaphore is None:
+                    content = await self._generate_or_raise(
+                        prompt, model_override, cache, coalesce, priority, call_site
+                    )
+                else:
+                    async with semaphore:
+                        content = await self._generate_or_raise(
+                            prompt, model_override, cache, coalesce, priority, call_site
+                        )
+                return BatchResult(index=index, content=content)
+            except Exception as e:
+                return BatchResult(index=index, content="", error=str(e) or type(e).__name__)
+
+        tasks = [asyncio.ensure_future(run(i, prompt)) for i, prompt in enumerate(prompts)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_stream(
+        self,
+        prompt: Prompt,
+        model_override: Optional[str] = None,
+        coalesce: bool = True,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        strip_bold: bool = False,
+        call_site: str = "default",
+    ) -> AsyncGenerator[str, None]:
+        """流式生成文本，可选 model_override；coalesce=True 时相同请求共享同一条上游流"""
         client = self._client_for_model(model_override) if model_override else self.client
         if not client:
-            response = self._mock_response(prompt)
+            response = self._mock_response(prompt_text(prompt))
             for char in response:
                 yield char
                 await asyncio.sleep(0.02)
             return
 
-        skip_content = False
-        buffer = ""
-
-        async for chunk in client.generate_stream(prompt):
-            # 处理思考内容过滤逻辑
-            # 将新 chunk 拼接到缓冲区
-            buffer += chunk
-
-            while True:
-                # 如果处于跳过模式，寻找结束标签
-                if skip_content:
-                    if '</think>' in buffer:
-                        end_idx = buffer.find('</think>') + 8  # 8 is len('</think>')
-                        buffer = buffer[end_idx:]
-                        skip_content = False
-                        # 继续循环处理剩余的 buffer
-                    else:
-                        # 没找到结束标签，清空 buffer (因为都在思考内容里)，等待更多数据
-                        buffer = ""
-                        break
-                
-                # 如果不在跳过模式，寻找开始标签
-                else:
-                    if '<think>' in buffer:
-                        start_idx = buffer.find('<think>')
-                        # 输出开始标签前的内容
-                        if start_idx > 0:
-                            yield buffer[:start_idx]
-                        
-                        # 移除开始标签前的内容和开始标签本身
-                        buffer = buffer[start_idx + 7:] # 7 is len('<think>')
-                        skip_content = True
-                        # 继续循环，处理可能在同一个 chunk 里的结束标签
-                    else:
-                        # 没找到开始标签，输出 buffer 并清空
-                        if buffer:
-                            yield buffer
-                            buffer = ""
-                        break
+        if coalesce:
+            key = llm_response_cache.make_key(client.model, prompt_text(prompt), client.sampling_params())
+            source = llm_single_flight.stream(
+                key, lambda: self._scheduled_stream(client, prompt, priority, call_site)
+            )
+        else:
+            source = self._scheduled_stream(client, prompt, priority, call_site)
 
-        # 循环结束后，如果还有剩余 buffer 且不在跳过模式，输出
-        if not skip_content and buffer:
-            yield buffer
+        # 单遍增量状态机过滤 <think> 块（可跨 chunk 边界），可选同时去掉 Markdown 加粗
+        async for chunk in filter_stream(source, strip_bold=strip_bold):
+            yield chunk
+
+    @staticmethod
+    async def _scheduled_generate(
+        client: OpenAICompatClient, prompt: Prompt, priority: LLMPriority, call_site: str = "default"
+    ) -> str:
+        """每次上游请求（含重试与对冲）各自经全局调度器放行并计入速率桶，整次调用记入调用账本"""
+        prompt_tokens = estimate_tokens(prompt_text(prompt))
+        admit = llm_scheduler.admission(client.model, priority, prompt_tokens)
+        with llm_ledger.trace(call_site, client.model, prompt_tokens) as trace:
+            try:
+                response = await client.generate(prompt, trace=trace, admit=admit)
+                trace.add_completion(response)
+            finally:
+                llm_scheduler.charge_tokens(client.model, trace.completion_tokens)
+        return response
+
+    @staticmethod
+    async def _scheduled_stream(
+        client: OpenAICompatClient, prompt: Prompt, priority: LLMPriority, call_site: str = "default"
+    ) -> AsyncGenerator[str, None]:
+        """每条上游流在其生命周期内占用一个调度名额；重试退避期间释放名额"""
+        prompt_tokens = estimate_tokens(prompt_text(prompt))
+        admit = llm_scheduler.admission(client.model, priority, prompt_tokens)
+        with llm_ledger.trace(call_site, client.model, prompt_tokens, stream=True) as trace:
+            try:
+                async for chunk in client.generate_stream(prompt, trace=trace, admit=admit):
+                    trace.mark_first_token()
+                    trace.add_completion(chunk)
+                    yield chunk
+            finally:
+                llm_scheduler.charge_tokens(client.model, trace.completion_tokens)
 
     def _mock_response(self, prompt: str) -> str:
+        # 未配置 API 时的占位；需要真实延迟/结构化输出请开启 LLM_FAKE_ENABLED
         return "模拟响应"
 
 
@@ -256,7 +547,7 @@ class OutlineGenerator:
         num_chapters: int = 10
     ) -> Dict[str, Any]:
         prompt = self._build_outline_prompt(premise, genre, tone, num_chapters)
-        response = await self.llm.generate(prompt)
+        response = await self.llm.generate(prompt, call_site="outline")
         result = self._parse_outline_response(response, novel_id, num_chapters)
         
         # 检查章节数量是否足够，如果不够则尝试补充
@@ -265,6 +556,7 @@ class OutlineGenerator:
             print(f"Warning: Generated only {len(chapters)} chapters, expected {num_chapters}. Attempting to extend...")
             # 简单的补充逻辑：让 AI 继续生成后续章节
             # 这里我们只尝试一次补充，避免死循环
+            # 补充请求要接着首轮结果的最后一章写，只能等首轮返回后再发，不能与首轮一起走 generate_many
             try:
                 extension = await self._extend_chapters(chapters, premise, genre, tone, num_chapters)
                 if extension:
@@ -306,11 +598,10 @@ class OutlineGenerator:
 2. 章节标题|章节概要
 ...
 """
-        response = await self.llm.generate(prompt)
+        response = await self.llm.generate(prompt, call_site="outline")
         
         # 清理
-        response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
-        response = re.sub(r'\*\*', '', response)
+        response = strip_think(response)
         
         # 提取章节部分
         if '【章节概要】' in response:
@@ -341,7 +632,7 @@ class OutlineGenerator:
                 10
             )
 
-            async for chunk in self.llm.generate_stream(prompt):
+            async for chunk in self.llm.generate_stream(prompt, call_site="outline"):
                 yield chunk
 
     def _build_outline_prompt(self, premise: str, genre: str, tone: str, num_chapters: int) -> str:
@@ -370,8 +661,7 @@ class OutlineGenerator:
         characters = []
         lore = []
 
-        response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
-        response = re.sub(r'\*\*', '', response)
+        response = strip_think(response)
 
         sections = response.split('【')
 
@@ -534,6 +824,29 @@ class OutlineGenerator:
         return lore
 
 
+WRITING_INSTRUCTIONS = """你是一名专业的长篇小说作者，根据作品设定和场景信息写小说正文。
+注意：不要输出任何思考内容，只需要输出小说正文。
+要求：800-1200字，通过动作描写表现心理，禁止流水账。"""
+
+
+def novel_bible(novel: Any) -> str:
+    """作品设定块：只由小说自身字段拼成，同一小说的所有场景逐字节相同"""
+    if novel is None:
+        return ""
+    lines = ["【作品设定】", f"书名：{novel.title}"]
+    for label, value in (
+        ("类型", novel.genre),
+        ("基调", novel.tone),
+        ("故事核", novel.premise),
+        ("哲学思想内核", novel.philosophical_theme),
+    ):
+        if value:
+            lines.append(f"{label}：{value}")
+    if novel.worldbuilding:
+        lines.append(f"世界观：{truncate_to_tokens(novel.worldbuilding, settings.scene_bible_worldbuilding_tokens)}")
+    return "\n".join(lines)
+
+
 class SceneGenerator:
     """场景生成器"""
 
@@ -565,155 +878,173 @@ class SceneGenerator:
 
         scene, novel = row
 
-        context = await self._build_context(scene, db)
-        prompt = self._build_writing_prompt(scene, context)
+        context = await self.get_context(scene, db)
+        prompt = self._build_writing_prompt(
+            scene, context, model=writing_model or (editorial_model if enable_editorial else None), novel=novel
+        )
 
         # 如果不开启审稿功能，直接流式生成
         if not enable_editorial:
             yield {"type": "system", "content": "正在直接生成..."}
             full_content = ""
-            async for chunk in self.llm.generate_stream(prompt, model_override=writing_model):
-                 # 过滤思考内容
-                 chunk_clean = chunk.replace('<think>', '').replace('</think>', '') # 简单过滤
-                 # 注意：流式生成时，思考标签可能被拆分，这里仅做简单处理
-                 # 实际上如果模型输出带思考过程，流式处理比较麻烦，需要状态机
-                 # 假设这里我们用的模型不输出思考过程，或者前端不显示
-                 # 为了统一接口，我们包装成 dict
-                 yield {"type": "content", "content": chunk}
-                 full_content += chunk
+            # 思考内容与 Markdown 加粗已在流式过滤器中一次性去除
+            async for chunk in self.llm.generate_stream(
+                prompt, model_override=writing_model, strip_bold=True, call_site="scene_writing"
+            ):
+                yield {"type": "content", "content": chunk}
             return
 
         # --- 引入多智能体审稿委员会 ---
         from app.agents.editorial_room import EditorialRoom
 
-        # 1. 生成初稿
+        # 1. 生成初稿（流式推送，用户立即可见；审稿修订时会以 reset 事件替换）
         yield {"type": "system", "content": "正在生成初稿..."}
 
-        # 使用同步生成获取完整初稿（可用写作模型或审稿模型覆盖）
-        full_draft = await self.llm.generate(prompt, model_override=writing_model or editorial_model)
-        
-        # 立即清理初稿中的思考标签和 Markdown 加粗
-        full_draft = re.sub(r'<think>.*?</think>', '', full_draft, flags=re.DOTALL).strip()
-        full_draft = re.sub(r'\*\*', '', full_draft).strip()
+        draft_parts = []
+        async for chunk in self.llm.generate_stream(
+            prompt, model_override=writing_model or editorial_model, strip_bold=True, call_site="scene_draft"
+        ):
+            draft_parts.append(chunk)
+            yield {"type": "content", "content": chunk}
+        full_draft = "".join(draft_parts).strip()
         
         yield {"type": "system", "content": "初稿生成完毕，正在提交多智能体审稿委员会（Agent A/B/C 联合审阅中）..."}
         
-        # 2. 准备上下文
-        # 简单处理：提取 Prompt 中的信息部分作为上下文
-        context_str = prompt.split("要求：")[0] if "要求：" in prompt else prompt
+        # 2. 准备上下文：场景数据部分（作品设定与写作要求不必交给审稿）
+        context_str = prompt[-1]["content"]
 
-        # 3. 执行审稿与修订
+        # 3. 执行审稿与修订：每个 Agent 的结论与修订正文边生成边推送
         try:
-            review_result = await EditorialRoom.review_and_revise(
+            async for event in EditorialRoom.stream_review(
                 draft=full_draft,
                 context=context_str,
-                philosophical_theme=novel.philosophical_theme
-            )
-            
-            final_content = review_result["content"]
-            logs = review_result["logs"]
-            
-            # 4. 先输出评审日志（再输出正文），避免大块 content 导致前端缓冲/解析异常而收不到 log
-            for log in logs:
-                yield {"type": "log", "content": log}
-            # 5. 输出最终正文
-            yield {"type": "content", "content": final_content}
+                philosophical_theme=novel.philosophical_theme,
+                model=editorial_model,
+            ):
+                if event["type"] == "result":
+                    logger.info(
+                        "Editorial review for scene %s: %s critique calls, %s saved, %s revisions, stop=%s",
+                        scene.id, event["critique_calls"], event["saved_calls"],
+                        event["revisions"], event["stop_reason"] or "-",
+                    )
+                else:
+                    yield event
                 
         except Exception as e:
+            # 已推送的修订稿可能不完整，回退为初稿
             yield {"type": "system", "content": f"审稿过程发生异常: {str(e)}"}
+            yield {"type": "reset"}
             yield {"type": "content", "content": full_draft}
 
-    async def _build_context(self, scene: Scene, db: AsyncSession) -> Dict[str, Any]:
-        from app.models import Chapter
+    async def get_context(self, scene: Scene, db: AsyncSession) -> Dict[str, Any]:
+        """读穿缓存的场景上下文：依赖的摘要、章节顺序、角色、关系或设定变化后自动重建"""
+        if not settings.scene_context_cache_enabled:
+            return await self._build_context(scene, db)
+        context = scene_context_cache.get(scene.id)
+        if context is not None:
+            return context
+        built_at = scene_context_cache.clock()
+        tags: set = set()
+        context = await self._build_context(scene, db, tags)
+        scene_context_cache.put(scene.id, context, tags, built_at)
+        return context
 
-        context = {"prev_summaries": [], "character_contexts": [], "lore_contexts": []}
+    async def _build_context(self, scene: Scene, db: AsyncSession, tags: Optional[set] = None) -> Dict[str, Any]:
+        """组装场景上下文；传入 tags 时记录本次读取依赖的缓存标签
 
-        # 获取当前场景所属章节与 novel_id，供 RAG 检索按小说隔离
-        chapter_result = await db.execute(select(Chapter).where(Chapter.id == scene.chapter_id))
-        current_chapter = chapter_result.scalar_one_or_none()
-        novel_id = current_chapter.novel_id if current_chapter else None
+        查询次数固定（与出场角色数无关）：章节+小说+上一章 ID 一次，跨章前序场景窗口一次，
+        出场角色一次，角色间关系一次。
+        """
+        from app.models import Chapter, Novel
 
-        print(f"DEBUG: Building context for scene {scene.id}, order_index={scene.order_index}, chapter_id={scene.chapter_id}")
-
-        # 1. 尝试获取同章节的前序场景摘要
-        stmt = (
-            select(Scene)
-            .where(Scene.chapter_id == scene.chapter_id)
-            .where(Scene.order_index < scene.order_index) 
-            .where(Scene.id != scene.id)
-            .order_by(Scene.order_index.desc())
-            .limit(5)
+        context = {"prev_summaries": [], "character_contexts": [], "lore_contexts": []}
+        tags = tags if tags is not None else set()
+        tags.update((scene_tag(scene.id), chapter_scenes_tag(scene.chapter_id)))
+
+        # 1. 当前章节、所属小说（故事核兜底）与上一章 ID，一次联表取回
+        prev_chapter = aliased(Chapter)
+        prev_chapter_id = (
+            select(prev_chapter.id)
+            .where(prev_chapter.novel_id == Chapter.novel_id, prev_chapter.order_index < Chapter.order_index)
+            .order_by(prev_chapter.order_index.desc())
+            .limit(1)
+            .correlate(Chapter)
+            .scalar_subquery()
         )
-        result = await db.execute(stmt)
-        prev_scenes = result.scalars().all()
-        
-        print(f"DEBUG: Found {len(prev_scenes)} prev scenes in same chapter")
-        for s in prev_scenes:
-            print(f"DEBUG: - Scene {s.id}, order={s.order_index}, summary_len={len(s.summary) if s.summary else 0}")
-        
-        # 2. 如果同章节没有前序场景（即这是本章第一个场景），则尝试获取上一章的摘要
-        if not prev_scenes and current_chapter:
-            print("DEBUG: No prev scenes in chapter, looking for prev chapter...")
-            # 获取上一章
-            prev_chapter_result = await db.execute(
-                select(Chapter)
-                .where(Chapter.novel_id == current_chapter.novel_id)
-                .where(Chapter.order_index < current_chapter.order_index)
-                .order_by(Chapter.order_index.desc())
-                .limit(1)
+        row = (
+            await db.execute(
+                select(Chapter, Novel, prev_chapter_id)
+                .join(Novel, Chapter.novel_id == Novel.id)
+                .where(Chapter.id == scene.chapter_id)
             )
-            prev_chapter = prev_chapter_result.scalar_one_or_none()
-
-            if prev_chapter:
-                print(f"DEBUG: Found prev chapter {prev_chapter.id}")
-                prev_scenes_result = await db.execute(
-                    select(Scene)
-                    .where(Scene.chapter_id == prev_chapter.id)
-                    .order_by(Scene.order_index.desc())
-                    .limit(3)  # 取上一章最后3个场景
+        ).first()
+        current_chapter, novel, prev_chapter_id = row if row else (None, None, None)
+        # RAG 检索按小说隔离
+        novel_id = current_chapter.novel_id if current_chapter else None
+
+        # 2. 前序场景窗口：本章此前最近 5 个场景 + 上一章最后 3 个场景，一次查询
+        rank = (
+            func.row_number()
+            .over(partition_by=Scene.chapter_id, order_by=Scene.order_index.desc())
+            .label("rank")
+        )
+        window = (
+            select(Scene.chapter_id, Scene.summary, rank)
+            .where(
+                or_(
+                    and_(
+                        Scene.chapter_id == scene.chapter_id,
+                        Scene.order_index < scene.order_index,
+                        Scene.id != scene.id,
+                    ),
+                    Scene.chapter_id == prev_chapter_id if prev_chapter_id else false(),
                 )
-                prev_scenes = prev_scenes_result.scalars().all()
-
-            # 如果连上一章都没有（即全书第一章），或上一章没有场景，用小说故事核作为前情提要
-            if not prev_scenes:
-                print("DEBUG: No prev chapter or scenes, using premise")
-                from app.models import Novel
-                novel_result = await db.execute(select(Novel).where(Novel.id == current_chapter.novel_id))
-                novel = novel_result.scalar_one_or_none()
+            )
+            .subquery()
+        )
+        window_rows = (
+            await db.execute(
+                select(window.c.chapter_id, window.c.summary)
+                .where(or_(
+                    and_(window.c.chapter_id == scene.chapter_id, window.c.rank <= 5),
+                    window.c.rank <= 3,
+                ))
+                .order_by(window.c.rank)
+            )
+        ).all()
+        # 按时间倒序（最近的在前）
+        prev_scenes = [r for r in window_rows if r.chapter_id == scene.chapter_id]
+        logger.debug("Scene %s context: %s prev scenes in same chapter", scene.id, len(prev_scenes))
+
+        # 本章第一个场景：改用上一章最后 3 个场景；全书第一章（或上一章没有场景）用小说故事核作为前情提要
+        summaries: List[str] = []
+        if prev_scenes:
+            summaries = [s.summary for s in reversed(prev_scenes) if s.summary]
+        elif current_chapter:
+            tags.add(chapter_order_tag(current_chapter.novel_id))
+            if prev_chapter_id:
+                tags.add(chapter_scenes_tag(prev_chapter_id))
+            prev_scenes = [r for r in window_rows if r.chapter_id == prev_chapter_id]
+            if prev_scenes:
+                summaries = [s.summary for s in reversed(prev_scenes) if s.summary]
+            else:
+                tags.add(novel_tag(current_chapter.novel_id))
                 if novel and novel.premise:
-                    class MockScene:
-                        summary = f"【故事背景】：{novel.premise}"
-                    prev_scenes = [MockScene()]
-        
-        # 兼容处理：确保 prev_scenes 中的对象都有 summary 属性
-        summaries = []
-        for s in reversed(prev_scenes):
-            if hasattr(s, 'summary') and s.summary:
-                summaries.append(s.summary)
-            elif isinstance(s, dict) and s.get('summary'):
-                 summaries.append(s['summary'])
-            # 针对 MockScene
-            elif hasattr(s, 'summary'): 
-                summaries.append(s.summary)
-        
+                    summaries = [f"【故事背景】：{novel.premise}"]
+
         context["prev_summaries"] = summaries
-        print(f"DEBUG: Final context summaries: {summaries}")
 
         # 获取角色上下文
         if scene.characters_present:
             char_ids = scene.characters_present
-            
-            # 1. 获取角色基本信息
-            for char_id in char_ids:
-                result = await db.execute(select(Character).where(Character.id == char_id))
-                character = result.scalar_one_or_none()
+            tags.update(character_tag(char_id) for char_id in char_ids)
+
+            # 3. 角色基本信息：一次 IN 查询，按出场顺序排列
+            result = await db.execute(select(Character).where(Character.id.in_(char_ids)))
+            by_id = {c.id: c for c in result.scalars().all()}
+            for char_id in dict.fromkeys(char_ids):
+                character = by_id.get(char_id)
                 if character:
-                    char_contexts = rag_service.retrieve_context(
-                        query=f"{character.name} {character.bio}",
-                        type="character",
-                        top_k=1,
-                        novel_id=novel_id,
-                    )
                     context["character_contexts"].append({
                         "id": character.id,
                         "name": character.name,
@@ -721,12 +1052,11 @@ class SceneGenerator:
                         "personality": character.personality,
                         "power_state": character.power_state
                     })
-            
-            # 2. 获取角色关系上下文 (如果有2个及以上角色)
+
+            # 4. 角色关系上下文 (如果有2个及以上角色)：A 和 B 都在出场列表中的关系
             context["relationships"] = []
             if len(char_ids) >= 2:
-                # 查询所有涉及这些角色的关系
-                # 只要 A 和 B 都在 char_ids 列表中
+                tags.update(relationship_tag(char_id) for char_id in char_ids)
                 stmt = select(Relationship).where(
                     and_(
                         Relationship.character_a_id.in_(char_ids),
@@ -735,11 +1065,10 @@ class SceneGenerator:
                 )
                 rels_result = await db.execute(stmt)
                 relationships = rels_result.scalars().all()
-                
-                # 为了 Prompt 易读，我们需要把 ID 转换成名字
-                # 先建立 id -> name 映射
+
+                # 为了 Prompt 易读，把 ID 转换成名字
                 id_to_name = {c["id"]: c["name"] for c in context["character_contexts"]}
-                
+
                 for rel in relationships:
                     name_a = id_to_name.get(rel.character_a_id)
                     name_b = id_to_name.get(rel.character_b_id)
@@ -752,51 +1081,44 @@ class SceneGenerator:
                         })
 
         if scene.beat_description:
-            lore_contexts = rag_service.retrieve_context(
-                query=scene.beat_description,
-                type="lore",
-                top_k=3,
-                novel_id=novel_id,
-            )
+            # 动作指令、地点与出场角色名各作一条查询：一次向量 query 加 BM25 字面匹配，按 RRF 融合去重
+            lore_queries = [scene.beat_description]
+            if scene.location:
+                lore_queries.append(scene.location)
+            lore_queries.extend(c["name"] for c in context["character_contexts"])
+            tags.update((lore_tag(), lore_tag(novel_id)))
+            try:
+                lore_contexts = await async_rag.retrieve_hybrid_many(
+                    lore_queries, type="lore", top_k=3, novel_id=novel_id
+                )
+            except Exception:
+                # 检索超时/失败时不带设定继续写作，不让向量库拖垮整次生成
+                logger.exception("Lore retrieval failed scene=%s", scene.id)
+                lore_contexts = []
             context["lore_contexts"] = lore_contexts
 
         return context
 
-    def _build_writing_prompt(self, scene: Scene, context: Dict) -> str:
-        # 将摘要列表反转回来（因为查询时是倒序的），使其按时间正序排列
-        # 注意：在 _build_context 里我们没有 reverse，而是在那里直接 append 了。
-        # 让我们检查一下 _build_context 的逻辑。
-        # _build_context 里： for s in reversed(prev_scenes): ...
-        # prev_scenes 是倒序查出来的 (5, 4, 3...)
-        # reversed 后变成 (3, 4, 5...) 即正序。
-        # 所以 context["prev_summaries"] 已经是正序的了。
-        
-        # 为了避免摘要中混入当前场景的摘要（如果逻辑有误），我们在 prompt 里再次强调
-        
-        prev_summary = "\n".join(context["prev_summaries"]) or "无"
+    def _build_writing_prompt(
+        self, scene: Scene, context: Dict, model: Optional[str] = None, novel: Any = None
+    ) -> Messages:
+        """分层消息：写作要求 + 作品设定（同一小说逐字节不变，可命中服务商前缀缓存）在前，场景数据在后"""
+        # context["prev_summaries"] 在 _build_context 中已按时间正序排列
+        packed = self._pack_context(scene, context, model)
+        if packed.truncated:
+            logger.info(
+                "Scene %s context over budget (%s tokens), cuts: %s",
+                scene.id, packed.budget, packed.cuts,
+            )
 
-        character_info = ""
-        for char in context["character_contexts"]:
-            character_info += f"\n角色: {char['name']} - {char.get('personality', '')}"
-            if char.get('power_state'):
-                character_info += f"\n  - 状态: {json.dumps(char['power_state'], ensure_ascii=False)}"
-
-        if context.get("relationships"):
-            character_info += "\n\n【角色关系与潜台词】"
-            for rel in context["relationships"]:
-                affinity_desc = "普通"
-                if rel['affinity'] > 60: affinity_desc = "亲密/信任"
-                elif rel['affinity'] > 20: affinity_desc = "友善"
-                elif rel['affinity'] < -60: affinity_desc = "仇恨/死敌"
-                elif rel['affinity'] < -20: affinity_desc = "敌对/厌恶"
-                
-                character_info += f"\n- {rel['char_a']} <-> {rel['char_b']}: 好感度 {rel['affinity']} ({affinity_desc})"
-                if rel['conflict']:
-                    character_info += f"\n  核心矛盾/心结: {rel['conflict']}"
+        # 装填时最近的摘要优先，这里再翻转回时间正序
+        prev_summary = "\n".join(reversed(packed.sections["prev_summaries"])) or "无"
 
-        lore_info = ""
-        for lore in context["lore_contexts"]:
-            lore_info += f"- {lore['text']}\n"
+        character_info = "".join(packed.sections["characters"])
+        if packed.sections["relationships"]:
+            character_info += "\n\n【角色关系与潜台词】" + "".join(packed.sections["relationships"])
+
+        lore_info = "".join(packed.sections["lore"])
 
         tension_guide = ""
         if scene.tension_level:
@@ -804,7 +1126,7 @@ class SceneGenerator:
         if scene.emotional_target:
             tension_guide += f"情绪传达目标：【{scene.emotional_target}】\n请调整你的句式长短和描写重心来匹配这一张力。\n"
 
-        return f"""请根据以下信息写小说正文。注意：不要输出任何思考内容，只需要输出小说正文。
+        scene_data = f"""请根据以下信息写小说正文。
 
 前情提要：{prev_summary}
 出场角色：{character_info}
@@ -812,9 +1134,61 @@ class SceneGenerator:
 场景：{scene.location}
 动作指令：{scene.beat_description}
 
-{tension_guide}
-要求：800-1200字，通过动作描写表现心理，禁止流水账。
-"""
+{tension_guide}"""
+        return layered_messages(WRITING_INSTRUCTIONS, novel_bible(novel), scene_data)
+
+    def _pack_context(self, scene: Scene, context: Dict, model: Optional[str] = None) -> PackedContext:
+        """按 动作指令 > 前情提要 > 出场角色 > 角色关系 > 相关设定 的优先级在 token 预算内装填上下文"""
+        summaries = [
+            PackItem(text=summary, label=f"prev_summary[-{i + 1}]")
+            for i, summary in enumerate(reversed(context["prev_summaries"]))
+        ]
+
+        characters = []
+        for char in context["character_contexts"]:
+            compact = f"\n角色: {char['name']} - {char.get('personality', '')}"
+            text = compact
+            if char.get('power_state'):
+                text += f"\n  - 状态: {json.dumps(char['power_state'], ensure_ascii=False)}"
+            characters.append(PackItem(text=text, compact=compact if text != compact else None, label=char['name']))
+
+        relationships = []
+        # 好感度绝对值越大的关系对写作越关键，优先保留
+        rels = sorted(
+            context.get("relationships") or [],
+            key=lambda r: (-abs(r['affinity'] or 0), r['char_a'], r['char_b']),
+        )
+        for rel in rels:
+            affinity_desc = "普通"
+            if rel['affinity'] > 60: affinity_desc = "亲密/信任"
+            elif rel['affinity'] > 20: affinity_desc = "友善"
+            elif rel['affinity'] < -60: affinity_desc = "仇恨/死敌"
+            elif rel['affinity'] < -20: affinity_desc = "敌对/厌恶"
+
+            line = f"\n- {rel['char_a']} <-> {rel['char_b']}: 好感度 {rel['affinity']} ({affinity_desc})"
+            text = line
+            if rel['conflict']:
+                text += f"\n  核心矛盾/心结: {rel['conflict']}"
+            relationships.append(PackItem(
+                text=text, compact=line if text != line else None, label=f"{rel['char_a']}<->{rel['char_b']}"
+            ))
+
+        lore = [
+            PackItem(text=f"- {item['text']}\n", label=f"lore[{i}]")
+            for i, item in enumerate(context["lore_contexts"])
+        ]
+
+        packer = ContextPacker(context_budget_for(model or getattr(self.llm, "writing_model", None) or self.llm.model))
+        return packer.pack([
+            PackSection("beat", [PackItem(text=scene.beat_description or "")], required=True),
+            PackSection("prev_summaries", summaries),
+            PackSection("characters", characters),
+            PackSection("relationships", relationships),
+            PackSection("lore", lore),
+        ])
+
+
+SUMMARY_INSTRUCTIONS = "请将用户给出的小说片段浓缩为200字摘要，保留关键剧情。\n注意：请直接输出摘要，不要输出任何思考过程。"
 
 
 class Summarizer:
@@ -823,13 +1197,20 @@ class Summarizer:
     def __init__(self, llm: LLMClient):
         self.llm = llm
 
-    async def generate_summary(self, content: str, model_override: Optional[str] = None) -> str:
-        prompt = f"请将以下小说片段浓缩为200字摘要，保留关键剧情：\n\n{content}\n\n注意：请直接输出摘要，不要输出任何思考过程。"
-        summary = await self.llm.generate(prompt, model_override=model_override)
+    async def generate_summary(
+        self,
+        content: str,
+        model_override: Optional[str] = None,
+        cache: bool = True,
+        priority: LLMPriority = LLMPriority.BACKGROUND,
+    ) -> str:
+        prompt = layered_messages(SUMMARY_INSTRUCTIONS, volatile=content)
+        summary = await self.llm.generate(
+            prompt, model_override=model_override, cache=cache, priority=priority, call_site="summary"
+        )
         
         # 再次过滤思考内容，以防万一
-        summary = re.sub(r'<think>.*?</think>', '', summary, flags=re.DOTALL)
-        summary = summary.strip()
+        summary = strip_think(summary, strip_bold=False).strip()
         
         return summary
 
@@ -0,0 +1,158 @@
+"""Process-wide pooled aiohttp sessions for outbound LLM traffic."""
+import asyncio
+import warnings
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import aiohttp
+
+from app.config import settings
+from app.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class HttpSessionPool:
+    """Long-lived ``aiohttp.ClientSession`` registry keyed by base_url.
+
+    Sessions are created lazily on first use and kept alive for the lifetime of
+    the process so TCP/TLS connections are reused across calls.  aiohttp
+    sessions are bound to the event loop that created them, so a session from
+    another loop is replaced: it is closed on its own loop if that loop is
+    still running, otherwise its connector is detached and closed in place.
+
+    LangChain/OpenAI SDK clients speak httpx rather than aiohttp; they share a
+    single ``httpx.AsyncClient`` from :meth:`httpx_client` with the same limits.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        keepalive_timeout: float = 60.0,
+        dns_cache_ttl: int = 300,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self._sessions: Dict[str, Tuple[asyncio.AbstractEventLoop, aiohttp.ClientSession]] = {}
+        self._httpx: Optional[Tuple[asyncio.AbstractEventLoop, Any]] = None
+
+    @staticmethod
+    def _key(base_url: str) -> str:
+        return (base_url or "").rstrip("/")
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    def get(self, base_url: str) -> aiohttp.ClientSession:
+        """Return the shared session for ``base_url`` (must be called inside a running loop)."""
+        loop = asyncio.get_running_loop()
+        key = self._key(base_url)
+        entry = self._sessions.get(key)
+        if entry:
+            owner_loop, session = entry
+            if owner_loop is loop and not session.closed:
+                return session
+            if not session.closed:
+                self._retire_session(owner_loop, session)
+        session = self._new_session()
+        self._sessions[key] = (loop, session)
+        return session
+
+    @staticmethod
+    def _retire_session(owner_loop: asyncio.AbstractEventLoop, session: aiohttp.ClientSession) -> None:
+        """关闭属于其他事件循环的 session，避免连接器与 socket 泄漏"""
+        if owner_loop.is_running():
+            # 原循环仍在其他线程运行：交回原循环关闭
+            asyncio.run_coroutine_threadsafe(session.close(), owner_loop)
+            return
+        logger.warning("Replacing aiohttp session from a finished event loop; closing its connector")
+        connector = session.connector
+        session.detach()
+        if connector is not None and not connector.closed:
+            with warnings.catch_warnings():
+                # 无法在已结束的循环上 await；同步关闭，忽略未 await 的弃用提示
+                warnings.simplefilter("ignore", DeprecationWarning)
+                connector.close()
+
+    @staticmethod
+    def _retire_httpx(owner_loop: asyncio.AbstractEventLoop, client: Any) -> None:
+        if owner_loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), owner_loop)
+            return
+        # httpx 连接只能在所属循环上关闭，循环已结束时只能丢弃
+        logger.warning("Discarding httpx client from a finished event loop; its connections are not closed")
+
+    def httpx_client(self) -> Any:
+        """Shared ``httpx.AsyncClient`` for SDK-based clients (must be called inside a running loop)."""
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._httpx:
+            owner_loop, client = self._httpx
+            if owner_loop is loop and not client.is_closed:
+                return client
+            if not client.is_closed:
+                self._retire_httpx(owner_loop, client)
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.limit,
+                max_keepalive_connections=self.limit_per_host,
+                keepalive_expiry=self.keepalive_timeout,
+            ),
+            timeout=httpx.Timeout(settings.llm_http_timeout),
+        )
+        self._httpx = (loop, client)
+        return client
+
+    async def warmup(self, base_urls: Iterable[Optional[str]], timeout: float = 5.0) -> None:
+        """Open one connection per base_url ahead of the first real request."""
+        for base_url in {self._key(u) for u in base_urls if u}:
+            session = self.get(base_url)
+            try:
+                async with session.get(
+                    f"{base_url}/models",
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as response:
+                    await response.read()
+                logger.info("Warmed up LLM connection base_url=%s", base_url)
+            except Exception as exc:
+                logger.warning("LLM connection warm-up failed base_url=%s err=%s", base_url, exc)
+
+    async def close(self) -> None:
+        """Close every session; those owned by other loops are retired like in :meth:`get`."""
+        loop = asyncio.get_running_loop()
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for owner_loop, session in sessions:
+            if session.closed:
+                continue
+            if owner_loop is loop:
+                await session.close()
+            else:
+                self._retire_session(owner_loop, session)
+        if self._httpx:
+            owner_loop, client = self._httpx
+            self._httpx = None
+            if client.is_closed:
+                return
+            if owner_loop is loop:
+                await client.aclose()
+            else:
+                self._retire_httpx(owner_loop, client)
+
+
+http_session_pool = HttpSessionPool(
+    limit=settings.llm_http_limit,
+    limit_per_host=settings.llm_http_limit_per_host,
+    keepalive_timeout=settings.llm_http_keepalive_timeout,
+    dns_cache_ttl=settings.llm_http_dns_cache_ttl,
+)
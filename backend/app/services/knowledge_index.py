@@ -0,0 +1,180 @@
+"""Write-through indexing of lore into the RAG vector store.
+
+``_build_context`` retrieves from the ``lore`` and ``scene_summary``
+collections; these helpers keep lore in sync with the database.  Characters
+are not indexed: the present cast is loaded straight from the database, so
+``backfill_rag.py`` prunes any character vectors left by older versions.
+Indexing is a side effect of the write: failures are logged and never fail
+the request, and the backfill can rebuild the index at any time (including
+scene summaries written before the summary collection existed).
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.logging import get_logger
+from app.models import Chapter, Lore, Novel, Scene
+from app.rag import async_rag
+from app.services.scene_context_cache import lore_tag, scene_context_cache
+
+logger = get_logger(__name__)
+
+
+def lore_doc_id(lore_id: str) -> str:
+    return f"lore_{lore_id}"
+
+
+def summary_doc_id(scene_id: str) -> str:
+    return f"scene_summary_{scene_id}"
+
+
+def _clean_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    # Chroma 元数据不接受 None
+    return {k: v for k, v in metadata.items() if v is not None}
+
+
+def lore_document(lore: Lore) -> Optional[Dict[str, Any]]:
+    if not lore.title and not lore.content:
+        return None
+    text = lore.title or ""
+    if lore.category:
+        text += f"（{lore.category}）"
+    if lore.content:
+        text += f"：{lore.content}"
+    return {
+        "id": lore_doc_id(lore.id),
+        "text": text,
+        "metadata": _clean_metadata({
+            "novel_id": lore.novel_id,
+            "lore_id": lore.id,
+            "title": lore.title,
+            "category": lore.category,
+        }),
+    }
+
+
+def summary_document(scene: Scene, chapter: Chapter) -> Optional[Dict[str, Any]]:
+    if not scene.summary:
+        return None
+    return {
+        "id": summary_doc_id(scene.id),
+        "text": scene.summary,
+        "metadata": {"scene_id": scene.id, "novel_id": chapter.novel_id, "chapter_id": chapter.id},
+    }
+
+
+async def _upsert(documents: List[Dict[str, Any]], type: str, timeout: Optional[float] = None) -> int:
+    """timeout 为 None 时用 RAG 写超时；回填传 0 一直等到写完，避免超时误报 0 条而后台仍在写"""
+    if not documents:
+        return 0
+    try:
+        return await async_rag.add_knowledge_many(
+            texts=[d["text"] for d in documents],
+            doc_ids=[d["id"] for d in documents],
+            type=type,
+            metadatas=[d["metadata"] for d in documents],
+            timeout=timeout,
+        )
+    except Exception:
+        logger.exception("RAG upsert failed type=%s count=%s", type, len(documents))
+        return 0
+    finally:
+        if type == "lore":
+            # 设定检索结果是场景上下文的输入，索引变化后失效对应小说的缓存
+            scene_context_cache.invalidate(lore_tag(d["metadata"].get("novel_id")) for d in documents)
+
+
+async def _delete(
+    doc_ids: Sequence[str], type: str, novel_id: Optional[str] = None, timeout: Optional[float] = None
+) -> None:
+    if not doc_ids:
+        return
+    try:
+        await async_rag.delete_knowledge_many(list(doc_ids), type, novel_id=novel_id, timeout=timeout)
+    except Exception:
+        logger.exception("RAG delete failed type=%s count=%s", type, len(doc_ids))
+    finally:
+        if type == "lore":
+            scene_context_cache.invalidate([lore_tag(novel_id)])
+
+
+async def index_lore(lores: Iterable[Lore], timeout: Optional[float] = None) -> int:
+    """批量写入/更新世界观设定向量，返回写入条数"""
+    return await _upsert([d for d in map(lore_document, lores) if d], "lore", timeout)
+
+
+async def remove_lore(lore_ids: Iterable[str], novel_id: Optional[str] = None) -> None:
+    await _delete([lore_doc_id(i) for i in lore_ids], "lore", novel_id)
+
+
+async def _indexed_ids(novel_id: str, type: str, page_size: int = 1000) -> List[str]:
+    """分页列出该小说已入库的文档 ID（不取正文；回填路径，不设超时）"""
+    ids: List[str] = []
+    offset: Optional[int] = 0
+    while offset is not None:
+        page = await async_rag.list_by_novel(
+            novel_id, type, limit=page_size, offset=offset, include_documents=False, timeout=0
+        )
+        ids.extend(item["id"] for item in page["items"])
+        offset = page["next_offset"]
+    return ids
+
+
+async def _prune(novel_id: str, type: str, keep: Sequence[str]) -> int:
+    """删除向量库中该小说已不在数据库里的文档，返回删除条数"""
+    try:
+        existing = await _indexed_ids(novel_id, type)
+    except Exception:
+        logger.exception("RAG listing failed novel=%s type=%s", novel_id, type)
+        return 0
+    keep_ids = set(keep)
+    stale = [doc_id for doc_id in existing if doc_id not in keep_ids]
+    await _delete(stale, type, novel_id, timeout=0)
+    return len(stale)
+
+
+async def _missing_summaries(novel_id: str, rows: Sequence[Any]) -> List[Dict[str, Any]]:
+    """只补缺失的场景摘要：已入库的摘要可能经 RAG 接口人工修改过，不能用数据库里的旧文本覆盖"""
+    try:
+        indexed = set(await _indexed_ids(novel_id, "scene_summary"))
+    except Exception:
+        logger.exception("RAG listing failed novel=%s type=scene_summary", novel_id)
+        return []
+    documents = [summary_document(scene, chapter) for scene, chapter in rows]
+    return [d for d in documents if d and d["id"] not in indexed]
+
+
+async def backfill_novel(novel_id: str, db: AsyncSession) -> Dict[str, int]:
+    """把一部小说已有的设定全部（重新）写入向量库、补齐缺失的场景摘要，并清理已删除条目的残留向量
+
+    角色不再入库，旧版本写入的角色向量全部清理。
+
+    整部小说一次性嵌入可能远超读超时（首次调用还要加载模型），回填的读写都不设超时：
+    否则上报的条数会是 0 而后台线程仍在写，随后的清理也会基于写了一半的索引。
+    """
+    lores = (await db.execute(select(Lore).where(Lore.novel_id == novel_id))).scalars().all()
+    summary_rows = (
+        await db.execute(
+            select(Scene, Chapter)
+            .join(Chapter, Scene.chapter_id == Chapter.id)
+            .where(Chapter.novel_id == novel_id, Scene.summary.isnot(None))
+        )
+    ).all()
+    return {
+        "lore": await index_lore(lores, timeout=0),
+        "summaries": await _upsert(await _missing_summaries(novel_id, summary_rows), "scene_summary", timeout=0),
+        "pruned": await _prune(novel_id, "character", [])
+        + await _prune(novel_id, "lore", [lore_doc_id(l.id) for l in lores]),
+    }
+
+
+async def backfill_all(db: AsyncSession, novel_ids: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, int]]:
+    """对指定（默认全部）小说执行 backfill_novel，返回 {novel_id: 写入条数}"""
+    if not novel_ids:
+        novel_ids = (await db.execute(select(Novel.id))).scalars().all()
+    report = {}
+    for novel_id in novel_ids:
+        report[novel_id] = await backfill_novel(novel_id, db)
+        logger.info("Backfilled RAG novel=%s %s", novel_id, report[novel_id])
+    return report
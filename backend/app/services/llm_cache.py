@@ -0,0 +1,249 @@
+"""Content-addressed LLM response cache (memory LRU + SQLite tier)."""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMResponseCache:
+    """Two-tier cache for deterministic LLM calls.
+
+    Keys are derived from the model, a hash of the prompt and the sampling
+    parameters, so the same prompt against a different model or temperature
+    never collides.  The memory tier is a bounded LRU; the optional SQLite tier
+    survives restarts and is bounded by TTL and entry count.
+
+    In async code use :meth:`aget` / :meth:`aset`: the memory tier is checked
+    on the event loop and only the SQLite tier runs in a worker thread.  Disk
+    hits do not write; their access times are buffered and flushed in batches.
+    """
+
+    _EVICT_EVERY = 50
+    _TOUCH_BATCH = 50
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        memory_items: int = 512,
+        max_entries: int = 5000,
+        ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        # _lock 只保护内存层与统计（在事件循环上持有极短）；_db_lock 串行化 SQLite 连接
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._writes_since_evict = 0
+        self.reset_stats()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = json.dumps(
+            {"model": model, "prompt": prompt_hash, "params": params or {}},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def reset_stats(self) -> None:
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "writes": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / total, 4) if total else 0.0,
+            "memory_size": len(self._memory),
+        }
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed ON llm_cache (accessed_at)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, created_at: float, value: str) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return entry[1]
+            if entry:
+                del self._memory[key]
+            return None
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        """读 SQLite 层，返回 (created_at, value)；命中只登记访问时间，攒批写回"""
+        with self._db_lock:
+            try:
+                conn = self._db()
+                if conn is None:
+                    return None
+                row = conn.execute(
+                    "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                if not row:
+                    return None
+                self._touched[key] = now
+                if len(self._touched) >= self._TOUCH_BATCH:
+                    self._flush_touched(conn)
+                    conn.commit()
+                return row[1], row[0]
+            except sqlite3.Error:
+                logger.exception("LLM cache read failed")
+                return None
+
+    def _disk_set(self, key: str, value: str, now: float) -> None:
+        with self._db_lock:
+            try:
+                conn = self._db()
+                if conn is None:
+                    return
+                self._flush_touched(conn)
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                conn.commit()
+                self._writes_since_evict += 1
+                if self._writes_since_evict >= self._EVICT_EVERY:
+                    self._evict(conn, now)
+            except sqlite3.Error:
+                logger.exception("LLM cache write failed")
+
+    def _flush_touched(self, conn: sqlite3.Connection) -> None:
+        """把攒下的访问时间一次写回（调用方负责 commit）"""
+        if self._touched:
+            conn.executemany(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _record(self, key: str, row: Optional[tuple]) -> Optional[str]:
+        with self._lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._remember(key, row[0], row[1])
+            self._stats["hits"] += 1
+            self._stats["disk_hits"] += 1
+            return row[1]
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        return self._record(key, self._disk_get(key, now) if self.path else None)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """同 get，但 SQLite 层在线程池中读，不阻塞事件循环"""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        row = await asyncio.to_thread(self._disk_get, key, now) if self.path else None
+        return self._record(key, row)
+
+    def _set_memory(self, key: str, value: str, now: float) -> None:
+        with self._lock:
+            self._remember(key, now, value)
+            self._stats["writes"] += 1
+
+    def set(self, key: str, value: str) -> None:
+        if not value:
+            return
+        now = time.time()
+        self._set_memory(key, value, now)
+        if self.path:
+            self._disk_set(key, value, now)
+
+    async def aset(self, key: str, value: str) -> None:
+        """同 set，但 SQLite 写入在线程池中执行"""
+        if not value:
+            return
+        now = time.time()
+        self._set_memory(key, value, now)
+        if self.path:
+            await asyncio.to_thread(self._disk_set, key, value, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        self._writes_since_evict = 0
+        self._flush_touched(conn)
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        conn.commit()
+
+    def evict(self) -> None:
+        """Apply TTL and size limits to the SQLite tier immediately."""
+        with self._db_lock:
+            conn = self._db()
+            if conn is not None:
+                self._evict(conn, time.time())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock:
+            self._touched.clear()
+            conn = self._db()
+            if conn is not None:
+                conn.execute("DELETE FROM llm_cache")
+                conn.commit()
+
+
+llm_response_cache = LLMResponseCache(
+    path=settings.llm_cache_path or None,
+    memory_items=settings.llm_cache_memory_items,
+    max_entries=settings.llm_cache_max_entries,
+    ttl_seconds=settings.llm_cache_ttl_seconds,
+)
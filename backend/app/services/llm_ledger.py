@@ -0,0 +1,330 @@
+"""Per-call-site ledger of LLM token usage, latency and cost."""
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager, suppress
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.logging import get_logger
+from app.services.tokens import estimate_tokens
+
+logger = get_logger(__name__)
+
+
+def cached_tokens_of(usage: Dict[str, Any]) -> int:
+    """Prompt tokens served from the provider's prefix cache, in any of the common usage layouts."""
+    # OpenAI: prompt_tokens_details.cached_tokens；LangChain: input_token_details.cache_read；DeepSeek: prompt_cache_hit_tokens
+    details = usage.get("prompt_tokens_details") or usage.get("input_token_details") or {}
+    cached = details.get("cached_tokens", details.get("cache_read"))
+    if cached is None:
+        cached = usage.get("prompt_cache_hit_tokens")
+    try:
+        return int(cached or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class LLMCallTrace:
+    """Measurements for a single upstream LLM call.
+
+    Prompt/completion tokens start out as local estimates and are replaced by
+    the provider's ``usage`` block when one is reported.
+    """
+
+    __slots__ = (
+        "call_site", "model", "stream", "queue_wait", "prompt_tokens", "completion_tokens",
+        "cached_tokens", "usage_reported", "status", "error", "ttft", "latency", "created_at", "_started_at",
+    )
+
+    def __init__(self, call_site: str, model: str, prompt_tokens: int, stream: bool = False, queue_wait: float = 0.0):
+        self.call_site = call_site or "default"
+        self.model = model or "default"
+        self.stream = stream
+        self.queue_wait = queue_wait
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = 0
+        # 命中服务商前缀缓存的 prompt token 数（上游未报告时为 0）
+        self.cached_tokens = 0
+        self.usage_reported = False
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.ttft: Optional[float] = None
+        self.latency = 0.0
+        self.created_at = datetime.now(timezone.utc)
+        self._started_at = time.monotonic()
+
+    def set_usage(self, usage: Optional[Dict[str, Any]]) -> None:
+        """Take token counts from an OpenAI ``usage`` dict or LangChain ``usage_metadata``."""
+        if not usage:
+            return
+        prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+        completion = usage.get("completion_tokens", usage.get("output_tokens"))
+        if prompt is None and completion is None:
+            return
+        self.prompt_tokens = int(prompt or 0)
+        self.completion_tokens = int(completion or 0)
+        self.cached_tokens = cached_tokens_of(usage)
+        self.usage_reported = True
+
+    def add_completion(self, text: str) -> None:
+        """Accumulate a local estimate; ignored once real usage has been reported."""
+        if not self.usage_reported:
+            self.completion_tokens += estimate_tokens(text)
+
+    def mark_first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self._started_at
+
+    def finish(self, status: str = "ok", error: Optional[str] = None) -> None:
+        self.latency = time.monotonic() - self._started_at
+        self.status = status
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "call_site": self.call_site,
+            "model": self.model,
+            "stream": self.stream,
+            "status": self.status,
+            "error": self.error,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "usage_reported": self.usage_reported,
+            "queue_wait_seconds": round(self.queue_wait, 4),
+            "ttft_seconds": None if self.ttft is None else round(self.ttft, 4),
+            "latency_seconds": round(self.latency, 4),
+            "created_at": self.created_at.isoformat(),
+        }
+
+
+class _Aggregate:
+    _SAMPLES = 256
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.estimated = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost = 0.0
+        self.queue_wait = 0.0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.ttft = 0.0
+        self.ttft_count = 0
+        self.latencies: Deque[float] = deque(maxlen=self._SAMPLES)
+
+    def add(self, trace: LLMCallTrace, cost: float) -> None:
+        self.calls += 1
+        self.errors += trace.status == "error"
+        self.cancelled += trace.status == "cancelled"
+        self.estimated += not trace.usage_reported
+        self.prompt_tokens += trace.prompt_tokens
+        self.completion_tokens += trace.completion_tokens
+        self.cached_tokens += trace.cached_tokens
+        self.cost += cost
+        self.queue_wait += trace.queue_wait
+        self.latency += trace.latency
+        self.max_latency = max(self.max_latency, trace.latency)
+        self.latencies.append(trace.latency)
+        if trace.ttft is not None:
+            self.ttft += trace.ttft
+            self.ttft_count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "estimated_calls": self.estimated,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cache_hit_rate": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            "cost": round(self.cost, 6),
+            "avg_queue_wait_seconds": round(self.queue_wait / self.calls, 4) if self.calls else 0.0,
+            "avg_latency_seconds": round(self.latency / self.calls, 4) if self.calls else 0.0,
+            "p50_latency_seconds": pct(0.5),
+            "p95_latency_seconds": pct(0.95),
+            "max_latency_seconds": round(self.max_latency, 4),
+            "avg_ttft_seconds": round(self.ttft / self.ttft_count, 4) if self.ttft_count else None,
+        }
+
+
+class LLMLedger:
+    """Aggregate LLM calls by (call site, model) and optionally persist them.
+
+    ``prices`` maps a model name to ``{"prompt": x, "completion": y}`` in cost
+    units per 1K tokens (optionally ``"cached_prompt"`` for prefix-cache hits);
+    models without a price count as zero cost.  With
+    ``persist=True`` finished calls are buffered and written to the
+    ``llm_call_ledger`` table by :meth:`flush` (driven by a background task
+    started with :meth:`start`).
+    """
+
+    def __init__(
+        self,
+        prices: Optional[Dict[str, Dict[str, float]]] = None,
+        persist: bool = False,
+        recent_items: int = 200,
+    ):
+        self.prices = dict(prices or {})
+        self.persist = persist
+        self._groups: Dict[Tuple[str, str], _Aggregate] = {}
+        self._recent: Deque[LLMCallTrace] = deque(maxlen=recent_items)
+        self._pending: List[LLMCallTrace] = []
+        self._flusher: Optional[asyncio.Task] = None
+
+    def cost_of(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        price = self.prices.get(model)
+        if not price:
+            return 0.0
+        prompt_price = price.get("prompt", 0.0)
+        cached_tokens = min(cached_tokens, prompt_tokens)
+        return (
+            (prompt_tokens - cached_tokens) * prompt_price
+            + cached_tokens * price.get("cached_prompt", prompt_price)
+            + completion_tokens * price.get("completion", 0.0)
+        ) / 1000.0
+
+    @contextmanager
+    def trace(
+        self,
+        call_site: str,
+        model: str,
+        prompt_tokens: int = 0,
+        stream: bool = False,
+        queue_wait: float = 0.0,
+    ) -> Iterator[LLMCallTrace]:
+        """Measure one upstream call; the trace is recorded however the block exits.
+
+        ``prompt_tokens`` is a local estimate used until the provider reports usage.
+        """
+        trace = LLMCallTrace(call_site, model, prompt_tokens, stream=stream, queue_wait=queue_wait)
+        try:
+            yield trace
+        except (asyncio.CancelledError, GeneratorExit):
+            # 流被调用方提前关闭（如客户端断开）也计入账本
+            trace.finish("cancelled")
+            raise
+        except Exception as exc:
+            trace.finish("error", str(exc)[:500])
+            raise
+        else:
+            trace.finish()
+        finally:
+            self.record(trace)
+
+    def record(self, trace: LLMCallTrace) -> None:
+        key = (trace.call_site, trace.model)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Aggregate()
+        group.add(trace, self.cost_of(trace.model, trace.prompt_tokens, trace.completion_tokens, trace.cached_tokens))
+        self._recent.append(trace)
+        if self.persist:
+            self._pending.append(trace)
+
+    def stats(self, recent: int = 0) -> Dict[str, Any]:
+        total = _Aggregate()
+        groups = []
+        for (call_site, model), group in sorted(self._groups.items()):
+            groups.append({"call_site": call_site, "model": model, **group.to_dict()})
+            total.calls += group.calls
+            total.errors += group.errors
+            total.cancelled += group.cancelled
+            total.estimated += group.estimated
+            total.prompt_tokens += group.prompt_tokens
+            total.completion_tokens += group.completion_tokens
+            total.cached_tokens += group.cached_tokens
+            total.cost += group.cost
+            total.queue_wait += group.queue_wait
+            total.latency += group.latency
+            total.max_latency = max(total.max_latency, group.max_latency)
+            total.ttft += group.ttft
+            total.ttft_count += group.ttft_count
+        totals = total.to_dict()
+        # 分位数只在单个分组内有意义
+        totals.pop("p50_latency_seconds")
+        totals.pop("p95_latency_seconds")
+        result: Dict[str, Any] = {"totals": totals, "groups": groups, "persist": self.persist}
+        if recent > 0:
+            result["recent"] = [t.to_dict() for t in list(self._recent)[-recent:]]
+        return result
+
+    def reset(self) -> None:
+        self._groups.clear()
+        self._recent.clear()
+
+    async def flush(self) -> int:
+        """Write buffered calls to the ledger table; returns the number of rows written."""
+        if not self._pending:
+            return 0
+        from app.database import AsyncSessionLocal
+        from app.models.llm_call import LLMCallRecord
+
+        batch, self._pending = self._pending, []
+        rows = [
+            LLMCallRecord(
+                call_site=t.call_site,
+                model=t.model,
+                stream=t.stream,
+                status=t.status,
+                error=t.error,
+                prompt_tokens=t.prompt_tokens,
+                completion_tokens=t.completion_tokens,
+                cached_tokens=t.cached_tokens,
+                usage_reported=t.usage_reported,
+                cost=self.cost_of(t.model, t.prompt_tokens, t.completion_tokens, t.cached_tokens),
+                queue_wait=t.queue_wait,
+                ttft=t.ttft,
+                latency=t.latency,
+                created_at=t.created_at,
+            )
+            for t in batch
+        ]
+        try:
+            async with AsyncSessionLocal() as db:
+                db.add_all(rows)
+                await db.commit()
+        except Exception:
+            logger.exception("Failed to persist %s LLM ledger rows", len(rows))
+            return 0
+        return len(rows)
+
+    def start(self, interval: float) -> None:
+        if not self.persist or self._flusher is not None:
+            return
+
+        async def loop():
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush()
+
+        self._flusher = asyncio.create_task(loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flusher
+            self._flusher = None
+        await self.flush()
+
+
+llm_ledger = LLMLedger(
+    prices=settings.llm_token_prices,
+    persist=settings.llm_ledger_persist,
+)
@@ -0,0 +1,228 @@
+"""Retry with jittered backoff and hedged requests for upstream LLM calls."""
+import asyncio
+import random
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+
+from app.config import settings
+from app.logging import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMAPIError(Exception):
+    """Non-200 response from an OpenAI-compatible endpoint."""
+
+    def __init__(self, status: int, body: str, retry_after: Optional[float] = None):
+        super().__init__(f"API error: {body}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, LLMAPIError):
+        return exc.status in RETRYABLE_STATUSES
+    return isinstance(exc, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    max_retry_after: float = 60.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff; a server-provided Retry-After wins."""
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def default_policy() -> RetryPolicy:
+    return RetryPolicy(
+        max_retries=settings.llm_retry_max_retries,
+        base_delay=settings.llm_retry_base_delay,
+        max_delay=settings.llm_retry_max_delay,
+    )
+
+
+async def call_with_retry(fn: Callable[[], Awaitable[T]], policy: Optional[RetryPolicy] = None) -> T:
+    policy = policy or default_policy()
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except Exception as exc:
+            if attempt >= policy.max_retries or not is_retryable(exc):
+                raise
+            delay = policy.delay(attempt, getattr(exc, "retry_after", None))
+            attempt += 1
+            logger.warning("LLM call failed (%s), retry %s/%s in %.2fs", exc, attempt, policy.max_retries, delay)
+            await asyncio.sleep(delay)
+
+
+async def stream_with_retry(
+    factory: Callable[[], AsyncIterator[str]], policy: Optional[RetryPolicy] = None
+) -> AsyncGenerator[str, None]:
+    """Retry a stream only while nothing has been yielded yet (chunks cannot be replayed)."""
+    policy = policy or default_policy()
+    attempt = 0
+    while True:
+        yielded = False
+        try:
+            async for chunk in factory():
+                yielded = True
+                yield chunk
+            return
+        except Exception as exc:
+            if yielded or attempt >= policy.max_retries or not is_retryable(exc):
+                raise
+            delay = policy.delay(attempt, getattr(exc, "retry_after", None))
+            attempt += 1
+            logger.warning("LLM stream failed (%s), retry %s/%s in %.2fs", exc, attempt, policy.max_retries, delay)
+            await asyncio.sleep(delay)
+
+
+async def _cancel(task: "asyncio.Future") -> None:
+    task.cancel()
+    with suppress(BaseException):
+        await task
+
+
+async def _until_admitted(primary: "asyncio.Future", admitted: Optional[asyncio.Event]) -> None:
+    """等主请求拿到调度名额（或提前结束）；对冲计时从放行之后开始，排队时间不算"""
+    if admitted is None or admitted.is_set():
+        return
+    waiter = asyncio.ensure_future(admitted.wait())
+    try:
+        await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        await _cancel(waiter)
+
+
+async def hedged_call(
+    fn: Callable[[], Awaitable[T]],
+    hedge_after: float,
+    hedge: Optional[Callable[[], Awaitable[T]]] = None,
+    admitted: Optional[asyncio.Event] = None,
+) -> T:
+    """Fire a second identical request if the first has not finished within ``hedge_after`` seconds.
+
+    Whichever attempt succeeds first wins and the other is cancelled.  If one
+    attempt fails, the other one is still awaited.  ``hedge`` (default ``fn``)
+    starts the second attempt; when ``admitted`` is given the clock starts
+    only once the first attempt has set it, so queueing never triggers a hedge.
+    """
+    if hedge_after <= 0:
+        return await fn()
+
+    primary = asyncio.ensure_future(fn())
+    await _until_admitted(primary, admitted)
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    logger.info("LLM call slower than %.2fs, sending hedged request", hedge_after)
+    pending = {primary, asyncio.ensure_future((hedge or fn)())}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            await _cancel(task)
+
+
+async def hedged_stream(
+    factory: Callable[[], AsyncIterator[str]],
+    hedge_after: float,
+    hedge: Optional[Callable[[], AsyncIterator[str]]] = None,
+    admitted: Optional[asyncio.Event] = None,
+) -> AsyncGenerator[str, None]:
+    """Hedge on time-to-first-token: race a second stream if the first chunk is late.
+
+    ``hedge`` and ``admitted`` work as in :func:`hedged_call`.
+    """
+    if hedge_after <= 0:
+        async for chunk in factory():
+            yield chunk
+        return
+
+    streams = {}
+
+    def start(make: Callable[[], AsyncIterator[str]]) -> "asyncio.Future":
+        agen = make().__aiter__()
+        task = asyncio.ensure_future(agen.__anext__())
+        streams[task] = agen
+        return task
+
+    primary = start(factory)
+    pending = {primary}
+    winner = None
+    first_chunk = None
+    exhausted = False
+    error: Optional[BaseException] = None
+    try:
+        await _until_admitted(primary, admitted)
+        done, _ = await asyncio.wait(pending, timeout=hedge_after)
+        if not done:
+            logger.info("No first token after %.2fs, sending hedged stream", hedge_after)
+            pending.add(start(hedge or factory))
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                exc = task.exception()
+                if exc is None:
+                    winner, first_chunk = streams.pop(task), task.result()
+                    break
+                if isinstance(exc, StopAsyncIteration):
+                    winner, exhausted = streams.pop(task), True
+                    break
+                error = error or exc
+    finally:
+        # 胜出者已从 streams 中取出，剩下的都是失败者或被取消的对冲请求
+        for task, agen in streams.items():
+            await _cancel(task)
+            await agen.aclose()
+
+    if winner is None:
+        raise error
+    try:
+        if exhausted:
+            return
+        yield first_chunk
+        async for chunk in winner:
+            yield chunk
+    finally:
+        await winner.aclose()
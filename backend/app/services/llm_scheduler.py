@@ -0,0 +1,244 @@
+"""Global priority-aware admission control for LLM calls."""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMPriority(IntEnum):
+    """Lower value is admitted first."""
+
+    INTERACTIVE = 0  # 用户正在等待的流式写作/对话
+    EDITORIAL = 1  # 审稿委员会
+    BACKGROUND = 2  # 摘要、状态/关系分析等后台任务
+    BATCH = 3  # 批量/离线任务
+
+
+class TokenBucket:
+    """Per-minute rate bucket; ``rate_per_minute <= 0`` means unlimited."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.capacity / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken (0 if available now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        # 单次请求超过桶容量时按满桶放行，避免永久阻塞
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def charge(self, amount: float) -> None:
+        """Debit usage known only after the call (may go negative)."""
+        if self.unlimited or amount <= 0:
+            return
+        self._refill()
+        self.tokens -= amount
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "future", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _ModelLane:
+    def __init__(self, model: str, limit: int, rpm: int, tpm: int):
+        self.model = model
+        self.limit = max(1, limit)
+        self.active = 0
+        self.heap: List[_Waiter] = []
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.admitted = {p.name.lower(): 0 for p in LLMPriority}
+        self.total_wait = 0.0
+
+
+class Slot:
+    """Admission ticket returned by :meth:`LLMScheduler.slot`."""
+
+    def __init__(self, scheduler: "LLMScheduler", lane: _ModelLane, priority: int, wait_seconds: float):
+        self._scheduler = scheduler
+        self._lane = lane
+        self.priority = priority
+        self.wait_seconds = wait_seconds
+
+    def charge_tokens(self, tokens: int) -> None:
+        """Record completion tokens against the model's token-per-minute budget."""
+        self._lane.tokens.charge(tokens)
+
+
+class LLMScheduler:
+    """Admit LLM calls per model by priority under concurrency and rate limits.
+
+    Each model gets a lane with a concurrency cap plus request-per-minute and
+    token-per-minute buckets.  Waiters are kept in a heap ordered by
+    (priority, arrival), so queued interactive work is always admitted ahead of
+    queued background or batch work.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        rpm_limit: int = 0,
+        tpm_limit: int = 0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = dict(model_concurrency or {})
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self._lanes: Dict[str, _ModelLane] = {}
+        self._seq = itertools.count()
+
+    def _lane(self, model: str) -> _ModelLane:
+        key = model or "default"
+        lane = self._lanes.get(key)
+        if lane is None:
+            limit = self.model_concurrency.get(key, self.max_concurrency)
+            lane = _ModelLane(key, limit, self.rpm_limit, self.tpm_limit)
+            self._lanes[key] = lane
+        return lane
+
+    def _dispatch(self, lane: _ModelLane) -> None:
+        if lane.timer is not None:
+            lane.timer.cancel()
+            lane.timer = None
+        while lane.heap and lane.active < lane.limit:
+            waiter = lane.heap[0]
+            if waiter.future.done():  # 已取消的等待者
+                heapq.heappop(lane.heap)
+                continue
+            delay = max(lane.requests.wait_time(1), lane.tokens.wait_time(waiter.tokens))
+            if delay > 0:
+                loop = asyncio.get_running_loop()
+                lane.timer = loop.call_later(delay, self._dispatch, lane)
+                return
+            heapq.heappop(lane.heap)
+            self._admit(lane, waiter.priority, waiter.tokens)
+            waiter.future.set_result(time.monotonic() - waiter.enqueued_at)
+
+    def _admit(self, lane: _ModelLane, priority: int, tokens: int) -> None:
+        lane.requests.take(1)
+        lane.tokens.take(tokens)
+        lane.active += 1
+        lane.admitted[LLMPriority(priority).name.lower()] += 1
+
+    def _release(self, lane: _ModelLane) -> None:
+        lane.active -= 1
+        self._dispatch(lane)
+
+    async def acquire(self, model: str, priority: int, tokens: int = 0) -> float:
+        """Wait for admission; returns the seconds spent queued."""
+        lane = self._lane(model)
+        if (
+            not lane.heap
+            and lane.active < lane.limit
+            and lane.requests.wait_time(1) == 0
+            and lane.tokens.wait_time(tokens) == 0
+        ):
+            self._admit(lane, priority, tokens)
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.heap, _Waiter(int(priority), next(self._seq), tokens, future))
+        self._dispatch(lane)
+        try:
+            waited = await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已被放行但调用方取消，归还名额
+                self._release(lane)
+            raise
+        lane.total_wait += waited
+        return waited
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        model: str,
+        priority: int = LLMPriority.INTERACTIVE,
+        tokens: int = 0,
+    ) -> AsyncIterator[Slot]:
+        waited = await self.acquire(model, priority, tokens)
+        lane = self._lane(model)
+        try:
+            yield Slot(self, lane, int(priority), waited)
+        finally:
+            self._release(lane)
+
+    def admission(
+        self, model: str, priority: int = LLMPriority.INTERACTIVE, tokens: int = 0
+    ) -> Callable[[], AsyncContextManager[Slot]]:
+        """返回每次上游尝试调用一次的名额工厂：重试与对冲请求各自排队、各自计入 RPM/TPM"""
+        return lambda: self.slot(model, priority, tokens)
+
+    def charge_tokens(self, model: str, tokens: int) -> None:
+        """调用结束后按实际输出 token 扣减该模型的 TPM 桶"""
+        self._lane(model).tokens.charge(tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {}
+        for name, lane in self._lanes.items():
+            queued = {p.name.lower(): 0 for p in LLMPriority}
+            for waiter in lane.heap:
+                if not waiter.future.done():
+                    queued[LLMPriority(waiter.priority).name.lower()] += 1
+            lanes[name] = {
+                "limit": lane.limit,
+                "active": lane.active,
+                "queued": queued,
+                "admitted": dict(lane.admitted),
+                "total_wait_seconds": round(lane.total_wait, 3),
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rpm_limit": self.rpm_limit,
+            "tpm_limit": self.tpm_limit,
+            "models": lanes,
+        }
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.llm_max_concurrency,
+    model_concurrency=settings.llm_model_concurrency,
+    rpm_limit=settings.llm_rpm_limit,
+    tpm_limit=settings.llm_tpm_limit,
+)
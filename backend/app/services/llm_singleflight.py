@@ -0,0 +1,124 @@
+"""Single-flight coalescing of identical in-flight LLM requests."""
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class _Call:
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional["asyncio.Task"] = None
+
+    def notify(self) -> None:
+        # 唤醒当前所有等待者，并为下一轮等待换一个新的 Event
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """Share one upstream request between callers that ask for the same key.
+
+    ``do`` coalesces awaitables: while a call for ``key`` is running, later
+    callers await the same task.  ``stream`` coalesces async iterators: later
+    subscribers replay the chunks received so far and then follow the live
+    stream.  The upstream work is cancelled only once every waiter has gone.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self._stats = {"leaders": 0, "coalesced": 0, "stream_leaders": 0, "stream_coalesced": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "in_flight": len(self._calls),
+            "streams_in_flight": len(self._streams),
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget_call(k, c))
+            self._stats["leaders"] += 1
+        else:
+            self._stats["coalesced"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget_call(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def stream(
+        self, key: str, factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncGenerator[str, None]:
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream()
+            self._streams[key] = shared
+            shared.task = asyncio.ensure_future(self._pump(key, shared, factory))
+            self._stats["stream_leaders"] += 1
+        else:
+            self._stats["stream_coalesced"] += 1
+
+        shared.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(shared.chunks):
+                    pending = shared.chunks[index:]
+                    index += len(pending)
+                    for chunk in pending:
+                        yield chunk
+                    continue
+                if shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                await shared.changed.wait()
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and shared.task and not shared.task.done():
+                shared.task.cancel()
+
+    async def _pump(
+        self, key: str, shared: _SharedStream, factory: Callable[[], AsyncIterator[str]]
+    ) -> None:
+        try:
+            async for chunk in factory():
+                shared.chunks.append(chunk)
+                shared.notify()
+        except asyncio.CancelledError:
+            shared.error = asyncio.CancelledError()
+            raise
+        except Exception as exc:
+            shared.error = exc
+        finally:
+            shared.done = True
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+            shared.notify()
+
+
+llm_single_flight = SingleFlight()
@@ -6,8 +6,9 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import Chapter, Character, Lore, Novel, Scene
-from app.rag import rag_service
+from app.rag import async_rag
 from app.services import outline_generator
+from app.services.knowledge_index import index_lore, remove_lore
 
 
 async def _get_novel_or_404(novel_id: str, db: AsyncSession) -> Novel:
@@ -18,13 +19,21 @@ async def _get_novel_or_404(novel_id: str, db: AsyncSession) -> Novel:
     return novel
 
 
-async def get_rag_summaries_for_novel(novel_id: str, db: AsyncSession) -> list[dict]:
-    """Return all RAG scene summaries for a novel."""
+async def get_rag_summaries_for_novel(
+    novel_id: str,
+    db: AsyncSession,
+    limit: int = 100,
+    offset: int = 0,
+    include_text: bool = True,
+) -> dict:
+    """Return one page of RAG scene summaries for a novel."""
     await _get_novel_or_404(novel_id, db)
-    return rag_service.retrieve_all_by_novel(
-        novel_id=novel_id,
-        type="scene_summary",
-        top_k=100,
+    return await async_rag.list_by_novel(
+        novel_id,
+        "scene_summary",
+        limit=limit,
+        offset=offset,
+        include_documents=include_text,
     )
 
 
@@ -37,13 +46,13 @@ async def update_rag_summary_for_novel(
     """Update one RAG summary while preserving metadata."""
     await _get_novel_or_404(novel_id, db)
 
-    all_summaries = rag_service.retrieve_all_by_novel(novel_id, "scene_summary", top_k=1000)
-    target_doc = next((item for item in all_summaries if item["id"] == doc_id), None)
-    if not target_doc:
+    found = await async_rag.get_by_ids([doc_id], "scene_summary", novel_id=novel_id, include_documents=False)
+    if not found:
         raise HTTPException(status_code=404, detail="Summary not found")
+    target_doc = found[0]
 
     metadata = target_doc.get("metadata", {})
-    rag_service.add_knowledge(
+    await async_rag.add_knowledge(
         text=text,
         doc_id=doc_id,
         type="scene_summary",
@@ -59,7 +68,7 @@ async def delete_rag_summary_for_novel(
 ) -> dict[str, str]:
     """Delete one RAG summary for a novel."""
     await _get_novel_or_404(novel_id, db)
-    rag_service.delete_knowledge(doc_id, "scene_summary")
+    await async_rag.delete_knowledge(doc_id, "scene_summary", novel_id=novel_id)
     return {"message": "Summary deleted"}
 
 
@@ -161,10 +170,13 @@ async def generate_novel_outline_for_novel(
         await db.delete(character)
 
     existing_lore = await db.execute(select(Lore).where(Lore.novel_id == novel_id))
+    removed_lore_ids = []
     for lore in existing_lore.scalars().all():
+        removed_lore_ids.append(lore.id)
         await db.delete(lore)
 
     await db.commit()
+    await remove_lore(removed_lore_ids, novel_id)
 
     try:
         outline_data = await outline_generator.generate_outline(
@@ -211,4 +223,7 @@ async def generate_novel_outline_for_novel(
     for lore in created_lore:
         await db.refresh(lore)
 
+    # 新设定一次批量写入向量库，供场景写作检索
+    await index_lore(created_lore)
+
     return created_chapters
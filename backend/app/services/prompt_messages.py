@@ -0,0 +1,45 @@
+"""Role-separated chat messages laid out for provider-side prompt-prefix caching.
+
+Providers that cache prompt prefixes (OpenAI, DeepSeek, Moonshot, ...) only
+hit when the leading bytes of the request are identical.  Prompts are
+therefore laid out as: fixed instructions, then content that is stable for a
+whole novel, then the per-call data, so that everything before the last
+message is byte-identical across calls for the same novel.
+"""
+from typing import Dict, List, Union
+
+Messages = List[Dict[str, str]]
+# LLMClient / OpenAICompatClient 接受单条字符串（作为一条 user 消息）或完整消息列表
+Prompt = Union[str, Messages]
+
+
+def to_messages(prompt: Prompt) -> Messages:
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return [{"role": m["role"], "content": m["content"]} for m in prompt]
+
+
+def prompt_text(prompt: Prompt) -> str:
+    """Flatten a prompt for token estimates, cache keys and the offline fake.
+
+    A plain string is returned unchanged so existing cache keys stay valid.
+    """
+    if isinstance(prompt, str):
+        return prompt
+    return "\n\n".join(f"[{m['role']}]\n{m['content']}" for m in prompt)
+
+
+def layered_messages(instructions: str, stable: str = "", volatile: str = "") -> Messages:
+    """System message = instructions + stable context; user message = per-call data.
+
+    ``instructions`` and ``stable`` must be built deterministically (no
+    timestamps, ids or dict-order dependent output) for the prefix to be
+    cacheable.
+    """
+    system = instructions.strip()
+    if stable.strip():
+        system += "\n\n" + stable.strip()
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": volatile.strip()},
+    ]
@@ -1,12 +1,15 @@
 import json
 from typing import Optional, Dict, List, Any
 from app.services.generator import llm_client
+from app.services.llm_scheduler import LLMPriority
+from app.services.think_filter import strip_think
 from app.models import Character, Relationship
 
 async def analyze_relationships(
     content: str, 
     characters: List[Character], 
-    existing_relationships: Dict[str, Relationship]
+    existing_relationships: Dict[str, Relationship],
+    cache: bool = True,
 ) -> List[Dict[str, Any]]:
     """
     分析场景内容，更新角色关系
@@ -15,6 +18,7 @@ async def analyze_relationships(
         content: 场景正文
         characters: 参与场景的角色列表
         existing_relationships: 现有的关系字典，key为 "id_a:id_b" (id_a < id_b)
+        cache: 相同输入时是否复用缓存的 LLM 响应
         
     Returns:
         List of updates: [{"char_a_id": str, "char_b_id": str, "affinity_change": int, "new_conflict": str}]
@@ -74,12 +78,13 @@ async def analyze_relationships(
 如果无变化，输出空列表 []。
 """
     
-    response = await llm_client.generate(prompt)
+    response = await llm_client.generate(
+        prompt, cache=cache, priority=LLMPriority.BACKGROUND, call_site="relationship_analysis"
+    )
     
     try:
         # Cleanup response if it contains <think> tags
-        import re
-        cleaned_response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
+        cleaned_response = strip_think(response, strip_bold=False).strip()
         
         # Cleanup response if it contains markdown code blocks
         if cleaned_response.startswith("```json"):
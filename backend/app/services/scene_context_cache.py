@@ -0,0 +1,206 @@
+"""Read-through cache for assembled scene context, invalidated by dependency tags.
+
+A scene's writing context depends on a handful of rows: the scene itself,
+the summaries of earlier scenes (possibly in the previous chapter), the
+chapter order, the novel premise, the present characters, their
+relationships and the indexed lore.  Each cached entry records the tags of
+what it was built from; committed ORM changes and lore (re)indexing bump
+those tags, and an entry is served only while none of its tags moved.
+
+Tags are versioned with a logical clock: a build notes the clock before it
+starts reading, and an entry is valid only if every tag was last bumped
+before that point, so a build that raced with a commit never caches stale
+data.
+"""
+import copy
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Chapter, Character, Novel, Relationship, Scene
+
+# 影响上下文的字段：其余字段（如正文 content、状态）变化不失效
+_SCENE_SELF_FIELDS = ("chapter_id", "order_index", "characters_present", "beat_description", "location")
+_SCENE_CHAPTER_FIELDS = ("chapter_id", "order_index", "summary")
+_CHAPTER_FIELDS = ("novel_id", "order_index")
+_CHARACTER_FIELDS = ("name", "bio", "personality", "power_state")
+_RELATIONSHIP_FIELDS = ("character_a_id", "character_b_id", "affinity_score", "core_conflict")
+
+_PENDING_KEY = "scene_context_tags"
+
+
+def scene_tag(scene_id: str) -> str:
+    return f"scene:{scene_id}"
+
+
+def chapter_scenes_tag(chapter_id: str) -> str:
+    """章节内场景的增删、排序或摘要变化"""
+    return f"chapter_scenes:{chapter_id}"
+
+
+def chapter_order_tag(novel_id: str) -> str:
+    """小说内章节的增删或排序变化"""
+    return f"chapter_order:{novel_id}"
+
+
+def novel_tag(novel_id: str) -> str:
+    return f"novel:{novel_id}"
+
+
+def character_tag(character_id: str) -> str:
+    return f"character:{character_id}"
+
+
+def relationship_tag(character_id: str) -> str:
+    return f"relationship:{character_id}"
+
+
+def lore_tag(novel_id: Optional[str] = None) -> str:
+    """novel_id 为空表示不知归属的设定变更，所有小说的上下文都依赖它"""
+    return f"lore:{novel_id}" if novel_id else "lore"
+
+
+class SceneContextCache:
+    """Bounded LRU of ``scene_id -> (built_at, tags, context)`` with tag versioning."""
+
+    def __init__(self, max_items: int = 1024):
+        self.max_items = max_items
+        self._entries: "OrderedDict[str, Tuple[int, frozenset, Dict[str, Any]]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._clock = itertools.count(1)
+        self._now = 0
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / total, 4) if total else 0.0,
+            "size": len(self._entries),
+        }
+
+    def clock(self) -> int:
+        """构建上下文前调用，记下开始读取时的逻辑时间"""
+        with self._lock:
+            return self._now
+
+    def get(self, scene_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(scene_id)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            built_at, tags, context = entry
+            if any(self._versions.get(tag, 0) > built_at for tag in tags):
+                del self._entries[scene_id]
+                self._stats["misses"] += 1
+                self._stats["stale"] += 1
+                return None
+            self._entries.move_to_end(scene_id)
+            self._stats["hits"] += 1
+            return copy.deepcopy(context)
+
+    def put(self, scene_id: str, context: Dict[str, Any], tags: Iterable[str], built_at: int) -> None:
+        tags = frozenset(tags)
+        with self._lock:
+            # 构建期间依赖已变化：结果可能基于旧数据，不缓存
+            if any(self._versions.get(tag, 0) > built_at for tag in tags):
+                return
+            self._entries[scene_id] = (built_at, tags, copy.deepcopy(context))
+            self._entries.move_to_end(scene_id)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        tags = set(tags)
+        if not tags:
+            return
+        with self._lock:
+            self._now = next(self._clock)
+            for tag in tags:
+                self._versions[tag] = self._now
+            self._stats["invalidations"] += len(tags)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def _changed(obj: Any, fields: Iterable[str]) -> Tuple[bool, Dict[str, set]]:
+    """返回 (关注字段是否有变化, {字段: 新旧取值})"""
+    state = inspect(obj)
+    changed = False
+    values: Dict[str, set] = {}
+    for name in fields:
+        history = state.attrs[name].history
+        if history.has_changes():
+            changed = True
+        values[name] = {v for v in (*history.added, *history.unchanged, *history.deleted) if isinstance(v, str)}
+    return changed, values
+
+
+def tags_for(obj: Any, is_new_or_deleted: bool) -> set:
+    """一个 ORM 对象的增删改会影响哪些上下文依赖标签"""
+    tags: set = set()
+    if isinstance(obj, Scene):
+        self_changed, _ = _changed(obj, _SCENE_SELF_FIELDS)
+        chapter_changed, values = _changed(obj, _SCENE_CHAPTER_FIELDS)
+        if is_new_or_deleted or self_changed:
+            tags.add(scene_tag(obj.id))
+        if is_new_or_deleted or chapter_changed:
+            tags.update(chapter_scenes_tag(c) for c in values["chapter_id"])
+    elif isinstance(obj, Chapter):
+        changed, values = _changed(obj, _CHAPTER_FIELDS)
+        if is_new_or_deleted or changed:
+            tags.update(chapter_order_tag(n) for n in values["novel_id"])
+    elif isinstance(obj, Novel):
+        if is_new_or_deleted or _changed(obj, ("premise",))[0]:
+            tags.add(novel_tag(obj.id))
+    elif isinstance(obj, Character):
+        if is_new_or_deleted or _changed(obj, _CHARACTER_FIELDS)[0]:
+            tags.add(character_tag(obj.id))
+    elif isinstance(obj, Relationship):
+        changed, values = _changed(obj, _RELATIONSHIP_FIELDS)
+        if is_new_or_deleted or changed:
+            tags.update(relationship_tag(c) for c in values["character_a_id"] | values["character_b_id"])
+    return tags
+
+
+def mark_changed(session: Any, *tags: str) -> None:
+    """登记无法从 ORM 对象推断的变更（如批量 delete 语句），在提交后失效"""
+    sync_session = getattr(session, "sync_session", session)
+    sync_session.info.setdefault(_PENDING_KEY, set()).update(tags)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_tags(session: Session, flush_context: Any) -> None:
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for obj in session.new:
+        pending |= tags_for(obj, True)
+    for obj in session.deleted:
+        pending |= tags_for(obj, True)
+    for obj in session.dirty:
+        pending |= tags_for(obj, False)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    # 提交后才失效：提交前其他会话仍读到旧数据，提前失效会让旧数据重新入缓存
+    scene_context_cache.invalidate(session.info.pop(_PENDING_KEY, ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+scene_context_cache = SceneContextCache(max_items=settings.scene_context_cache_items)
@@ -1,7 +1,6 @@
 """Scene image generation service."""
 import asyncio
 import json
-import re
 from typing import Any, Optional
 
 import aiohttp
@@ -9,6 +8,10 @@ import aiohttp
 from app.config import settings
 from app.logging import get_logger
 from app.services.generator import OpenAICompatClient
+from app.services.llm_ledger import llm_ledger
+from app.services.llm_scheduler import LLMPriority, llm_scheduler
+from app.services.think_filter import strip_think
+from app.services.tokens import estimate_tokens
 
 logger = get_logger(__name__)
 
@@ -33,7 +36,7 @@ Do not output anything else but the JSON array.
 
 def _parse_prompt_list(raw_response: str) -> list[str]:
     cleaned = raw_response.strip()
-    cleaned = re.sub(r"<think>.*?</think>", "", cleaned, flags=re.DOTALL).strip()
+    cleaned = strip_think(cleaned, strip_bold=False).strip()
 
     if "```json" in cleaned:
         cleaned = cleaned.split("```json")[1].split("```")[0].strip()
@@ -61,7 +64,11 @@ async def _generate_storyboard_prompts(
     prompt_text = _build_storyboard_prompt(scene_text)
 
     try:
-        response = await client.generate(prompt_text)
+        prompt_tokens = estimate_tokens(prompt_text)
+        admit = llm_scheduler.admission(client.model, LLMPriority.INTERACTIVE, prompt_tokens)
+        with llm_ledger.trace("storyboard", client.model, prompt_tokens) as trace:
+            response = await client.generate(prompt_text, trace=trace, admit=admit)
+            trace.add_completion(response)
         prompts = _parse_prompt_list(response)
         if prompts:
             return prompts
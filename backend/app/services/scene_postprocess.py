@@ -1,10 +1,12 @@
 """Scene post-processing services."""
+import asyncio
+
 from sqlalchemy import and_, select
 
 from app.database import AsyncSessionLocal
 from app.logging import get_logger
 from app.models import Chapter, Character, Novel, Relationship, Scene
-from app.rag import rag_service
+from app.rag import async_rag
 from app.services import relationship_analyzer, state_analyzer, summarizer
 
 logger = get_logger(__name__)
@@ -32,23 +34,13 @@ async def analyze_state_and_relationships(scene_id: str) -> None:
                 logger.info("Skip analysis due to missing content/characters scene=%s", scene_id)
                 return
 
-            characters = []
-            for char_id in scene.characters_present:
-                char_result = await db.execute(select(Character).where(Character.id == char_id))
-                character = char_result.scalar_one_or_none()
-                if not character:
-                    continue
-
-                characters.append(character)
-                new_state = await state_analyzer.analyze_state(
-                    character,
-                    scene.content,
-                    genre=novel.genre or "玄幻",
-                )
-                if new_state:
-                    character.power_state = new_state
-                    db.add(character)
+            char_result = await db.execute(
+                select(Character).where(Character.id.in_(scene.characters_present))
+            )
+            by_id = {c.id: c for c in char_result.scalars().all()}
+            characters = [by_id[char_id] for char_id in scene.characters_present if char_id in by_id]
 
+            rels_map = {}
             if len(characters) >= 2:
                 char_ids = [c.id for c in characters]
                 rel_stmt = select(Relationship).where(
@@ -61,12 +53,18 @@ async def analyze_state_and_relationships(scene_id: str) -> None:
                 existing_rels = rels_result.scalars().all()
                 rels_map = {f"{rel.character_a_id}:{rel.character_b_id}": rel for rel in existing_rels}
 
-                updates = await relationship_analyzer.analyze_relationships(
-                    scene.content,
-                    characters,
-                    rels_map,
-                )
+            # 各角色状态分析与关系分析互不依赖，一次性并发提交
+            states, updates = await asyncio.gather(
+                state_analyzer.analyze_states(characters, scene.content, genre=novel.genre or "玄幻"),
+                relationship_analyzer.analyze_relationships(scene.content, characters, rels_map),
+            )
+
+            for character, new_state in zip(characters, states):
+                if new_state:
+                    character.power_state = new_state
+                    db.add(character)
 
+            if len(characters) >= 2:
                 for update in updates:
                     id_a, id_b = sorted([update["char_a_id"], update["char_b_id"]])
                     key = f"{id_a}:{id_b}"
@@ -117,7 +115,7 @@ async def summarize_scene(scene_id: str) -> None:
             scene.summary = summary
             await db.commit()
 
-            rag_service.add_knowledge(
+            await async_rag.add_knowledge(
                 text=summary,
                 doc_id=f"scene_summary_{scene_id}",
                 type="scene_summary",
@@ -149,7 +147,7 @@ async def update_scene_summary_in_rag(scene_id: str, summary: str) -> None:
                 return
 
             _, chapter = row
-            rag_service.add_knowledge(
+            await async_rag.add_knowledge(
                 text=summary,
                 doc_id=f"scene_summary_{scene_id}",
                 type="scene_summary",
@@ -4,7 +4,7 @@ from sqlalchemy import select, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import Chapter, Scene, SceneVersion
-from app.rag import rag_service
+from app.rag import async_rag
 from app.api.settings import get_llm_config_from_db
 
 MAX_SCENE_VERSIONS = 20
@@ -36,7 +36,7 @@ async def summarize_scene_content(scene_id: str, db: AsyncSession) -> dict[str,
     scene.summary = summary
     await db.commit()
 
-    rag_service.add_knowledge(
+    await async_rag.add_knowledge(
         text=summary,
         doc_id=f"scene_summary_{scene_id}",
         type="scene_summary",
@@ -1,13 +1,13 @@
 import json
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence
 from app.models import Character
 from app.services.generator import llm_client
+from app.services.llm_scheduler import LLMPriority
+from app.services.think_filter import strip_think
 
-async def analyze_state(character: Character, text: str, genre: str = "玄幻") -> Optional[Dict[str, Any]]:
-    """
-    分析文本，更新角色状态
-    """
+def build_state_prompt(character: Character, text: str, genre: str = "玄幻") -> str:
+    """构造角色状态分析 Prompt"""
     current_state = character.power_state or {}
     
     # 默认 Prompt (修仙/玄幻)
@@ -78,17 +78,64 @@ async def analyze_state(character: Character, text: str, genre: str = "玄幻")
 格式示例：
 {output_example}
 """
+    return prompt
+
+
+def parse_state_response(response: str) -> Dict[str, Any]:
+    """解析状态分析响应，失败时抛出异常"""
+    # 清理响应
+    response = strip_think(response, strip_bold=False)
+    response = re.sub(r'```json', '', response)
+    response = re.sub(r'```', '', response)
+    response = response.strip()
+
+    return json.loads(response)
+
+
+async def analyze_state(
+    character: Character,
+    text: str,
+    genre: str = "玄幻",
+    cache: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """
+    分析文本，更新角色状态；cache=True 时相同输入复用缓存的 LLM 响应
+    """
     try:
-        response = await llm_client.generate(prompt)
-        
-        # 清理响应
-        response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
-        response = re.sub(r'```json', '', response)
-        response = re.sub(r'```', '', response)
-        response = response.strip()
-        
-        new_state = json.loads(response)
-        return new_state
+        response = await llm_client.generate(
+            build_state_prompt(character, text, genre),
+            cache=cache,
+            priority=LLMPriority.BACKGROUND,
+            call_site="state_analysis",
+        )
+        return parse_state_response(response)
     except Exception as e:
         print(f"State analysis failed: {e}")
         return None
+
+
+async def analyze_states(
+    characters: Sequence[Character],
+    text: str,
+    genre: str = "玄幻",
+    cache: bool = True,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    批量分析多个角色的状态（并发请求），结果与 characters 一一对应，失败的条目为 None
+    """
+    prompts = [build_state_prompt(character, text, genre) for character in characters]
+    results = await llm_client.generate_many(
+        prompts, cache=cache, priority=LLMPriority.BACKGROUND, call_site="state_analysis"
+    )
+    states: List[Optional[Dict[str, Any]]] = []
+    for character, result in zip(characters, results):
+        if not result.ok:
+            print(f"State analysis failed for {character.name}: {result.error}")
+            states.append(None)
+            continue
+        try:
+            states.append(parse_state_response(result.content))
+        except Exception as e:
+            print(f"State analysis failed for {character.name}: {e}")
+            states.append(None)
+    return states
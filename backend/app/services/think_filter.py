@@ -0,0 +1,103 @@
+"""Incremental removal of <think>…</think> blocks and markdown bold from LLM output."""
+from typing import AsyncIterator, AsyncGenerator
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag_len(data: str, start: int, tag: str) -> int:
+    """Length of the longest suffix of ``data[start:]`` that is a proper prefix of ``tag``."""
+    # 标签里只有开头一个 "<"，所以候选后缀只可能从最后一个 "<" 开始
+    k = data.rfind("<", max(start, len(data) - len(tag) + 1))
+    if k < 0 or not tag.startswith(data[k:]):
+        return 0
+    return len(data) - k
+
+
+class ThinkTagFilter:
+    """Streaming state machine that drops ``<think>`` blocks and optionally ``**``.
+
+    Each chunk is scanned once from left to right; only a tail of at most
+    ``len("</think>") - 1`` characters (a possible tag split across chunks) is
+    carried into the next call, so total work is O(n) in the output length.
+    An unterminated ``<think>`` block swallows the rest of the output.
+    """
+
+    def __init__(self, strip_bold: bool = True):
+        self.strip_bold = strip_bold
+        self.in_think = False
+        self._pending = ""
+        self._star = False
+
+    def feed(self, chunk: str) -> str:
+        data = self._pending + chunk if self._pending else chunk
+        self._pending = ""
+        if not self.in_think and "<" not in data:
+            # 绝大多数 chunk 不含任何标签字符，直接走快路径
+            return self._bold(data)
+        size = len(data)
+        pieces = []
+        i = 0
+        while i < size:
+            if self.in_think:
+                j = data.find(THINK_CLOSE, i)
+                if j < 0:
+                    keep = _partial_tag_len(data, i, THINK_CLOSE)
+                    self._pending = data[size - keep:] if keep else ""
+                    break
+                i = j + len(THINK_CLOSE)
+                self.in_think = False
+            else:
+                j = data.find(THINK_OPEN, i)
+                if j < 0:
+                    keep = _partial_tag_len(data, i, THINK_OPEN)
+                    pieces.append(data[i:size - keep])
+                    self._pending = data[size - keep:] if keep else ""
+                    break
+                pieces.append(data[i:j])
+                i = j + len(THINK_OPEN)
+                self.in_think = True
+        return self._bold("".join(pieces))
+
+    def _bold(self, text: str) -> str:
+        if not self.strip_bold or not text or (not self._star and "*" not in text):
+            return text
+        if self._star:
+            text = "*" + text
+            self._star = False
+        # 末尾奇数个 * 时留一个到下一块，与整段 re.sub(r"\*\*", "") 的结果保持一致
+        trailing = len(text) - len(text.rstrip("*"))
+        if trailing % 2:
+            text = text[:-1]
+            self._star = True
+        return text.replace("**", "")
+
+    def flush(self) -> str:
+        """Return whatever is still held back once the stream has ended."""
+        # 被保留的 * 一定位于未完成标签之前，且标签前缀中不含 *，无需再做加粗处理
+        star = "*" if self._star else ""
+        tail = "" if self.in_think else self._pending
+        self._star = False
+        self._pending = ""
+        return star + tail
+
+
+def strip_think(text: str, strip_bold: bool = True) -> str:
+    """Non-streaming counterpart of :class:`ThinkTagFilter`."""
+    if not text:
+        return text or ""
+    f = ThinkTagFilter(strip_bold=strip_bold)
+    return f.feed(text) + f.flush()
+
+
+async def filter_stream(
+    chunks: AsyncIterator[str], strip_bold: bool = True
+) -> AsyncGenerator[str, None]:
+    f = ThinkTagFilter(strip_bold=strip_bold)
+    async for chunk in chunks:
+        out = f.feed(chunk)
+        if out:
+            yield out
+    tail = f.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,40 @@
+"""Fast local token estimation (no tokenizer dependency)."""
+import re
+
+# 中日韩文字与全角标点：主流 BPE 分词器下约 1 字 ≈ 1 token
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of ``text``.
+
+    CJK characters count as one token each, everything else as roughly four
+    characters per token.  Deliberately conservative for Chinese prose so that
+    budgets computed from it do not overflow the real context window.
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "…") -> str:
+    """Cut ``text`` so that ``estimate_tokens`` of the result (with ``suffix``) fits ``max_tokens``.
+
+    Walks the string once with the same per-character costs as
+    :func:`estimate_tokens`, so the result is deterministic.
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens - estimate_tokens(suffix)
+    if budget <= 0:
+        return ""
+    cost = 0.0
+    for index, char in enumerate(text):
+        cost += 1.0 if _CJK_RE.match(char) else 0.25
+        if cost > budget:
+            return text[:index] + suffix
+    return text
@@ -0,0 +1,29 @@
+"""把已有小说的世界观设定与缺失的场景摘要批量写入 RAG 向量库，并清理残留向量（可重复执行）
+
+用法:
+    python backfill_rag.py                  # 全部小说
+    python backfill_rag.py --novel <id> ... # 指定小说
+"""
+import argparse
+import asyncio
+
+from app.database import AsyncSessionLocal, init_db
+from app.services.knowledge_index import backfill_all
+
+
+async def main(novel_ids):
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        report = await backfill_all(db, novel_ids)
+    total = {"lore": 0, "summaries": 0, "pruned": 0}
+    for novel_id, counts in report.items():
+        print(f"{novel_id}: " + " ".join(f"{key}={counts[key]}" for key in total))
+        for key in total:
+            total[key] += counts[key]
+    print(f"novels={len(report)} " + " ".join(f"{key}={value}" for key, value in total.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill lore and scene summaries into the RAG vector store")
+    parser.add_argument("--novel", action="append", dest="novel_ids", help="小说 ID，可重复；默认全部")
+    asyncio.run(main(parser.parse_args().novel_ids))
@@ -0,0 +1,120 @@
+"""审稿委员会基准：对本地模拟 OpenAI 兼容服务跑完整的 审阅 -> 修改 -> 再审阅 循环
+
+对比每次调用都新建 ChatOpenAI/重新解析模板（旧实现）与按模型缓存客户端 + 预编译链（现实现），
+以及整篇重写与段落修订两种修订模式的输出 token 与修订耗时。
+用法: python bench_editorial_room.py [--cycles 5] [--ttft 0] [--tps 0]
+"""
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+
+from app.agents import editorial_room
+from app.services.fake_llm import FakeLLMConfig, create_fake_llm_app
+from app.services.generator import llm_client
+from app.services.http_pool import http_session_pool
+from app.services.llm_ledger import llm_ledger
+
+
+def make_state(draft: str) -> dict:
+    return {
+        "draft": draft,
+        "context": "林远潜入藏经阁寻找失传剑谱。",
+        "philosophical_theme": "天道无情",
+        "critiques": [],
+        "scores": [],
+        "iteration_count": 0,
+        "logs": [],
+        "model": "fake",
+    }
+
+
+async def legacy_cycle(base_url: str, draft: str) -> None:
+    """旧实现：每个 Agent 每次调用都新建客户端（独立连接池）并重新解析模板"""
+
+    def get_llm():
+        return ChatOpenAI(api_key="fake", base_url=base_url, model="fake", temperature=0.7, max_tokens=4000)
+
+    async def run(template: str, inputs: dict):
+        chain = ChatPromptTemplate.from_template(template) | get_llm()
+        return await chain.ainvoke(inputs)
+
+    inputs = {"draft": draft, "context": "林远潜入藏经阁寻找失传剑谱。", "philosophical_theme": "天道无情"}
+    templates = [editorial_room.PROMPT_A, editorial_room.PROMPT_B, editorial_room.PROMPT_C]
+    await asyncio.gather(*(run(t, inputs) for t in templates))
+    revised = await run(editorial_room.REVISION_PROMPT, {**inputs, "critiques": "节奏偏慢"})
+    await asyncio.gather(*(run(t, {**inputs, "draft": revised.content}) for t in templates))
+
+
+async def registry_cycle(draft: str) -> None:
+    state = make_state(draft)
+    state.update(await editorial_room.critique_node(state))
+    state.update(await editorial_room.revision_node(state))
+    await editorial_room.critique_node(state)
+
+
+async def timed(label: str, cycles: int, factory) -> None:
+    start = time.perf_counter()
+    for _ in range(cycles):
+        await factory()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed / cycles * 1000:8.1f} ms/cycle")
+
+
+async def compare_revision_modes(draft: str, cycles: int) -> None:
+    """同一初稿分别用整篇重写 / 段落修订跑完整审稿，统计修订调用的输出 token 与耗时"""
+    for label, paragraph_revision in (("full", False), ("paragraph", True)):
+        llm_ledger.reset()
+        for _ in range(cycles):
+            await editorial_room.EditorialRoom.review_and_revise(
+                draft, "林远潜入藏经阁寻找失传剑谱。", "天道无情", model="fake",
+                incremental=True, paragraph_revision=paragraph_revision,
+            )
+        calls = tokens = 0
+        latency = 0.0
+        for group in llm_ledger.stats()["groups"]:
+            if group["call_site"] in ("editorial_revision", "editorial_paragraph_revision"):
+                calls += group["calls"]
+                tokens += group["completion_tokens"]
+                latency += group["avg_latency_seconds"] * group["calls"]
+        print(
+            f"{label:<10} revisions={calls:<3} completion_tokens/rev={tokens / max(calls, 1):7.1f} "
+            f"latency/rev={latency / max(calls, 1) * 1000:7.1f} ms"
+        )
+
+
+async def main(args):
+    app = create_fake_llm_app(FakeLLMConfig(ttft=args.ttft, tokens_per_second=args.tps, seed=args.seed))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}/v1"
+
+    llm_client.api_key, llm_client.base_url = "fake", base_url
+    draft = "夜雨敲打着青石板，林远贴着墙根前行。" * 20
+    # 段落修订需要多段正文
+    long_draft = "\n\n".join(f"第{i}段：" + "夜雨敲打着青石板，林远贴着墙根前行。" * 6 for i in range(1, 9))
+    try:
+        # 先各跑一轮预热，避免首次导入/建连计入
+        await legacy_cycle(base_url, draft)
+        await registry_cycle(draft)
+        await timed("legacy", args.cycles, lambda: legacy_cycle(base_url, draft))
+        await timed("registry", args.cycles, lambda: registry_cycle(draft))
+        await compare_revision_modes(long_draft, args.cycles)
+    finally:
+        await http_session_pool.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--ttft", type=float, default=0.0)
+    parser.add_argument("--tps", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+"""<think> 过滤微基准：旧的整段缓冲重扫 vs 增量状态机
+
+用法: python bench_think_filter.py [--chunks 4000] [--chunk-size 6]
+"""
+import argparse
+import random
+import re
+import time
+
+from app.services.think_filter import ThinkTagFilter
+
+
+def make_chunks(n_chunks: int, chunk_size: int, seed: int = 7):
+    rng = random.Random(seed)
+    parts = []
+    for i in range(n_chunks * chunk_size // 200 + 1):
+        if i % 5 == 0:
+            parts.append("<think>" + "推理" * rng.randint(10, 60) + "</think>")
+        parts.append("**林远**走进了雨夜，" + "风声呜咽。" * rng.randint(5, 30))
+    text = "".join(parts)
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+
+def legacy_filter(chunks):
+    """原流程：generate_stream 缓冲查找 + 逐 chunk replace + 流结束后对全文再做两遍正则。"""
+    buffer = ""
+    skip = False
+    full_content = ""
+    for chunk in chunks:
+        buffer += chunk
+        out = []
+        while True:
+            if skip:
+                if "</think>" in buffer:
+                    buffer = buffer[buffer.find("</think>") + 8:]
+                    skip = False
+                else:
+                    buffer = ""
+                    break
+            else:
+                if "<think>" in buffer:
+                    idx = buffer.find("<think>")
+                    if idx > 0:
+                        out.append(buffer[:idx])
+                    buffer = buffer[idx + 7:]
+                    skip = True
+                else:
+                    if buffer:
+                        out.append(buffer)
+                        buffer = ""
+                    break
+        for piece in out:
+            full_content += piece.replace("<think>", "").replace("</think>", "")
+    if not skip and buffer:
+        full_content += buffer
+    full_content = re.sub(r"<think>.*?</think>", "", full_content, flags=re.DOTALL)
+    return re.sub(r"\*\*", "", full_content)
+
+
+def incremental_filter(chunks):
+    f = ThinkTagFilter(strip_bold=True)
+    out = [f.feed(c) for c in chunks]
+    out.append(f.flush())
+    return "".join(out)
+
+
+def bench(fn, chunks, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks, args.chunk_size)
+    total = sum(len(c) for c in chunks)
+    expected = re.sub(r"\*\*", "", re.sub(r"<think>.*?</think>", "", "".join(chunks), flags=re.S))
+    assert incremental_filter(chunks) == expected, "增量过滤结果与正则参考不一致"
+    # 旧流程在标签被拆到两个 chunk 时会把思考内容漏出来
+    leaked = "一致" if legacy_filter(chunks) == expected else "不一致（跨 chunk 标签泄漏）"
+
+    legacy = bench(legacy_filter, chunks, args.repeat)
+    incremental = bench(incremental_filter, chunks, args.repeat)
+    print(f"chunks={len(chunks)} chars={total} legacy 输出与参考{leaked}")
+    print(f"legacy      {legacy * 1000:8.2f} ms")
+    print(f"incremental {incremental * 1000:8.2f} ms  ({legacy / incremental:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""本地 OpenAI 兼容模拟服务：离线压测 / 无网络开发
+
+用法:
+    python fake_llm_server.py --port 8808 --ttft 0.3 --tps 40 --error-rate 0.05
+然后在 .env 中设置 OPENAI_BASE_URL=http://127.0.0.1:8808/v1（OPENAI_API_KEY 任意非空值）
+"""
+import argparse
+
+from aiohttp import web
+
+from app.services.fake_llm import FakeLLMConfig, create_fake_llm_app, load_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible fake LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--ttft", type=float, default=0.2, help="首 token 延迟（秒）")
+    parser.add_argument("--tps", type=float, default=50.0, help="每秒输出 token 数，<=0 不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的请求比例")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="语料文件，每行一段正文")
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tps,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    if args.corpus:
+        config.corpus = load_corpus(args.corpus)
+    web.run_app(create_fake_llm_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""把全局 RAG 集合中的向量按 novel_id 搬到每部小说独立的分区集合（可重复执行，不重新计算向量）
+
+用法:
+    python migrate_rag_partitions.py                 # 只复制，保留全局集合中的源文档
+    python migrate_rag_partitions.py --delete-source # 搬完删除源文档
+搬迁后设置 RAG_PARTITION_MODE=novel 并重启服务。
+"""
+import argparse
+
+from app.rag.service import RAGService
+
+
+def main(batch_size: int, delete_source: bool) -> None:
+    rag = RAGService(partition_mode="novel")
+    report = rag.migrate_to_partitions(batch_size=batch_size, delete_source=delete_source)
+    for type, moved in report.items():
+        print(f"{type}: moved={moved}")
+    print(f"total={sum(report.values())} delete_source={delete_source}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move RAG documents from global collections into per-novel partitions")
+    parser.add_argument("--batch-size", type=int, default=500, help="每页读取条数")
+    parser.add_argument("--delete-source", action="store_true", help="搬迁后从全局集合删除")
+    args = parser.parse_args()
+    main(args.batch_size, args.delete_source)
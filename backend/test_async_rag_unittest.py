@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from app.rag import AsyncRAGService, RAGTimeoutError
+
+
+class AsyncRAGServiceTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.service = MagicMock()
+        self.rag = AsyncRAGService(self.service, max_workers=1, timeout=0.2)
+        self.addCleanup(self.rag.shutdown)
+
+    async def test_calls_run_on_rag_thread_pool(self):
+        self.service.retrieve_context_many.side_effect = lambda *a, **kw: [threading.current_thread().name]
+
+        result = await self.rag.retrieve_context_many(["q"], type="lore", top_k=3)
+
+        self.assertTrue(result[0].startswith("rag"))
+        self.service.retrieve_context_many.assert_called_once_with(["q"], type="lore", top_k=3)
+
+    async def test_slow_call_does_not_block_event_loop(self):
+        self.service.retrieve_all_by_novel.side_effect = lambda *a, **kw: time.sleep(0.5)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        try:
+            with self.assertRaises(RAGTimeoutError):
+                await self.rag.retrieve_all_by_novel("n1", "scene_summary")
+        finally:
+            task.cancel()
+        # 同步调用期间事件循环仍在调度其他协程
+        self.assertGreater(ticks, 5)
+
+    async def test_writes_use_write_timeout(self):
+        self.service.add_knowledge_many.side_effect = lambda texts, **kw: time.sleep(0.4) or len(texts)
+        # 读超时 0.2s，写入默认不限时
+        self.assertEqual(await self.rag.add_knowledge_many(["a", "b"], ["1", "2"], "lore"), 2)
+
+        self.service.delete_knowledge_many.side_effect = lambda *a, **kw: time.sleep(0.4)
+        rag = AsyncRAGService(self.service, max_workers=1, timeout=10, write_timeout=0.1)
+        self.addCleanup(rag.shutdown)
+        with self.assertRaises(RAGTimeoutError):
+            await rag.delete_knowledge_many(["1"], "lore")
+
+    async def test_per_call_timeout_override_and_errors_propagate(self):
+        self.service.add_knowledge.side_effect = ValueError("bad type")
+        with self.assertRaises(ValueError):
+            await self.rag.add_knowledge(text="t", doc_id="d", type="nope", timeout=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
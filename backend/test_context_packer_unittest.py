@@ -0,0 +1,80 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.services.context_packer import ContextPacker, PackItem, PackSection
+from app.services.generator import SceneGenerator
+from app.services.prompt_messages import prompt_text
+from app.services.tokens import estimate_tokens, truncate_to_tokens
+
+
+class TokenEstimateTests(unittest.TestCase):
+    def test_cjk_counts_per_character(self):
+        self.assertEqual(estimate_tokens("林远拔剑"), 4)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+
+    def test_truncate_fits_budget(self):
+        text = "雨夜里林远握紧了剑柄，" * 20
+        cut = truncate_to_tokens(text, 30)
+        self.assertLessEqual(estimate_tokens(cut), 30)
+        self.assertTrue(cut.endswith("…"))
+        self.assertEqual(truncate_to_tokens("短句", 30), "短句")
+
+
+class ContextPackerTests(unittest.TestCase):
+    def test_fills_sections_by_priority_and_reports_cuts(self):
+        packer = ContextPacker(budget=60, min_truncated_tokens=10)
+        packed = packer.pack([
+            PackSection("beat", [PackItem("主" * 20)], required=True),
+            PackSection("summaries", [PackItem("摘" * 20, label="s1")]),
+            PackSection("characters", [PackItem("角" * 40, compact="角" * 10, label="c1")]),
+            PackSection("lore", [PackItem("设" * 30, label="l1"), PackItem("短", label="l2")]),
+        ])
+        self.assertEqual(packed.sections["characters"], ["角" * 10])
+        self.assertEqual(packed.sections["lore"], ["设" * 9 + "…"])
+        actions = [(c["label"], c["action"]) for c in packed.cuts]
+        self.assertEqual(actions, [("c1", "compacted"), ("l1", "truncated"), ("l2", "dropped")])
+        self.assertLessEqual(packed.used_tokens, 60)
+
+    def test_required_section_is_never_cut(self):
+        packed = ContextPacker(budget=5).pack([
+            PackSection("beat", [PackItem("指令" * 10)], required=True),
+            PackSection("lore", [PackItem("设定")]),
+        ])
+        self.assertEqual(packed.sections["beat"], ["指令" * 10])
+        self.assertEqual(packed.sections["lore"], [])
+        self.assertEqual(packed.cuts[0]["action"], "dropped")
+
+
+class WritingPromptPackingTests(unittest.TestCase):
+    def _scene(self):
+        return SimpleNamespace(
+            id="s", beat_description="林远潜入藏经阁", location="藏经阁",
+            tension_level=None, emotional_target=None,
+        )
+
+    def test_prompt_keeps_latest_summaries_in_order_under_budget(self):
+        context = {
+            "prev_summaries": ["第一幕" * 100, "第二幕" * 100, "第三幕"],
+            "character_contexts": [{"name": "林远", "personality": "冷静", "power_state": {"境界": "筑基" * 50}}],
+            "relationships": [],
+            "lore_contexts": [{"text": "藏经阁有禁制"}],
+        }
+        generator = SceneGenerator(SimpleNamespace(model="m"))
+        with patch("app.services.context_packer.settings") as settings:
+            settings.scene_context_token_budgets = {}
+            settings.scene_context_token_budget = 400
+            prompt = prompt_text(generator._build_writing_prompt(self._scene(), context))
+            packed = generator._pack_context(self._scene(), context)
+
+        self.assertIn("第三幕", prompt)
+        self.assertLess(prompt.index("第二幕"), prompt.index("第三幕"))
+        self.assertLess(prompt.index("第一幕"), prompt.index("第二幕"))
+        self.assertLessEqual(packed.used_tokens, 400)
+        actions = [(c["label"], c["action"]) for c in packed.cuts]
+        self.assertEqual(actions, [("prev_summary[-3]", "truncated"), ("林远", "dropped"), ("lore[0]", "dropped")])
+        self.assertNotIn("林远 -", prompt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import unittest
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from aiohttp.test_utils import TestServer
+
+from app.agents import editorial_room
+from app.services.fake_llm import FakeLLMConfig, create_fake_llm_app
+from app.services.generator import llm_client
+from app.services.http_pool import http_session_pool
+from app.services.llm_ledger import llm_ledger
+
+FAST = FakeLLMConfig(ttft=0.0, tokens_per_second=0)
+
+
+class EditorialRegistryTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = TestServer(create_fake_llm_app(FAST))
+        await self.server.start_server()
+        self.patches = [
+            patch.object(llm_client, "api_key", "k"),
+            patch.object(llm_client, "base_url", str(self.server.make_url("/v1"))),
+        ]
+        for p in self.patches:
+            p.start()
+        editorial_room._llm_registry.clear()
+        editorial_room._chain_registry.clear()
+        llm_ledger.reset()
+
+    async def asyncTearDown(self):
+        for p in self.patches:
+            p.stop()
+        await http_session_pool.close()
+        await self.server.close()
+
+    async def test_clients_and_chains_are_reused_per_model(self):
+        llm = editorial_room.get_llm("m1")
+        self.assertIs(editorial_room.get_llm("m1"), llm)
+        self.assertIsNot(editorial_room.get_llm("m2"), llm)
+        self.assertEqual(llm.model_name, "m1")
+        self.assertIs(editorial_room.get_chain("A", "m1"), editorial_room.get_chain("A", "m1"))
+        self.assertIsNot(editorial_room.get_chain("A", "m1"), editorial_room.get_chain("B", "m1"))
+
+    async def test_pool_reset_rebuilds_client_and_chains(self):
+        chain = editorial_room.get_chain("A", "m1")
+        llm = editorial_room.get_llm("m1")
+        await http_session_pool.close()
+        self.assertIsNot(editorial_room.get_llm("m1"), llm)
+        self.assertIsNot(editorial_room.get_chain("A", "m1"), chain)
+
+    async def test_review_uses_requested_model(self):
+        result = await editorial_room.EditorialRoom.review_and_revise(
+            "夜雨中林远潜入藏经阁。" * 10, "寻找剑谱", "天道无情", model="editor-x"
+        )
+        self.assertTrue(result["content"])
+        models = {g["model"] for g in llm_ledger.stats()["groups"]}
+        self.assertEqual(models, {"editor-x"})
+        self.assertEqual(set(editorial_room._llm_registry), {("editor-x", llm_client.base_url, "k")})
+
+
+class _Reviser:
+    """修订链替身：整篇修订在正文末尾追加一句；段落修订按 paragraph_reply 返回"""
+
+    def __init__(self, suffix="补一句。", paragraph_reply=None):
+        self.suffix = suffix
+        self.paragraph_reply = paragraph_reply
+        self.calls = []
+
+    async def ainvoke(self, inputs):
+        self.calls.append(("paragraph", inputs["targets"]))
+        return AIMessage(content=self.paragraph_reply(inputs) if self.paragraph_reply else "")
+
+    async def astream(self, inputs):
+        self.calls.append(("full", None))
+        text = inputs["draft"] + self.suffix
+        for i in range(0, len(text), 16):
+            yield AIMessageChunk(content=text[i:i + 16])
+
+
+class IncrementalCritiqueTests(unittest.IsolatedAsyncioTestCase):
+    def script(self, scores, paragraphs=None):
+        """scores: {agent key: [第 1 轮评分, 第 2 轮评分, ...]}；paragraphs: {agent key: 问题段落编号}"""
+        self.calls = []
+        rounds = {key: iter(values) for key, values in scores.items()}
+        paragraphs = paragraphs or {}
+
+        async def fake_run_agent(name, key, state):
+            self.calls.append(key)
+            return {
+                "score": next(rounds[key]), "critique": f"{name}: ok", "log": name,
+                "paragraphs": paragraphs.get(key, []), "tokens": 100,
+            }
+
+        return patch.object(editorial_room, "run_agent", fake_run_agent)
+
+    async def review(self, suffix="补一句。", **kwargs):
+        with patch.object(editorial_room, "get_chain", lambda name, model=None: _Reviser(suffix)):
+            return await editorial_room.EditorialRoom.review_and_revise("林远潜入藏经阁。" * 20, "ctx", "theme", model="m", **kwargs)
+
+    async def test_only_failed_agents_rerun_and_scores_carry_forward(self):
+        with self.script({"A": [9.0], "B": [6.0, 7.0, 9.0], "C": [9.0]}):
+            result = await self.review(incremental=True)
+        self.assertEqual(self.calls, ["A", "B", "C", "B", "B"])
+        self.assertEqual(result["final_scores"], [9.0, 9.0, 9.0])
+        self.assertEqual((result["critique_calls"], result["saved_calls"], result["revisions"]), (5, 4, 2))
+
+    async def test_large_rewrite_reruns_every_agent(self):
+        with self.script({"A": [9.0, 9.0], "B": [6.0, 9.0], "C": [9.0, 9.0]}):
+            result = await self.review(incremental=True, suffix="全新的结尾。" * 100)
+        self.assertEqual(result["critique_calls"], 6)
+        self.assertEqual(result["saved_calls"], 0)
+
+    async def test_full_mode_matches_legacy_behaviour(self):
+        with self.script({"A": [9.0, 9.0], "B": [6.0, 9.0], "C": [9.0, 9.0]}):
+            result = await self.review(incremental=False)
+        self.assertEqual((result["critique_calls"], result["saved_calls"]), (6, 0))
+
+    async def test_token_budget_stops_early(self):
+        with self.script({"A": [9.0], "B": [6.0], "C": [9.0]}):
+            result = await self.review(incremental=True, token_budget=200)
+        self.assertEqual(result["stop_reason"], "token_budget")
+        self.assertEqual((result["critique_calls"], result["revisions"]), (3, 0))
+
+    async def test_deadline_skips_recritique_after_revision(self):
+        with self.script({"A": [9.0], "B": [6.0], "C": [9.0]}), \
+                patch.object(editorial_room, "_deadline_reason", side_effect=["", "", "deadline"]):
+            result = await self.review(incremental=True, deadline_seconds=1)
+        self.assertEqual(result["stop_reason"], "deadline")
+        self.assertEqual((result["critique_calls"], result["revisions"]), (3, 1))
+        self.assertTrue(result["content"].endswith("补一句。"))
+
+    async def test_stream_pushes_verdicts_and_revision_chunks(self):
+        with self.script({"A": [9.0], "B": [6.0, 9.0], "C": [9.0]}), \
+                patch.object(editorial_room, "get_chain", lambda name, model=None: _Reviser()):
+            events = [e async for e in editorial_room.EditorialRoom.stream_review("林远。" * 40, "ctx", "theme", incremental=True)]
+        types = [e["type"] for e in events]
+        # 首轮三条结论先于修订正文推送，修订正文以 reset 开头
+        first_reset = types.index("reset")
+        self.assertEqual(types[:first_reset].count("log"), 4)
+        self.assertGreater(types.count("content"), 1)
+        self.assertEqual(types[-1], "result")
+        streamed = "".join(e["content"] for e in events[first_reset:] if e["type"] == "content")
+        self.assertEqual(streamed.strip(), events[-1]["content"])
+
+    async def test_paragraph_revision_splices_only_targets(self):
+        draft = "\n\n".join(f"第{i}段。" * 20 for i in range(1, 6))
+        reviser = _Reviser(paragraph_reply=lambda inputs: "[2] 新的第二段。\n[9] 越界编号被忽略。")
+        with self.script({"A": [9.0], "B": [6.0, 9.0], "C": [9.0]}, paragraphs={"B": [2]}), \
+                patch.object(editorial_room, "get_chain", lambda name, model=None: reviser):
+            result = await editorial_room.EditorialRoom.review_and_revise(
+                draft, "ctx", "theme", incremental=True, paragraph_revision=True
+            )
+        self.assertEqual(reviser.calls, [("paragraph", "[2]")])
+        paragraphs = result["content"].split("\n\n")
+        self.assertEqual(paragraphs[1], "新的第二段。")
+        self.assertEqual(paragraphs[0], "第1段。" * 20)
+        self.assertEqual(len(paragraphs), 5)
+        # 改动小，只复审未通过的 B
+        self.assertEqual(self.calls, ["A", "B", "C", "B"])
+
+    async def test_paragraph_revision_falls_back_to_full_rewrite(self):
+        draft = "\n\n".join(f"第{i}段。" * 20 for i in range(1, 6))
+        reviser = _Reviser(paragraph_reply=lambda inputs: "好的，我来修改。")
+        with self.script({"A": [9.0, 9.0], "B": [6.0, 9.0], "C": [9.0, 9.0]}, paragraphs={"B": [2]}), \
+                patch.object(editorial_room, "get_chain", lambda name, model=None: reviser):
+            result = await editorial_room.EditorialRoom.review_and_revise(
+                draft, "ctx", "theme", incremental=False, paragraph_revision=True
+            )
+        self.assertEqual([c[0] for c in reviser.calls], ["paragraph", "full"])
+        self.assertTrue(result["content"].endswith("补一句。"))
+
+    def test_revision_targets(self):
+        state = {
+            "paragraph_revision": True,
+            "draft": "\n".join(f"p{i}" for i in range(1, 7)),
+            "agent_scores": {"A": 9.0, "B": 6.0, "C": 7.0},
+            "agent_paragraphs": {"A": [1], "B": [2], "C": [5, 99]},
+        }
+        self.assertEqual(editorial_room.revision_targets(state), [2, 5])
+        # 任一未通过的 Agent 没有指出段落，即意见针对全篇
+        self.assertEqual(editorial_room.revision_targets({**state, "agent_paragraphs": {"B": [2]}}), [])
+        self.assertEqual(
+            editorial_room.revision_targets({**state, "agent_paragraphs": {"B": [1, 2, 3], "C": [4]}}), []
+        )
+
+    def test_parse_paragraph_revision(self):
+        text = "<think>先想想</think>[2] 第一行\n第二行\n\n[3]\n[4] 不在目标内"
+        self.assertEqual(editorial_room.parse_paragraph_revision(text, [2, 3]), {2: "第一行第二行"})
+
+    def test_change_ratio(self):
+        self.assertEqual(editorial_room.change_ratio("abc", "abc"), 0.0)
+        self.assertGreater(editorial_room.change_ratio("abc", "xyz"), 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.rag.embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+from app.rag.service import RAGService
+
+
+class _CountingEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        return [[float(len(text)), 1.0] for text in input]
+
+
+class EmbeddingCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+    def test_only_misses_are_embedded_and_duplicates_once(self):
+        inner = _CountingEmbedder()
+        fn = CachedEmbeddingFunction(inner, "m", EmbeddingCache())
+
+        first = fn(["甲", "乙乙", "甲"])
+        second = fn(["乙乙", "丙丙丙"])
+
+        self.assertEqual(inner.calls, [["甲", "乙乙"], ["丙丙丙"]])
+        self.assertEqual(first, [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]])
+        self.assertEqual(second, [[2.0, 1.0], [3.0, 1.0]])
+
+    def test_model_is_part_of_key(self):
+        cache = EmbeddingCache()
+        cache.set_many("a", ["文本"], [[1.0]])
+        self.assertEqual(cache.get_many("b", ["文本"]), [None])
+
+    def test_disk_tier_survives_restart_and_memory_lru_is_bounded(self):
+        path = os.path.join(self.temp_dir, "emb.sqlite3")
+        cache = EmbeddingCache(path=path, memory_items=1)
+        cache.set_many("m", ["一", "二"], [[0.5, 0.25], [1.0, 2.0]])
+        self.assertEqual(cache.stats()["memory_size"], 1)
+
+        restarted = EmbeddingCache(path=path)
+        self.assertEqual(restarted.get_many("m", ["一", "三"]), [[0.5, 0.25], None])
+        self.assertEqual(restarted.stats()["disk_hits"], 1)
+        self.assertEqual(restarted.stats()["misses"], 1)
+
+
+class UnchangedUpsertTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.inner = _CountingEmbedder()
+        self.rag = RAGService(persist_directory=self.temp_dir, embedding_cache=EmbeddingCache())
+        # 替换为计数嵌入，离线验证是否触发了嵌入
+        self.rag.embedding_function.inner = self.inner
+        self.rag.summaries_collection = self.rag.client.get_or_create_collection(
+            "summaries_test", embedding_function=self.rag.embedding_function
+        )
+
+    def test_unchanged_documents_skip_upsert(self):
+        meta = {"novel_id": "n1", "scene_id": "s1"}
+        self.assertEqual(self.rag.add_knowledge("摘要一", "scene_summary_s1", "scene_summary", dict(meta)), 1)
+        self.assertEqual(self.rag.add_knowledge("摘要一", "scene_summary_s1", "scene_summary", dict(meta)), 0)
+        written = self.rag.add_knowledge_many(
+            ["摘要一", "摘要二"], ["scene_summary_s1", "scene_summary_s2"], "scene_summary", [meta, meta]
+        )
+        self.assertEqual(written, 1)
+        self.assertEqual(self.inner.calls, [["摘要一"], ["摘要二"]])
+
+    def test_metadata_change_is_written_without_reembedding(self):
+        self.rag.add_knowledge("摘要", "d1", "scene_summary", {"novel_id": "n1", "chapter_id": "c1"})
+        self.assertEqual(self.rag.add_knowledge("摘要", "d1", "scene_summary", {"novel_id": "n1", "chapter_id": "c2"}), 1)
+        self.assertEqual(self.inner.calls, [["摘要"]])
+        stored = self.rag.summaries_collection.get(ids=["d1"])
+        self.assertEqual(stored["metadatas"][0]["chapter_id"], "c2")
+
+
+if __name__ == "__main__":
+    unittest.main()
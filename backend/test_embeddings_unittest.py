@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.embeddings import Embedder, OnnxEmbedder, resolve_model_path
+from app.rag.service import RAGService
+
+
+class _HashEmbedder(Embedder):
+    """按字符哈希的确定性嵌入，离线跑通 Chroma 写入与检索"""
+
+    name = "hash-16"
+
+    def __init__(self, batch_size=32):
+        super().__init__(batch_size)
+        self.batches = []
+
+    def _load(self):
+        pass
+
+    def _embed(self, texts):
+        self.batches.append(len(texts))
+        vectors = []
+        for text in texts:
+            v = np.zeros(16)
+            for ch in text:
+                v[zlib.crc32(ch.encode()) % 16] += 1
+            vectors.append((v / max(np.linalg.norm(v), 1e-9)).tolist())
+        return vectors
+
+
+class _FakeSession:
+    """按 token id 输出 one-hot 隐状态的假 ONNX 会话"""
+
+    def __init__(self, path, sess_options=None, providers=None):
+        self.path = path
+        self.sess_options = sess_options
+        self.calls = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_ids"), SimpleNamespace(name="attention_mask")]
+
+    def run(self, outputs, feeds):
+        self.calls.append(feeds["input_ids"].shape)
+        return [np.eye(8, dtype=np.float32)[feeds["input_ids"]]]
+
+
+def _write_model_dir(root, files=("model.onnx",)):
+    vocab = {"[PAD]": 0, "[UNK]": 1, "剑": 2, "宗门": 3, "灵脉": 4}
+    tokenizer = Tokenizer(WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer.save(os.path.join(root, "tokenizer.json"))
+    for name in files:
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(b"onnx")
+
+
+class OnnxEmbedderTests(unittest.TestCase):
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.model_dir, True)
+
+    def test_mean_pooling_batches_and_thread_cap(self):
+        _write_model_dir(self.model_dir)
+        embedder = OnnxEmbedder(self.model_dir, batch_size=2, threads=2)
+
+        with patch("onnxruntime.InferenceSession", _FakeSession):
+            vectors = embedder(["剑", "宗门 灵脉", "剑 剑"])
+
+        session = embedder._session
+        self.assertEqual(session.sess_options.intra_op_num_threads, 2)
+        self.assertEqual([shape[0] for shape in session.calls], [2, 1])
+        np.testing.assert_allclose(vectors[0], np.eye(8)[2], atol=1e-6)
+        # 两个 token 平均后归一化，padding 不参与
+        np.testing.assert_allclose(vectors[1], (np.eye(8)[3] + np.eye(8)[4]) / np.sqrt(2), atol=1e-6)
+
+    def test_quantized_model_preferred(self):
+        _write_model_dir(self.model_dir, files=("model.onnx", "model_quantized.onnx"))
+        with patch("onnxruntime.InferenceSession", _FakeSession):
+            embedder = OnnxEmbedder(self.model_dir, quantized=True)
+            embedder.preload()
+        self.assertTrue(embedder._session.path.endswith("model_quantized.onnx"))
+        self.assertTrue(embedder.name.endswith("-q"))
+
+    def test_missing_model_file(self):
+        with self.assertRaises(FileNotFoundError):
+            OnnxEmbedder(self.model_dir).preload()
+
+    def test_resolve_model_path(self):
+        os.makedirs(os.path.join(self.model_dir, "BAAI--bge-small-zh-v1.5"))
+        self.assertEqual(
+            resolve_model_path("BAAI/bge-small-zh-v1.5", self.model_dir),
+            os.path.join(self.model_dir, "BAAI--bge-small-zh-v1.5"),
+        )
+        with self.assertRaises(FileNotFoundError):
+            resolve_model_path("missing/model", self.model_dir)
+
+
+class RAGServiceEmbedderTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.embedder = _HashEmbedder(batch_size=2)
+        self.rag = RAGService(persist_directory=self.temp_dir, embedder=self.embedder, embedding_cache=EmbeddingCache())
+
+    def test_custom_embedder_gets_its_own_collections(self):
+        self.assertEqual(self.rag.lore_collection.name, "lore__hash-16")
+        self.assertEqual(self.rag.lore_collection.metadata["embedder"], "hash-16")
+
+    def test_roundtrip_uses_configured_embedder(self):
+        self.rag.add_knowledge_many(
+            texts=["青云宗的护山大阵", "北冥海的妖兽", "灵脉汇聚之地"],
+            doc_ids=["l1", "l2", "l3"],
+            type="lore",
+            metadatas=[{"novel_id": "n1"}] * 3,
+        )
+        self.assertEqual(self.embedder.batches, [2, 1])
+
+        results = self.rag.retrieve_context("北冥海妖兽", type="lore", top_k=1, novel_id="n1")
+        self.assertEqual(results[0]["id"], "l2")
+
+
+if __name__ == "__main__":
+    unittest.main()
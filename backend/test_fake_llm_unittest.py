@@ -0,0 +1,94 @@
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from aiohttp.test_utils import TestServer
+
+from app.api.chapter import parse_beats_response
+from app.config import settings
+from app.services.fake_llm import FakeLLMClient, FakeLLMConfig, FakeResponder, create_fake_llm_app
+from app.services.generator import LLMClient, OpenAICompatClient, OutlineGenerator
+from app.services.http_pool import http_session_pool
+from app.services.llm_retry import LLMAPIError, RetryPolicy
+from app.services.scene_image_service import _build_storyboard_prompt, _parse_prompt_list
+
+FAST = FakeLLMConfig(ttft=0.0, tokens_per_second=0)
+
+
+class FakeResponderTests(unittest.TestCase):
+    def setUp(self):
+        self.responder = FakeResponder(FAST)
+
+    def test_structured_prompts_parse_with_real_parsers(self):
+        beats = parse_beats_response(self.responder.respond("请将小说章节拆分为具体的场景细纲。"))
+        self.assertGreaterEqual(len(beats), 4)
+        self.assertEqual(len(_parse_prompt_list(self.responder.respond(_build_storyboard_prompt("x")))), 3)
+
+        state = json.loads(self.responder.respond('请根据以下小说正文内容，更新角色的状态。\n当前状态：{"realm": "筑基"}\n'))
+        self.assertEqual(state["realm"], "筑基")
+
+        rels = json.loads(self.responder.respond("你是一个小说人际关系分析师。\n- 甲 (ID: a1)\n- 乙 (ID: b2)\n"))
+        self.assertEqual((rels[0]["char_a_id"], rels[0]["char_b_id"]), ("a1", "b2"))
+
+        critique = json.loads(self.responder.respond("请给出你的评分（0-10分）和批判意见。"))
+        self.assertTrue(0 <= critique["score"] <= 10)
+
+        outline = OutlineGenerator(None)._parse_outline_response(
+            self.responder.respond(OutlineGenerator(None)._build_outline_prompt("p", "玄幻", "严肃", 6)), "n", 6
+        )
+        self.assertEqual(len(outline["chapters"]), 6)
+        self.assertTrue(outline["characters"])
+
+    def test_same_prompt_and_seed_is_reproducible(self):
+        other = FakeResponder(FakeLLMConfig(seed=0))
+        self.assertEqual(self.responder.respond("写一段正文"), other.respond("写一段正文"))
+        self.assertNotEqual(
+            self.responder.respond("写一段正文"), FakeResponder(FakeLLMConfig(seed=1)).respond("写一段正文")
+        )
+
+
+class FakeLLMClientTests(unittest.IsolatedAsyncioTestCase):
+    async def test_errors_go_through_retry_policy(self):
+        client = FakeLLMClient(
+            config=FakeLLMConfig(ttft=0.0, tokens_per_second=0, error_rate=1.0),
+            retry_policy=RetryPolicy(max_retries=1, base_delay=0.0),
+        )
+        with self.assertRaises(LLMAPIError):
+            await client.generate("x")
+
+    async def test_llm_client_uses_fake_transport_when_enabled(self):
+        with patch.object(settings, "llm_fake_enabled", True), \
+                patch.object(FakeLLMConfig, "from_settings", return_value=FAST):
+            llm = LLMClient()
+            self.assertIsInstance(llm.client, FakeLLMClient)
+            self.assertIsInstance(llm._client_for_model("other"), FakeLLMClient)
+        chunks = [c async for c in llm.client.generate_stream("写一段正文")]
+        self.assertGreater(len(chunks), 1)
+        self.assertNotEqual("".join(chunks), "模拟响应")
+
+
+class FakeLLMServerTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = TestServer(create_fake_llm_app(FAST))
+        await self.server.start_server()
+        self.client = OpenAICompatClient(api_key="k", base_url=str(self.server.make_url("/v1")), model="fake")
+
+    async def asyncTearDown(self):
+        await http_session_pool.close()
+        await self.server.close()
+
+    async def test_stream_and_non_stream_match(self):
+        full = await self.client.generate("写一段正文")
+        chunks = [c async for c in self.client.generate_stream("写一段正文")]
+        self.assertEqual("".join(chunks), full)
+
+    async def test_reports_usage(self):
+        trace = SimpleNamespace(usage=None)
+        trace.set_usage = lambda usage: setattr(trace, "usage", usage)
+        await self.client.generate("写一段正文", trace=trace)
+        self.assertGreater(trace.usage["completion_tokens"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import gc
+import threading
+import unittest
+import warnings
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.services.generator import LLMClient
+from app.services.http_pool import HttpSessionPool
+
+
+class HttpSessionPoolTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pool = HttpSessionPool(limit=10, limit_per_host=2)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def test_same_base_url_reuses_session(self):
+        first = self.pool.get("https://api.example.com/v1")
+        second = self.pool.get("https://api.example.com/v1/")
+        self.assertIs(first, second)
+        self.assertEqual(first.connector.limit_per_host, 2)
+
+    async def test_different_base_url_gets_own_session(self):
+        a = self.pool.get("https://a.example.com/v1")
+        b = self.pool.get("https://b.example.com/v1")
+        self.assertIsNot(a, b)
+
+    async def test_close_then_get_creates_fresh_session(self):
+        first = self.pool.get("https://api.example.com/v1")
+        await self.pool.close()
+        self.assertTrue(first.closed)
+        second = self.pool.get("https://api.example.com/v1")
+        self.assertIsNot(first, second)
+        self.assertFalse(second.closed)
+
+
+class HttpSessionPoolLoopSwitchTests(unittest.TestCase):
+    """会话绑定事件循环：换循环时旧会话要关掉而不是直接丢弃"""
+
+    async def _request(self, pool, sessions):
+        app = web.Application()
+        app.router.add_get("/v1/models", lambda request: web.json_response({"data": []}))
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            # 同一 base_url 在每个循环里各建一个会话，并真正建立一条 keep-alive 连接
+            session = pool.get("https://api.example.com/v1")
+            sessions.append(session)
+            async with session.get(server.make_url("/v1/models")) as response:
+                await response.read()
+        finally:
+            await server.close()
+
+    def test_switching_loops_twice_leaves_no_session_open(self):
+        pool = HttpSessionPool()
+        sessions = []
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with self.assertLogs("app.services.http_pool", level="WARNING"):
+                for _ in range(3):
+                    asyncio.run(self._request(pool, sessions))
+                asyncio.run(pool.close())
+            gc.collect()
+        self.assertEqual(len({id(s) for s in sessions}), 3)
+        self.assertTrue(all(s.closed for s in sessions))
+        unclosed = [w for w in caught if "Unclosed" in str(w.message)]
+        self.assertEqual(unclosed, [])
+
+    def test_session_of_running_loop_is_closed_on_its_own_loop(self):
+        pool = HttpSessionPool()
+        other = asyncio.new_event_loop()
+        thread = threading.Thread(target=other.run_forever, daemon=True)
+        thread.start()
+        self.addCleanup(other.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(other.call_soon_threadsafe, other.stop)
+
+        async def get():
+            return pool.get("https://api.example.com/v1")
+
+        first = asyncio.run_coroutine_threadsafe(get(), other).result()
+
+        async def switch():
+            second = pool.get("https://api.example.com/v1")
+            for _ in range(50):
+                if first.closed:
+                    break
+                await asyncio.sleep(0.01)
+            await pool.close()
+            return second
+
+        second = asyncio.run(switch())
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertTrue(second.closed)
+
+
+class LLMClientModelCacheTests(unittest.TestCase):
+    def _client(self):
+        llm = LLMClient()
+        llm.api_key = "k"
+        llm.base_url = "https://api.example.com/v1"
+        llm.model = "base-model"
+        llm._init_client()
+        return llm
+
+    def test_client_for_model_reuses_instances(self):
+        llm = self._client()
+        self.assertIs(llm._client_for_model("writer"), llm._client_for_model("writer"))
+        self.assertIs(llm._client_for_model("base-model"), llm.client)
+
+    def test_refresh_drops_cached_clients(self):
+        llm = self._client()
+        before = llm._client_for_model("writer")
+        llm._init_client()
+        self.assertIsNot(before, llm._client_for_model("writer"))
+
+
+if __name__ == "__main__":
+    unittest.main()
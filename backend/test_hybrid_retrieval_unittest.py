@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app.config import settings
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.embeddings import Embedder
+from app.rag.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from app.rag.service import RAGService
+
+
+class _LengthEmbedder(Embedder):
+    """只看文本长度的嵌入：向量检索对专有名词完全“失明”，用来验证字面召回"""
+
+    name = "length"
+
+    def _load(self):
+        pass
+
+    def _embed(self, texts):
+        return [[1.0, len(text) / 100.0] for text in texts]
+
+
+class LexicalTests(unittest.TestCase):
+    def test_tokenize_cjk_bigrams_and_words(self):
+        self.assertEqual(tokenize("青云宗 Lv3"), ["青云", "云宗", "lv3"])
+        self.assertEqual(tokenize("剑，与 刀"), ["剑", "与", "刀"])
+
+    def test_bm25_prefers_exact_name_and_filters_metadata(self):
+        index = BM25Index()
+        index.add(
+            ["l1", "l2", "l3"],
+            ["玄天剑宗：东域第一剑修宗门", "丹鼎阁：炼丹为主的宗门", "玄天剑宗外门"],
+            [{"novel_id": "n1"}, {"novel_id": "n1"}, {"novel_id": "n2"}],
+        )
+        hits = index.search("拜入玄天剑宗", top_k=5, where={"novel_id": "n1"})
+        self.assertEqual([h["id"] for h in hits], ["l1"])
+
+        index.remove(["l1"])
+        self.assertEqual(index.search("玄天剑宗", top_k=5, where={"novel_id": "n1"}), [])
+
+    def test_rrf_rewards_agreement(self):
+        fused = reciprocal_rank_fusion(
+            [
+                [{"id": "a", "distance": 0.1}, {"id": "b", "distance": 0.2}],
+                [{"id": "b", "score": 3.0}, {"id": "c", "score": 1.0}],
+            ],
+            top_k=2,
+        )
+        self.assertEqual([f["id"] for f in fused], ["b", "a"])
+        # 字段优先取向量结果（带距离）
+        self.assertEqual(fused[0]["distance"], 0.2)
+
+
+class HybridRetrievalTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.rag = self._service()
+        texts = [
+            "玄天剑宗：东域第一剑修宗门，护山大阵千年未破。",
+            "北冥海：妖兽横行的无尽海域。",
+            "筑基期：修士引气入体后的第二境界。",
+            "丹鼎阁：以炼丹闻名的中立势力。",
+        ]
+        self.rag.add_knowledge_many(
+            texts, [f"lore_{i}" for i in range(len(texts))], "lore", [{"novel_id": "n1"}] * len(texts)
+        )
+        self.rag.add_knowledge("玄天剑宗（另一本书）", "lore_other", "lore", {"novel_id": "n2"})
+
+    def _service(self):
+        return RAGService(persist_directory=self.temp_dir, embedder=_LengthEmbedder(), embedding_cache=EmbeddingCache())
+
+    def test_exact_name_hit_is_fused_to_top(self):
+        results = self.rag.retrieve_hybrid_many(["林远前往玄天剑宗拜师"], "lore", top_k=1, novel_id="n1")
+        self.assertEqual(results[0]["id"], "lore_0")
+
+    def test_vector_only_misses_the_name(self):
+        with patch.object(settings, "rag_hybrid_enabled", False):
+            results = self.rag.retrieve_hybrid_many(["林远前往玄天剑宗拜师"], "lore", top_k=1, novel_id="n1")
+        self.assertNotEqual(results[0]["id"], "lore_0")
+
+    def test_index_follows_updates_and_rebuilds_after_restart(self):
+        self.rag.retrieve_hybrid_many(["筑基"], "lore", top_k=1, novel_id="n1")  # 触发构建
+        self.rag.add_knowledge("金丹期：筑基之后的境界。", "lore_2", "lore", {"novel_id": "n1"})
+        self.rag.delete_knowledge("lore_3", "lore")
+
+        for rag in (self.rag, self._service()):
+            index = rag._lexical_index(rag.lore_collection)
+            self.assertEqual(index.search("金丹", 1, {"novel_id": "n1"})[0]["id"], "lore_2")
+            self.assertEqual(index.search("丹鼎阁", 5, {"novel_id": "n1"}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
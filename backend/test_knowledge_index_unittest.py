@@ -0,0 +1,123 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.models import Chapter, Lore, Scene
+from app.rag import AsyncRAGService
+from app.services import knowledge_index
+
+
+class _FakeResult:
+    def __init__(self, scalars=None, rows=None):
+        self._scalars = scalars or []
+        self._rows = rows or []
+
+    def scalars(self):
+        return SimpleNamespace(all=lambda: self._scalars)
+
+    def all(self):
+        return self._rows
+
+
+class KnowledgeDocumentTests(unittest.TestCase):
+    def test_lore_document_drops_none_metadata(self):
+        doc = knowledge_index.lore_document(Lore(id="l1", novel_id="n1", title="灵脉", content="天地灵气汇聚之处"))
+        self.assertEqual(doc["id"], "lore_l1")
+        self.assertEqual(doc["text"], "灵脉：天地灵气汇聚之处")
+        self.assertNotIn("category", doc["metadata"])
+
+    def test_empty_entries_are_skipped(self):
+        self.assertIsNone(knowledge_index.lore_document(Lore(id="l1", novel_id="n1")))
+
+
+class KnowledgeIndexTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.rag = MagicMock()
+        self.rag.add_knowledge_many.side_effect = lambda texts, **kwargs: len(texts)
+        patcher = patch.object(knowledge_index, "async_rag", AsyncRAGService(self.rag, max_workers=1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_index_lore_is_one_batched_upsert(self):
+        count = await knowledge_index.index_lore(
+            [Lore(id="l1", novel_id="n1", title="甲"), Lore(id="l2", novel_id="n1", title="乙")]
+        )
+        self.assertEqual(count, 2)
+        self.rag.add_knowledge_many.assert_called_once()
+        kwargs = self.rag.add_knowledge_many.call_args.kwargs
+        self.assertEqual(kwargs["doc_ids"], ["lore_l1", "lore_l2"])
+        self.assertEqual(kwargs["type"], "lore")
+
+    async def test_index_failure_is_swallowed(self):
+        self.rag.add_knowledge_many.side_effect = RuntimeError("chroma down")
+        self.assertEqual(await knowledge_index.index_lore([Lore(id="l1", novel_id="n1", title="x")]), 0)
+
+    async def test_remove_skips_empty_batches(self):
+        await knowledge_index.remove_lore([])
+        self.rag.delete_knowledge_many.assert_not_called()
+        await knowledge_index.remove_lore(["l1"], "n1")
+        self.rag.delete_knowledge_many.assert_called_once_with(["lore_l1"], "lore", novel_id="n1")
+
+    async def test_backfill_novel_indexes_and_prunes(self):
+        indexed = {
+            # 旧版本写入的角色向量：角色不再入库，全部清理
+            "character": [{"id": "character_c1"}, {"id": "character_gone"}],
+            "lore": [{"id": "lore_l1"}, {"id": "lore_gone"}],
+            "scene_summary": [{"id": "scene_summary_s1"}],
+        }
+        self.rag.list_by_novel.side_effect = lambda novel_id, type, **kwargs: {
+            "items": indexed.get(type, []),
+            "next_offset": None,
+        }
+        chapter = Chapter(id="ch1", novel_id="n1")
+        db = SimpleNamespace(
+            execute=AsyncMock(
+                side_effect=[
+                    _FakeResult([Lore(id="l1", novel_id="n1", title="设定")]),
+                    _FakeResult(rows=[
+                        (Scene(id="s1", summary="已入库（可能被人工修改过）"), chapter),
+                        (Scene(id="s2", summary="新摘要"), chapter),
+                    ]),
+                ]
+            )
+        )
+
+        report = await knowledge_index.backfill_novel("n1", db)
+
+        self.assertEqual(report, {"lore": 1, "summaries": 1, "pruned": 3})
+        self.assertEqual(
+            [c.args for c in self.rag.delete_knowledge_many.call_args_list],
+            [(["character_c1", "character_gone"], "character"), (["lore_gone"], "lore")],
+        )
+        self.assertNotIn("character", [c.kwargs["type"] for c in self.rag.add_knowledge_many.call_args_list])
+        summary_call = self.rag.add_knowledge_many.call_args_list[-1].kwargs
+        self.assertEqual(summary_call["doc_ids"], ["scene_summary_s2"])
+        self.assertEqual(summary_call["metadatas"], [{"scene_id": "s2", "novel_id": "n1", "chapter_id": "ch1"}])
+
+    async def test_slow_backfill_still_reports_counts(self):
+        # 嵌入比读/写超时都慢：回填不设超时，按实际写入条数上报
+        patcher = patch.object(
+            knowledge_index, "async_rag", AsyncRAGService(self.rag, max_workers=1, timeout=0.05, write_timeout=0.05)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rag.add_knowledge_many.side_effect = lambda texts, **kwargs: time.sleep(0.2) or len(texts)
+        self.rag.list_by_novel.return_value = {"items": [], "next_offset": None}
+        chapter = Chapter(id="ch1", novel_id="n1")
+        db = SimpleNamespace(
+            execute=AsyncMock(
+                side_effect=[
+                    _FakeResult([Lore(id="l1", novel_id="n1", title="设定"), Lore(id="l2", novel_id="n1", title="宗门")]),
+                    _FakeResult(rows=[(Scene(id="s1", summary="摘要"), chapter)]),
+                ]
+            )
+        )
+
+        report = await knowledge_index.backfill_novel("n1", db)
+
+        self.assertEqual(report, {"lore": 2, "summaries": 1, "pruned": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from app.services import scene_postprocess, state_analyzer
+from app.services.generator import LLMClient
+
+
+class _FakeRows:
+    def __init__(self, row=None, items=None):
+        self._row = row
+        self._items = items or []
+
+    def first(self):
+        return self._row
+
+    def scalars(self):
+        return SimpleNamespace(all=lambda: self._items)
+
+
+class _AsyncSessionCtx:
+    def __init__(self, db):
+        self._db = db
+
+    async def __aenter__(self):
+        return self._db
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+def _batch_client(delays):
+    llm = LLMClient()
+    running = {"now": 0, "peak": 0}
+
+    async def fake(prompt, *args):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        try:
+            await asyncio.sleep(delays[prompt])
+            if prompt == "bad":
+                raise RuntimeError("upstream failed")
+            return prompt.upper()
+        finally:
+            running["now"] -= 1
+
+    llm._generate_or_raise = fake
+    return llm, running
+
+
+class GenerateManyTests(unittest.IsolatedAsyncioTestCase):
+    async def test_preserves_order_and_reports_item_errors(self):
+        llm, running = _batch_client({"a": 0.03, "bad": 0.0, "c": 0.01})
+        results = await llm.generate_many(["a", "bad", "c"])
+        self.assertEqual([r.index for r in results], [0, 1, 2])
+        self.assertEqual([r.content for r in results], ["A", "", "C"])
+        self.assertFalse(results[1].ok)
+        self.assertIn("upstream failed", results[1].error)
+        self.assertEqual(running["peak"], 3)
+
+    async def test_as_completed_streams_in_finish_order(self):
+        llm, _ = _batch_client({"slow": 0.03, "fast": 0.0})
+        order = [r.index async for r in llm.generate_many_as_completed(["slow", "fast"])]
+        self.assertEqual(order, [1, 0])
+
+    async def test_concurrency_cap(self):
+        llm, running = _batch_client({p: 0.01 for p in "abcdef"})
+        await llm.generate_many(list("abcdef"), concurrency=2)
+        self.assertEqual(running["peak"], 2)
+
+
+class PostprocessBatchTests(unittest.IsolatedAsyncioTestCase):
+    async def test_state_analysis_runs_as_one_batch(self):
+        scene = SimpleNamespace(content="正文", characters_present=["c2", "c1"])
+        novel = SimpleNamespace(id="n1", genre="玄幻")
+        c1 = SimpleNamespace(id="c1", name="甲", power_state={})
+        c2 = SimpleNamespace(id="c2", name="乙", power_state={})
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _FakeRows(row=(scene, None, novel)),
+                _FakeRows(items=[c1, c2]),
+                _FakeRows(items=[]),
+            ]),
+            add=lambda obj: None,
+            commit=AsyncMock(),
+        )
+
+        with patch.object(scene_postprocess, "AsyncSessionLocal", return_value=_AsyncSessionCtx(db)), \
+                patch.object(state_analyzer, "analyze_states", new=AsyncMock(
+                    return_value=[{"realm": "乙"}, None]
+                )) as mock_states, \
+                patch.object(scene_postprocess.relationship_analyzer, "analyze_relationships", new=AsyncMock(
+                    return_value=[]
+                )):
+            await scene_postprocess.analyze_state_and_relationships("s1")
+
+        characters = mock_states.await_args.args[0]
+        self.assertEqual([c.id for c in characters], ["c2", "c1"])
+        self.assertEqual(c2.power_state, {"realm": "乙"})
+        self.assertEqual(c1.power_state, {})
+        db.commit.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
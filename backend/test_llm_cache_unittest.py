@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from app.services import generator
+from app.services.llm_cache import LLMResponseCache
+
+
+class LLMResponseCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "cache.sqlite3")
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+    def test_key_depends_on_model_and_params(self):
+        base = LLMResponseCache.make_key("m1", "p", {"temperature": 0.7})
+        self.assertEqual(base, LLMResponseCache.make_key("m1", "p", {"temperature": 0.7}))
+        self.assertNotEqual(base, LLMResponseCache.make_key("m2", "p", {"temperature": 0.7}))
+        self.assertNotEqual(base, LLMResponseCache.make_key("m1", "p", {"temperature": 0.2}))
+        self.assertNotEqual(base, LLMResponseCache.make_key("m1", "q", {"temperature": 0.7}))
+
+    def test_memory_and_disk_tiers(self):
+        cache = LLMResponseCache(path=self.path, memory_items=1)
+        cache.set("a", "A")
+        cache.set("b", "B")  # 内存层只保留 b
+        self.assertEqual(cache.get("b"), "B")
+        self.assertEqual(cache.get("a"), "A")
+        stats = cache.stats()
+        self.assertEqual(stats["memory_hits"], 1)
+        self.assertEqual(stats["disk_hits"], 1)
+
+        reopened = LLMResponseCache(path=self.path)
+        self.assertEqual(reopened.get("a"), "A")
+        self.assertIsNone(reopened.get("missing"))
+        self.assertEqual(reopened.stats()["misses"], 1)
+
+    def test_ttl_expiry(self):
+        cache = LLMResponseCache(path=self.path, ttl_seconds=10)
+        cache.set("a", "A")
+        with patch("app.services.llm_cache.time.time", return_value=time.time() + 11):
+            self.assertIsNone(cache.get("a"))
+
+    def test_size_eviction_keeps_recent_entries(self):
+        cache = LLMResponseCache(path=self.path, memory_items=1, max_entries=2)
+        for i in range(4):
+            cache.set(f"k{i}", f"v{i}")
+            time.sleep(0.001)
+        cache.evict()
+        cache._memory.clear()
+        self.assertIsNone(cache.get("k0"))
+        self.assertEqual(cache.get("k3"), "v3")
+
+    def test_disk_hits_batch_access_time_updates(self):
+        cache = LLMResponseCache(path=self.path, memory_items=1)
+        cache.set("a", "A")
+        cache.set("b", "B")
+        statements = []
+        cache._db().set_trace_callback(statements.append)
+        for _ in range(3):
+            cache._memory.clear()
+            self.assertEqual(cache.get("a"), "A")
+        self.assertFalse([s for s in statements if s.startswith("UPDATE")])
+
+        cache.set("c", "C")  # 下一次写入顺带写回访问时间
+        updates = [s for s in statements if s.startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(cache._touched, {})
+
+    def test_empty_value_not_cached(self):
+        cache = LLMResponseCache(path=None)
+        cache.set("a", "")
+        self.assertIsNone(cache.get("a"))
+
+
+class AsyncLLMResponseCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.cache = LLMResponseCache(path=os.path.join(self.temp_dir, "cache.sqlite3"), memory_items=1)
+
+    async def test_disk_tier_runs_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+        for name in ("_disk_get", "_disk_set"):
+            original = getattr(self.cache, name)
+
+            def wrapped(*args, _original=original):
+                threads.append(threading.get_ident())
+                return _original(*args)
+
+            patcher = patch.object(self.cache, name, side_effect=wrapped)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        await self.cache.aset("a", "A")
+        await self.cache.aset("b", "B")
+        self.assertEqual(await self.cache.aget("a"), "A")
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop_thread, threads)
+
+        # 内存层命中不进线程池
+        self.assertEqual(await self.cache.aget("a"), "A")
+        self.assertEqual(len(threads), 3)
+        self.assertEqual(self.cache.stats()["disk_hits"], 1)
+        self.assertIsNone(await self.cache.aget("missing"))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+
+class LLMClientCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_generate_uses_cache_only_when_opted_in(self):
+        llm = generator.LLMClient()
+        fake = SimpleNamespace(
+            model="m",
+            sampling_params=lambda: {"temperature": 0.7},
+            generate=AsyncMock(return_value="结果"),
+        )
+        llm.client = fake
+        with patch.object(generator, "llm_response_cache", LLMResponseCache(path=None)):
+            self.assertEqual(await llm.generate("p", cache=True), "结果")
+            self.assertEqual(await llm.generate("p", cache=True), "结果")
+            self.assertEqual(fake.generate.await_count, 1)
+
+            await llm.generate("p")
+            self.assertEqual(fake.generate.await_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.services import generator
+from app.services.generator import LLMClient, OpenAICompatClient
+from app.services.http_pool import http_session_pool
+from app.services.llm_ledger import LLMLedger
+from app.services.llm_retry import RetryPolicy
+from app.services.llm_scheduler import LLMPriority
+
+
+class LLMLedgerTests(unittest.TestCase):
+    def test_groups_by_call_site_and_model_with_cost(self):
+        ledger = LLMLedger(prices={"m": {"prompt": 1.0, "completion": 2.0}})
+        with ledger.trace("summary", "m", prompt_tokens=100) as trace:
+            trace.set_usage({"prompt_tokens": 1000, "completion_tokens": 500})
+        with ledger.trace("summary", "m", prompt_tokens=10) as trace:
+            trace.add_completion("你好")
+        with ledger.trace("chat", "other", prompt_tokens=10):
+            pass
+
+        stats = ledger.stats()
+        groups = {(g["call_site"], g["model"]): g for g in stats["groups"]}
+        summary = groups[("summary", "m")]
+        self.assertEqual(summary["calls"], 2)
+        self.assertEqual(summary["estimated_calls"], 1)
+        self.assertEqual(summary["prompt_tokens"], 1010)
+        self.assertEqual(summary["completion_tokens"], 502)
+        self.assertAlmostEqual(summary["cost"], (1010 * 1.0 + 502 * 2.0) / 1000)
+        self.assertEqual(groups[("chat", "other")]["cost"], 0.0)
+        self.assertEqual(stats["totals"]["calls"], 3)
+
+    def test_errors_are_recorded_and_reraised(self):
+        ledger = LLMLedger()
+        with self.assertRaises(RuntimeError):
+            with ledger.trace("beats", "m"):
+                raise RuntimeError("boom")
+        recent = ledger.stats(recent=5)["recent"]
+        self.assertEqual(recent[0]["status"], "error")
+        self.assertEqual(recent[0]["error"], "boom")
+
+
+class LLMClientLedgerTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def completions(request):
+            body = await request.json()
+            if body.get("stream"):
+                response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+                await response.prepare(request)
+                for piece in ["第一", "第二", "第三"]:
+                    data = {"choices": [{"delta": {"content": piece}}]}
+                    await response.write(f"data: {json.dumps(data)}\n\n".encode())
+                    await asyncio.sleep(0.01)
+                usage = {"choices": [], "usage": {"prompt_tokens": 7, "completion_tokens": 6}}
+                await response.write(f"data: {json.dumps(usage)}\n\n".encode())
+                await response.write(b"data: [DONE]\n\n")
+                return response
+            return web.json_response({
+                "choices": [{"message": {"content": "摘要"}}],
+                "usage": {"prompt_tokens": 11, "completion_tokens": 3},
+            })
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", completions)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.client = OpenAICompatClient(
+            api_key="k",
+            base_url=str(self.server.make_url("/v1")),
+            model="m",
+            retry_policy=RetryPolicy(max_retries=0),
+        )
+        self.ledger = LLMLedger()
+        patcher = patch.object(generator, "llm_ledger", self.ledger)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await http_session_pool.close()
+        await self.server.close()
+
+    async def test_generate_records_reported_usage(self):
+        response = await LLMClient._scheduled_generate(self.client, "p", LLMPriority.BACKGROUND, "summary")
+        self.assertEqual(response, "摘要")
+        group = self.ledger.stats()["groups"][0]
+        self.assertEqual((group["call_site"], group["model"]), ("summary", "m"))
+        self.assertEqual((group["prompt_tokens"], group["completion_tokens"]), (11, 3))
+        self.assertEqual(group["estimated_calls"], 0)
+
+    async def test_stream_records_ttft_and_trailing_usage(self):
+        chunks = [c async for c in LLMClient._scheduled_stream(
+            self.client, "p", LLMPriority.INTERACTIVE, "scene_writing"
+        )]
+        self.assertEqual("".join(chunks), "第一第二第三")
+        record = self.ledger.stats(recent=1)["recent"][0]
+        self.assertTrue(record["stream"])
+        self.assertEqual(record["completion_tokens"], 6)
+        self.assertIsNotNone(record["ttft_seconds"])
+        self.assertLessEqual(record["ttft_seconds"], record["latency_seconds"])
+
+    async def test_stream_closed_early_is_recorded_as_cancelled(self):
+        stream = LLMClient._scheduled_stream(self.client, "p", LLMPriority.INTERACTIVE, "chat")
+        self.assertEqual(await stream.__anext__(), "第一")
+        await stream.aclose()
+        record = self.ledger.stats(recent=1)["recent"][0]
+        self.assertEqual(record["status"], "cancelled")
+        self.assertEqual(record["call_site"], "chat")
+
+
+if __name__ == "__main__":
+    unittest.main()
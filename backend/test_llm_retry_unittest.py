@@ -0,0 +1,266 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.services import generator
+from app.services.generator import LLMClient, OpenAICompatClient
+from app.services.http_pool import http_session_pool
+from app.services.llm_ledger import LLMCallTrace
+from app.services.llm_scheduler import LLMPriority, LLMScheduler
+from app.services.llm_retry import (
+    LLMAPIError,
+    RetryPolicy,
+    call_with_retry,
+    hedged_call,
+    hedged_stream,
+    parse_retry_after,
+)
+
+FAST = RetryPolicy(max_retries=3, base_delay=0.001, max_delay=0.01)
+
+
+class RetryTests(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_retryable_errors_then_succeeds(self):
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise LLMAPIError(503, "busy")
+            return "ok"
+
+        self.assertEqual(await call_with_retry(flaky, FAST), "ok")
+        self.assertEqual(len(attempts), 3)
+
+    async def test_does_not_retry_client_errors(self):
+        attempts = []
+
+        async def bad_request():
+            attempts.append(1)
+            raise LLMAPIError(400, "bad")
+
+        with self.assertRaises(LLMAPIError):
+            await call_with_retry(bad_request, FAST)
+        self.assertEqual(len(attempts), 1)
+
+    def test_retry_after_wins_over_backoff(self):
+        self.assertEqual(FAST.delay(0, retry_after=2.0), 2.0)
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertIsNone(parse_retry_after("soon"))
+
+    async def test_hedged_call_uses_faster_attempt(self):
+        delays = [0.5, 0.01]
+
+        async def call():
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return delay
+
+        self.assertEqual(await hedged_call(call, hedge_after=0.02), 0.01)
+
+    async def test_hedged_stream_races_on_first_token(self):
+        starts = []
+
+        async def stream():
+            index = len(starts)
+            starts.append(index)
+            await asyncio.sleep(0.5 if index == 0 else 0.0)
+            for chunk in [f"s{index}-a", f"s{index}-b"]:
+                yield chunk
+
+        chunks = [c async for c in hedged_stream(stream, hedge_after=0.02)]
+        self.assertEqual(chunks, ["s1-a", "s1-b"])
+        self.assertEqual(len(starts), 2)
+
+
+class OpenAICompatClientRetryTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.hits = 0
+
+        async def completions(request):
+            self.hits += 1
+            if self.hits == 1:
+                return web.Response(status=429, text="rate limited", headers={"Retry-After": "0"})
+            body = await request.json()
+            if body.get("stream"):
+                response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+                await response.prepare(request)
+                for piece in ["你", "好"]:
+                    data = {"choices": [{"delta": {"content": piece}}]}
+                    await response.write(f"data: {json.dumps(data)}\n\n".encode())
+                await response.write(b"data: [DONE]\n\n")
+                return response
+            return web.json_response({"choices": [{"message": {"content": "你好"}}]})
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", completions)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.client = OpenAICompatClient(
+            api_key="k",
+            base_url=str(self.server.make_url("/v1")),
+            model="m",
+            retry_policy=FAST,
+        )
+
+    async def asyncTearDown(self):
+        await http_session_pool.close()
+        await self.server.close()
+
+    async def test_generate_retries_429(self):
+        self.assertEqual(await self.client.generate("hi"), "你好")
+        self.assertEqual(self.hits, 2)
+
+    async def test_generate_stream_retries_429_before_first_chunk(self):
+        chunks = [c async for c in self.client.generate_stream("hi")]
+        self.assertEqual("".join(chunks), "你好")
+        self.assertEqual(self.hits, 2)
+
+
+class ScheduledAttemptTests(unittest.IsolatedAsyncioTestCase):
+    """调度名额按上游尝试占用：退避时释放，对冲请求单独排队"""
+
+    async def asyncSetUp(self):
+        self.hits = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.responses = []  # 每次请求依次取 (status, 延迟秒数)
+
+        async def completions(request):
+            self.hits += 1
+            hit = self.hits
+            status, delay = self.responses.pop(0) if self.responses else (200, 0)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.in_flight -= 1
+            if status != 200:
+                return web.Response(status=status, text="rate limited", headers={"Retry-After": "0.3"})
+            if (await request.json()).get("stream"):
+                response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+                await response.prepare(request)
+                await response.write(f"data: {json.dumps({'choices': [{'delta': {'content': '好'}}]})}\n\n".encode())
+                await response.write(b"data: [DONE]\n\n")
+                return response
+            # completion_tokens 标记是第几次请求的响应
+            return web.json_response({
+                "choices": [{"message": {"content": "好"}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": hit},
+            })
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", completions)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        await http_session_pool.close()
+        await self.server.close()
+
+    def _client(self, hedge_after=0.0):
+        return OpenAICompatClient(
+            api_key="k", base_url=str(self.server.make_url("/v1")), model="m",
+            retry_policy=FAST, hedge_after=hedge_after,
+        )
+
+    def _scheduler(self, limit):
+        scheduler = LLMScheduler(max_concurrency=limit)
+        patcher = patch.object(generator, "llm_scheduler", scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return scheduler
+
+    async def test_backoff_releases_slot_and_each_attempt_is_admitted(self):
+        scheduler = self._scheduler(limit=1)
+        self.responses = [(429, 0)]
+        task = asyncio.ensure_future(
+            LLMClient._scheduled_generate(self._client(), "p", LLMPriority.BACKGROUND, "summary")
+        )
+        while self.hits < 1:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        # 后台调用在 Retry-After 退避中，交互请求无需排队
+        async with scheduler.slot("m", LLMPriority.INTERACTIVE) as slot:
+            self.assertEqual(slot.wait_seconds, 0.0)
+        self.assertEqual(await task, "好")
+        self.assertEqual(scheduler.stats()["models"]["m"]["admitted"]["background"], 2)
+
+    async def _hedged(self, limit):
+        scheduler = self._scheduler(limit)
+        self.responses = [(200, 0.3), (200, 0)]
+        response = await LLMClient._scheduled_generate(
+            self._client(hedge_after=0.05), "p", LLMPriority.BACKGROUND, "summary"
+        )
+        self.assertEqual(response, "好")
+        return scheduler.stats()["models"]["m"]
+
+    async def test_hedge_is_its_own_attempt(self):
+        lane = await self._hedged(limit=2)
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(lane["admitted"]["background"], 2)
+
+    async def test_hedge_waits_for_slot_within_concurrency(self):
+        lane = await self._hedged(limit=1)
+        # 名额为 1 时对冲请求只能排队，不会与主请求同时在途
+        self.assertEqual(self.peak, 1)
+        self.assertEqual(lane["active"], 0)
+
+    async def _hold_slot(self, scheduler, seconds):
+        async with scheduler.slot("m", LLMPriority.INTERACTIVE):
+            await asyncio.sleep(seconds)
+
+    async def test_queue_wait_does_not_trigger_hedge(self):
+        scheduler = self._scheduler(limit=1)
+        holder = asyncio.ensure_future(self._hold_slot(scheduler, 0.2))
+        await asyncio.sleep(0)
+        trace = LLMCallTrace("summary", "m", 1)
+        # 排队 0.2s 远超 hedge_after，但主请求放行后立即返回，不应发出对冲请求
+        response = await self._client(hedge_after=0.05).generate(
+            "p", trace=trace, admit=scheduler.admission("m", LLMPriority.BACKGROUND)
+        )
+        await holder
+        self.assertEqual(response, "好")
+        self.assertEqual(self.hits, 1)
+        self.assertEqual(scheduler.stats()["models"]["m"]["admitted"]["background"], 1)
+        self.assertGreaterEqual(trace.queue_wait, 0.15)
+
+    async def test_queue_wait_does_not_trigger_stream_hedge(self):
+        scheduler = self._scheduler(limit=1)
+        holder = asyncio.ensure_future(self._hold_slot(scheduler, 0.2))
+        await asyncio.sleep(0)
+        trace = LLMCallTrace("summary", "m", 1, stream=True)
+        chunks = [
+            c async for c in self._client(hedge_after=0.05).generate_stream(
+                "p", trace=trace, admit=scheduler.admission("m", LLMPriority.BACKGROUND)
+            )
+        ]
+        await holder
+        self.assertEqual(chunks, ["好"])
+        self.assertEqual(self.hits, 1)
+        self.assertEqual(scheduler.stats()["models"]["m"]["active"], 0)
+        self.assertGreaterEqual(trace.queue_wait, 0.15)
+
+    async def test_hedge_usage_and_queue_wait_are_not_mixed(self):
+        scheduler = self._scheduler(limit=2)
+        holder = asyncio.ensure_future(self._hold_slot(scheduler, 0.15))
+        await asyncio.sleep(0)
+        self.responses = [(200, 0.3), (200, 0)]
+        trace = LLMCallTrace("summary", "m", 1)
+        # 主请求立即放行但很慢；对冲请求排队约 0.1s 后胜出
+        response = await self._client(hedge_after=0.05).generate(
+            "p", trace=trace, admit=scheduler.admission("m", LLMPriority.BACKGROUND)
+        )
+        await holder
+        self.assertEqual(response, "好")
+        self.assertEqual(trace.completion_tokens, 2)
+        self.assertEqual(trace.queue_wait, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
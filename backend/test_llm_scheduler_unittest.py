@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+
+from app.services.llm_scheduler import LLMPriority, LLMScheduler, TokenBucket
+
+
+class LLMSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_interactive_admitted_before_queued_background(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        order = []
+
+        async def job(name, priority):
+            async with scheduler.slot("m", priority):
+                order.append(name)
+                await asyncio.sleep(0.005)
+
+        async with scheduler.slot("m", LLMPriority.BACKGROUND):
+            tasks = [
+                asyncio.create_task(job("batch", LLMPriority.BATCH)),
+                asyncio.create_task(job("background", LLMPriority.BACKGROUND)),
+                asyncio.create_task(job("interactive", LLMPriority.INTERACTIVE)),
+                asyncio.create_task(job("editorial", LLMPriority.EDITORIAL)),
+            ]
+            await asyncio.sleep(0.01)
+            queued = scheduler.stats()["models"]["m"]["queued"]
+            self.assertEqual(sum(queued.values()), 4)
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(order, ["interactive", "editorial", "background", "batch"])
+
+    async def test_per_model_concurrency_cap(self):
+        scheduler = LLMScheduler(max_concurrency=5, model_concurrency={"small": 2})
+        peak = {"small": 0, "big": 0}
+        running = {"small": 0, "big": 0}
+
+        async def job(model):
+            async with scheduler.slot(model, LLMPriority.BACKGROUND):
+                running[model] += 1
+                peak[model] = max(peak[model], running[model])
+                await asyncio.sleep(0.005)
+                running[model] -= 1
+
+        await asyncio.gather(*(job("small") for _ in range(6)), *(job("big") for _ in range(6)))
+        self.assertEqual(peak["small"], 2)
+        self.assertEqual(peak["big"], 5)
+
+    async def test_cancelled_waiter_is_skipped(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        async with scheduler.slot("m"):
+            waiter = asyncio.create_task(scheduler.acquire("m", LLMPriority.INTERACTIVE))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+        async with scheduler.slot("m", LLMPriority.BATCH) as slot:
+            self.assertEqual(slot.priority, LLMPriority.BATCH)
+        self.assertEqual(scheduler.stats()["models"]["m"]["active"], 0)
+
+    async def test_rpm_bucket_delays_admission(self):
+        scheduler = LLMScheduler(max_concurrency=5, rpm_limit=600)  # 每 0.1 秒补 1 个
+        scheduler._lane("m").requests.tokens = 0
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        async with scheduler.slot("m") as slot:
+            pass
+        self.assertGreaterEqual(loop.time() - started, 0.08)
+        self.assertGreater(slot.wait_seconds, 0)
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_unlimited_bucket_never_waits(self):
+        bucket = TokenBucket(0)
+        self.assertEqual(bucket.wait_time(10_000), 0)
+
+    def test_oversized_request_waits_for_full_bucket_only(self):
+        bucket = TokenBucket(100)
+        self.assertEqual(bucket.wait_time(500), 0)
+        bucket.take(500)
+        self.assertGreater(bucket.wait_time(1), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
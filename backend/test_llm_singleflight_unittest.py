@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from app.services.llm_singleflight import SingleFlight
+
+
+class SingleFlightTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_one_upstream_request(self):
+        sf = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "摘要"
+
+        results = await asyncio.gather(*(sf.do("k", fetch) for _ in range(5)))
+        self.assertEqual(results, ["摘要"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sf.stats()["coalesced"], 4)
+        self.assertEqual(sf.stats()["in_flight"], 0)
+
+        await sf.do("k", fetch)
+        self.assertEqual(len(calls), 2, "完成后的请求不应再被复用")
+
+    async def test_error_is_shared(self):
+        sf = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream 500")
+
+        results = await asyncio.gather(sf.do("k", boom), sf.do("k", boom), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+    async def test_cancelled_waiter_does_not_cancel_others(self):
+        sf = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        first = asyncio.create_task(sf.do("k", fetch))
+        second = asyncio.create_task(sf.do("k", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, "ok")
+
+    async def test_stream_subscribers_share_chunks(self):
+        sf = SingleFlight()
+        opened = []
+
+        async def upstream():
+            opened.append(1)
+            for chunk in ["天", "地", "玄", "黄"]:
+                await asyncio.sleep(0.005)
+                yield chunk
+
+        async def consume():
+            return "".join([c async for c in sf.stream("k", upstream)])
+
+        first = asyncio.create_task(consume())
+        await asyncio.sleep(0.012)  # 第二个订阅者在流中途加入，应回放已收到的内容
+        second = asyncio.create_task(consume())
+        self.assertEqual(await first, "天地玄黄")
+        self.assertEqual(await second, "天地玄黄")
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(sf.stats()["stream_coalesced"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,17 +24,14 @@ class NovelUsecasesTests(unittest.IsolatedAsyncioTestCase):
         db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult(scalar=SimpleNamespace(id="n1"))))
 
         with patch.object(
-            novel_usecases.rag_service,
-            "retrieve_all_by_novel",
-            new=MagicMock(
-                return_value=[
-                    {"id": "doc-1", "text": "old", "metadata": {"scene_id": "s1", "novel_id": "n1"}}
-                ]
-            ),
-        ), patch.object(novel_usecases.rag_service, "add_knowledge", new=MagicMock()) as mock_add:
+            novel_usecases.async_rag,
+            "get_by_ids",
+            new=AsyncMock(return_value=[{"id": "doc-1", "metadata": {"scene_id": "s1", "novel_id": "n1"}}]),
+        ) as mock_get, patch.object(novel_usecases.async_rag, "add_knowledge", new=AsyncMock()) as mock_add:
             result = await novel_usecases.update_rag_summary_for_novel("n1", "doc-1", "new", db)
 
         self.assertEqual(result, {"message": "Summary updated", "id": "doc-1"})
+        mock_get.assert_called_once_with(["doc-1"], "scene_summary", novel_id="n1", include_documents=False)
         mock_add.assert_called_once()
         kwargs = mock_add.call_args.kwargs
         self.assertEqual(kwargs["metadata"]["scene_id"], "s1")
@@ -43,20 +40,28 @@ class NovelUsecasesTests(unittest.IsolatedAsyncioTestCase):
     async def test_update_rag_summary_for_novel_missing_summary(self):
         db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult(scalar=SimpleNamespace(id="n1"))))
         with patch.object(
-            novel_usecases.rag_service,
-            "retrieve_all_by_novel",
-            new=MagicMock(return_value=[]),
+            novel_usecases.async_rag,
+            "get_by_ids",
+            new=AsyncMock(return_value=[]),
         ):
             with self.assertRaises(HTTPException) as ctx:
                 await novel_usecases.update_rag_summary_for_novel("n1", "missing", "new", db)
         self.assertEqual(ctx.exception.status_code, 404)
 
+    async def test_get_rag_summaries_for_novel_paginates(self):
+        db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult(scalar=SimpleNamespace(id="n1"))))
+        page = {"items": [{"id": "doc-3", "metadata": {}}], "next_offset": 3}
+        with patch.object(novel_usecases.async_rag, "list_by_novel", new=AsyncMock(return_value=page)) as mock_list:
+            result = await novel_usecases.get_rag_summaries_for_novel("n1", db, limit=1, offset=2, include_text=False)
+        self.assertEqual(result, page)
+        mock_list.assert_called_once_with("n1", "scene_summary", limit=1, offset=2, include_documents=False)
+
     async def test_delete_rag_summary_for_novel_success(self):
         db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult(scalar=SimpleNamespace(id="n1"))))
-        with patch.object(novel_usecases.rag_service, "delete_knowledge", new=MagicMock()) as mock_delete:
+        with patch.object(novel_usecases.async_rag, "delete_knowledge", new=AsyncMock()) as mock_delete:
             result = await novel_usecases.delete_rag_summary_for_novel("n1", "doc-1", db)
         self.assertEqual(result, {"message": "Summary deleted"})
-        mock_delete.assert_called_once_with("doc-1", "scene_summary")
+        mock_delete.assert_called_once_with("doc-1", "scene_summary", novel_id="n1")
 
     async def test_build_novel_export_payload_success(self):
         novel = SimpleNamespace(id="n1", title="标题", premise="简介")
@@ -112,7 +117,9 @@ class NovelUsecasesTests(unittest.IsolatedAsyncioTestCase):
                     "lore": [{"id": "l1", "title": "设定", "content": "x"}],
                 }
             ),
-        ):
+        ), patch.object(novel_usecases, "index_lore") as index_lore, patch.object(
+            novel_usecases, "remove_lore"
+        ) as remove_lore:
             chapters = await novel_usecases.generate_novel_outline_for_novel(
                 novel_id="n1",
                 premise="p",
@@ -128,6 +135,8 @@ class NovelUsecasesTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(novel.tone, "t")
         self.assertEqual(db.commit.await_count, 3)
         self.assertEqual(db.delete.await_count, 3)
+        remove_lore.assert_called_once_with(["old-l"], "n1")
+        self.assertEqual([l.title for l in index_lore.call_args.args[0]], ["设定"])
 
     async def test_generate_novel_outline_for_novel_not_found(self):
         db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult(scalar=None)))
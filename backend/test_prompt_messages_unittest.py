@@ -0,0 +1,107 @@
+import unittest
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestServer
+
+from app.services.fake_llm import FakeLLMConfig, create_fake_llm_app
+from app.services.generator import OpenAICompatClient, SceneGenerator, novel_bible
+from app.services.http_pool import http_session_pool
+from app.services.llm_ledger import LLMCallTrace, LLMLedger
+from app.services.prompt_messages import layered_messages, prompt_text, to_messages
+from app.services.tokens import estimate_tokens
+
+FAST = FakeLLMConfig(ttft=0.0, tokens_per_second=0)
+
+
+def _novel(**overrides):
+    fields = dict(
+        title="青云志", genre="玄幻", tone="严肃", premise="外门弟子逆天改命",
+        philosophical_theme="天道无情", worldbuilding="东洲三大仙门" * 400,
+    )
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+def _scene(beat, location="藏经阁"):
+    return SimpleNamespace(id=beat, beat_description=beat, location=location, tension_level=7, emotional_target=None)
+
+
+class PromptLayoutTests(unittest.TestCase):
+    def test_string_prompt_is_single_user_message(self):
+        self.assertEqual(to_messages("hi"), [{"role": "user", "content": "hi"}])
+        # 字符串 prompt 展开后不变，已有响应缓存键保持有效
+        self.assertEqual(prompt_text("hi"), "hi")
+        messages = layered_messages("规则", "设定", "数据")
+        self.assertEqual([m["role"] for m in messages], ["system", "user"])
+        self.assertEqual(messages[0]["content"], "规则\n\n设定")
+
+    def test_writing_prompt_prefix_is_identical_across_scenes(self):
+        generator = SceneGenerator(SimpleNamespace(model="m"))
+        context = {"prev_summaries": ["前情"], "character_contexts": [], "relationships": [], "lore_contexts": []}
+        novel = _novel()
+        first = generator._build_writing_prompt(_scene("林远潜入藏经阁"), context, novel=novel)
+        second = generator._build_writing_prompt(_scene("秦霜拔剑", "后山"), {**context, "prev_summaries": []}, novel=novel)
+
+        self.assertEqual(first[0], second[0])
+        self.assertNotEqual(first[1], second[1])
+        self.assertIn("天道无情", first[0]["content"])
+        self.assertIn("林远潜入藏经阁", first[1]["content"])
+        self.assertNotIn("林远潜入藏经阁", first[0]["content"])
+        # 世界观在系统消息中按预算截断
+        self.assertLess(len(novel_bible(novel)), len(novel.worldbuilding))
+        self.assertNotEqual(
+            first[0], generator._build_writing_prompt(_scene("x"), context, novel=_novel(title="别的书"))[0]
+        )
+
+
+class CachedTokenUsageTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = TestServer(create_fake_llm_app(FAST))
+        await self.server.start_server()
+        self.client = OpenAICompatClient(api_key="k", base_url=str(self.server.make_url("/v1")), model="fake")
+
+    async def asyncTearDown(self):
+        await http_session_pool.close()
+        await self.server.close()
+
+    async def test_repeated_prefix_reports_cached_tokens(self):
+        traces = []
+        for beat in ("第一场", "第二场"):
+            trace = LLMCallTrace("scene_writing", "fake", 0)
+            await self.client.generate(layered_messages("写作规则" * 50, "作品设定" * 50, beat), trace=trace)
+            traces.append(trace)
+        self.assertEqual(traces[0].cached_tokens, 0)
+        self.assertEqual(traces[1].cached_tokens, estimate_tokens(layered_messages("写作规则" * 50, "作品设定" * 50)[0]["content"]))
+
+        stream_trace = LLMCallTrace("scene_writing", "fake", 0, stream=True)
+        chunks = [c async for c in self.client.generate_stream(
+            layered_messages("写作规则" * 50, "作品设定" * 50, "第三场"), trace=stream_trace
+        )]
+        self.assertTrue(chunks)
+        self.assertGreater(stream_trace.cached_tokens, 0)
+
+
+class LedgerCacheStatsTests(unittest.TestCase):
+    def test_usage_layouts(self):
+        for usage in (
+            {"prompt_tokens": 100, "completion_tokens": 5, "prompt_tokens_details": {"cached_tokens": 80}},
+            {"input_tokens": 100, "output_tokens": 5, "input_token_details": {"cache_read": 80}},
+            {"prompt_tokens": 100, "completion_tokens": 5, "prompt_cache_hit_tokens": 80},
+        ):
+            trace = LLMCallTrace("x", "m", 0)
+            trace.set_usage(usage)
+            self.assertEqual(trace.cached_tokens, 80)
+
+    def test_hit_rate_and_cached_price(self):
+        ledger = LLMLedger(prices={"m": {"prompt": 1.0, "cached_prompt": 0.1, "completion": 2.0}})
+        with ledger.trace("scene_writing", "m") as trace:
+            trace.set_usage({"prompt_tokens": 1000, "completion_tokens": 500, "prompt_tokens_details": {"cached_tokens": 800}})
+        group = ledger.stats()["groups"][0]
+        self.assertEqual(group["cached_tokens"], 800)
+        self.assertEqual(group["cache_hit_rate"], 0.8)
+        self.assertAlmostEqual(group["cost"], 0.2 + 0.08 + 1.0)
+        self.assertEqual(ledger.stats()["totals"]["cached_tokens"], 800)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.service import RAGService
+
+
+def _hit(id, distance):
+    return {"id": id, "text": id, "distance": distance, "metadata": {}}
+
+
+class RAGBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.rag = RAGService(persist_directory=self.temp_dir, embedding_cache=EmbeddingCache())
+        # 只校验调用形态，不触发嵌入模型
+        self.rag.lore_collection = MagicMock()
+
+    def test_add_knowledge_many_upserts_in_batches(self):
+        count = self.rag.add_knowledge_many(
+            texts=["a", "b", "c"],
+            doc_ids=["1", "2", "3"],
+            type="lore",
+            metadatas=[{"novel_id": "n1"}, None, {"novel_id": "n1"}],
+            batch_size=2,
+        )
+        self.assertEqual(count, 3)
+        calls = self.rag.lore_collection.upsert.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0].kwargs["ids"], ["1", "2"])
+        self.assertEqual(calls[0].kwargs["metadatas"], [{"novel_id": "n1", "type": "lore"}, {"type": "lore"}])
+
+    def test_add_knowledge_many_rejects_mismatched_lengths(self):
+        with self.assertRaises(ValueError):
+            self.rag.add_knowledge_many(texts=["a"], doc_ids=["1", "2"], type="lore")
+
+    def test_retrieve_context_many_is_one_query(self):
+        self.rag.lore_collection.query.return_value = {
+            "ids": [["l1"], ["l2", "l1"]],
+            "documents": [["设定1"], ["设定2", "设定1"]],
+            "distances": [[0.1], [0.2, 0.3]],
+            "metadatas": [[{"novel_id": "n1"}], [{"novel_id": "n1"}, {"novel_id": "n1"}]],
+        }
+
+        results = self.rag.retrieve_context_many(["剑", "宗门"], type="lore", top_k=2, novel_id="n1")
+
+        self.rag.lore_collection.query.assert_called_once_with(
+            query_texts=["剑", "宗门"], n_results=2, where={"novel_id": "n1"}
+        )
+        self.assertEqual([[r["id"] for r in rs] for rs in results], [["l1"], ["l2", "l1"]])
+        self.assertEqual(results[1][1]["distance"], 0.3)
+
+    def test_retrieve_context_many_without_queries(self):
+        self.assertEqual(self.rag.retrieve_context_many([], type="lore"), [])
+        self.rag.lore_collection.query.assert_not_called()
+
+    def test_merge_results_dedupes_by_best_distance(self):
+        merged = RAGService.merge_results(
+            [[_hit("a", 0.5), _hit("b", 0.2)], [_hit("a", 0.1), _hit("c", 0.9)]], top_k=2
+        )
+        self.assertEqual([(r["id"], r["distance"]) for r in merged], [("a", 0.1), ("b", 0.2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@
 """RAG 按 novel_id 隔离的单元测试：验证检索结果仅来自指定小说。"""
 import tempfile
 import unittest
+from app.rag.embedding_cache import EmbeddingCache
 from app.rag.service import RAGService
 
 
@@ -10,7 +11,8 @@ class TestRAGNovelIsolation(unittest.TestCase):
 
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
-        self.rag = RAGService(persist_directory=self.temp_dir)
+        # 仅内存嵌入缓存，不在工作目录留下 SQLite 文件
+        self.rag = RAGService(persist_directory=self.temp_dir, embedding_cache=EmbeddingCache())
 
     def test_retrieve_context_filters_by_novel_id(self):
         # 为小说 A 和 B 各写入一条场景摘要
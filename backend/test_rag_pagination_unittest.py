@@ -0,0 +1,82 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.embeddings import Embedder
+from app.rag.service import RAGService
+
+
+class _CountingEmbedder(Embedder):
+    name = "count"
+
+    def _load(self):
+        pass
+
+    def _embed(self, texts):
+        return [[float(len(t)), float(sum(map(ord, t)) % 97)] for t in texts]
+
+
+class RAGPaginationTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+    def _seed(self, mode="global"):
+        rag = RAGService(
+            persist_directory=tempfile.mkdtemp(dir=self.temp_dir),
+            embedder=_CountingEmbedder(),
+            embedding_cache=EmbeddingCache(),
+            partition_mode=mode,
+        )
+        ids = [f"scene_summary_{i}" for i in range(5)]
+        rag.add_knowledge_many(
+            [f"第{i}场摘要" for i in range(5)], ids, "scene_summary", [{"novel_id": "n1", "scene_id": str(i)} for i in range(5)]
+        )
+        rag.add_knowledge("别的小说", "scene_summary_x", "scene_summary", {"novel_id": "n2"})
+        return rag, ids
+
+    def test_pages_cover_all_documents_once(self):
+        for mode in ("global", "novel"):
+            with self.subTest(mode=mode):
+                rag, ids = self._seed(mode)
+                seen, offset, pages = [], 0, 0
+                while offset is not None:
+                    page = rag.list_by_novel("n1", "scene_summary", limit=2, offset=offset)
+                    seen += [item["id"] for item in page["items"]]
+                    offset = page["next_offset"]
+                    pages += 1
+                self.assertEqual(sorted(seen), ids)
+                self.assertEqual(pages, 3)
+
+    def test_limit_is_pushed_into_chroma(self):
+        rag, _ = self._seed()
+        collection_cls = type(rag.summaries_collection)
+        with patch.object(collection_cls, "get", autospec=True, side_effect=collection_cls.get) as get:
+            items = rag.retrieve_all_by_novel("n1", "scene_summary", top_k=2)
+        self.assertEqual(len(items), 2)
+        self.assertEqual(get.call_args.kwargs["limit"], 3)
+
+    def test_ids_only_listing(self):
+        rag, _ = self._seed()
+        page = rag.list_by_novel("n1", "scene_summary", limit=None, include_documents=False)
+        self.assertEqual(len(page["items"]), 5)
+        self.assertIsNone(page["next_offset"])
+        self.assertNotIn("text", page["items"][0])
+        self.assertIn("scene_id", page["items"][0]["metadata"])
+
+    def test_get_by_ids_keeps_order_and_scopes_novel(self):
+        for mode in ("global", "novel"):
+            with self.subTest(mode=mode):
+                rag, _ = self._seed(mode)
+                found = rag.get_by_ids(
+                    ["scene_summary_3", "missing", "scene_summary_1", "scene_summary_x"], "scene_summary", novel_id="n1"
+                )
+                self.assertEqual([f["id"] for f in found], ["scene_summary_3", "scene_summary_1"])
+                self.assertEqual(found[0]["text"], "第3场摘要")
+                self.assertEqual([f["id"] for f in rag.get_by_ids(["scene_summary_x"], "scene_summary")], ["scene_summary_x"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import shutil
+import tempfile
+import unittest
+
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.embeddings import Embedder
+from app.rag.service import RAGService
+
+
+class _CountingEmbedder(Embedder):
+    name = "count"
+
+    def __init__(self):
+        super().__init__()
+        self.embedded = 0
+
+    def _load(self):
+        pass
+
+    def _embed(self, texts):
+        self.embedded += len(texts)
+        return [[float(len(t)), float(sum(map(ord, t)) % 97)] for t in texts]
+
+
+class RAGPartitionTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.embedder = _CountingEmbedder()
+
+    def _service(self, mode, **kwargs):
+        return RAGService(
+            persist_directory=self.temp_dir,
+            embedder=self.embedder,
+            embedding_cache=EmbeddingCache(),
+            partition_mode=mode,
+            **kwargs,
+        )
+
+    def _seed(self, rag):
+        rag.add_knowledge_many(
+            ["青云宗", "北冥海", "丹鼎阁", "无主设定"],
+            ["lore_a1", "lore_a2", "lore_b1", "lore_x"],
+            "lore",
+            [{"novel_id": "a"}, {"novel_id": "a"}, {"novel_id": "b"}, {}],
+        )
+
+    def test_documents_go_to_their_novel_partition(self):
+        rag = self._service("novel")
+        self._seed(rag)
+
+        self.assertEqual(rag.lore_collection.get()["ids"], ["lore_x"])
+        self.assertEqual(sorted(d["id"] for d in rag.retrieve_all_by_novel("a", "lore")), ["lore_a1", "lore_a2"])
+        hits = rag.retrieve_context("青云宗", "lore", top_k=5, novel_id="b")
+        self.assertEqual([h["id"] for h in hits], ["lore_b1"])
+
+    def test_reads_do_not_create_partitions(self):
+        rag = self._service("novel")
+        self.assertEqual(rag.retrieve_context("任意", "lore", novel_id="missing"), [])
+        self.assertEqual(rag.retrieve_hybrid_many(["任意"], "lore", novel_id="missing"), [])
+        self.assertEqual(rag._partitions_of("lore"), [])
+
+    def test_handle_pool_is_bounded(self):
+        rag = self._service("novel", partition_pool_size=1)
+        self._seed(rag)
+        rag.retrieve_hybrid_many(["青云宗"], "lore", novel_id="a")
+        rag.retrieve_hybrid_many(["丹鼎阁"], "lore", novel_id="b")
+
+        self.assertEqual(len(rag._partitions), 1)
+        # 被淘汰分区的 BM25 索引一并释放
+        self.assertEqual(len(rag._lexical), 1)
+        self.assertEqual(rag.retrieve_hybrid_many(["青云宗"], "lore", top_k=1, novel_id="a")[0]["id"], "lore_a1")
+
+    def test_delete_with_and_without_novel_id(self):
+        rag = self._service("novel")
+        self._seed(rag)
+        rag.delete_knowledge("lore_a1", "lore", novel_id="a")
+        rag.delete_knowledge_many(["lore_b1"], "lore")
+
+        self.assertEqual([d["id"] for d in rag.retrieve_all_by_novel("a", "lore")], ["lore_a2"])
+        self.assertEqual(rag.retrieve_all_by_novel("b", "lore"), [])
+
+    def test_migrate_moves_vectors_without_reembedding(self):
+        self._seed(self._service("global"))
+        embedded = self.embedder.embedded
+        rag = self._service("novel")
+
+        report = rag.migrate_to_partitions(batch_size=2, delete_source=True)
+
+        self.assertEqual(report, {"character": 0, "lore": 3, "scene_summary": 0})
+        self.assertEqual(self.embedder.embedded, embedded)
+        self.assertEqual(rag.lore_collection.get()["ids"], ["lore_x"])
+        self.assertEqual(sorted(d["id"] for d in rag.retrieve_all_by_novel("a", "lore")), ["lore_a1", "lore_a2"])
+        # 可重复执行
+        self.assertEqual(rag.migrate_to_partitions()["lore"], 0)
+
+    def test_migrate_requires_partition_mode(self):
+        with self.assertRaises(ValueError):
+            self._service("global").migrate_to_partitions()
+
+
+if __name__ == "__main__":
+    unittest.main()
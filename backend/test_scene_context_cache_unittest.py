@@ -0,0 +1,142 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models import Chapter, Character, Lore, Novel, Relationship, Scene
+from app.services import generator, knowledge_index
+from app.services.generator import SceneGenerator
+from app.services.scene_context_cache import SceneContextCache, scene_context_cache
+
+
+class SceneContextCacheTests(unittest.TestCase):
+    def test_build_racing_with_invalidation_is_not_cached(self):
+        cache = SceneContextCache()
+        built_at = cache.clock()
+        cache.invalidate(["character:c1"])
+        cache.put("s1", {"prev_summaries": []}, ["character:c1"], built_at)
+        self.assertIsNone(cache.get("s1"))
+
+        built_at = cache.clock()
+        cache.put("s1", {"prev_summaries": ["a"]}, ["character:c1"], built_at)
+        cache.invalidate(["character:c2"])
+        self.assertEqual(cache.get("s1"), {"prev_summaries": ["a"]})
+        cache.invalidate(["character:c1"])
+        self.assertIsNone(cache.get("s1"))
+        self.assertEqual(cache.stats()["stale"], 1)
+
+    def test_returned_context_is_a_copy(self):
+        cache = SceneContextCache()
+        cache.put("s1", {"prev_summaries": ["a"]}, [], cache.clock())
+        cache.get("s1")["prev_summaries"].append("b")
+        self.assertEqual(cache.get("s1"), {"prev_summaries": ["a"]})
+
+
+class SceneContextInvalidationTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.db = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)()
+        scene_context_cache.clear()
+
+        self.novel = Novel(title="测试", premise="少年踏上修仙路")
+        self.db.add(self.novel)
+        await self.db.flush()
+        self.ch1 = Chapter(novel_id=self.novel.id, order_index=1, title="一")
+        self.ch2 = Chapter(novel_id=self.novel.id, order_index=2, title="二")
+        self.db.add_all([self.ch1, self.ch2])
+        await self.db.flush()
+        self.a = Character(novel_id=self.novel.id, name="林远", bio="山村少年")
+        self.b = Character(novel_id=self.novel.id, name="秦霜", bio="宗门师姐")
+        self.c = Character(novel_id=self.novel.id, name="路人", bio="无关")
+        self.db.add_all([self.a, self.b, self.c])
+        await self.db.flush()
+        self.s1 = Scene(chapter_id=self.ch1.id, order_index=1, summary="入门")
+        self.s2 = Scene(chapter_id=self.ch1.id, order_index=2, summary="试炼")
+        self.first = Scene(chapter_id=self.ch2.id, order_index=1, beat_description="对峙")
+        self.target = Scene(
+            chapter_id=self.ch2.id, order_index=2, beat_description="林远与秦霜论剑",
+            characters_present=[self.a.id, self.b.id],
+        )
+        self.db.add_all([self.s1, self.s2, self.first, self.target])
+        await self.db.commit()
+
+        self.generator = SceneGenerator(llm=None)
+        self.build = AsyncMock(wraps=self.generator._build_context)
+        patcher = patch.object(self.generator, "_build_context", self.build)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rag_patcher = patch.object(generator.async_rag, "retrieve_hybrid_many", new=AsyncMock(return_value=[]))
+        rag_patcher.start()
+        self.addCleanup(rag_patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        await self.engine.dispose()
+
+    async def _assert_rebuilt(self, scene, expected):
+        before = self.build.await_count
+        await self.generator.get_context(scene, self.db)
+        self.assertEqual(self.build.await_count - before, 1 if expected else 0)
+
+    async def test_second_read_is_served_from_cache(self):
+        first = await self.generator.get_context(self.target, self.db)
+        second = await self.generator.get_context(self.target, self.db)
+        self.assertEqual(first, second)
+        self.assertEqual(self.build.await_count, 1)
+        self.assertEqual([c["name"] for c in first["character_contexts"]], ["林远", "秦霜"])
+
+    async def test_unrelated_changes_keep_the_entry(self):
+        await self.generator.get_context(self.target, self.db)
+        self.first.content = "正文不是上下文的输入"
+        self.c.bio = "不在场"
+        self.db.add(Lore(novel_id=self.novel.id, title="未索引"))
+        await self.db.commit()
+        await self._assert_rebuilt(self.target, False)
+
+    async def test_earlier_summary_invalidates(self):
+        await self.generator.get_context(self.target, self.db)
+        self.first.summary = "二人初次对峙"
+        await self.db.commit()
+        await self._assert_rebuilt(self.target, True)
+
+    async def test_present_character_and_relationship_invalidate(self):
+        await self.generator.get_context(self.target, self.db)
+        self.a.bio = "外门弟子"
+        await self.db.commit()
+        await self._assert_rebuilt(self.target, True)
+
+        self.db.add(Relationship(novel_id=self.novel.id, character_a_id=self.a.id, character_b_id=self.b.id))
+        await self.db.commit()
+        context = await self.generator.get_context(self.target, self.db)
+        self.assertEqual(len(context["relationships"]), 1)
+
+    async def test_chapter_order_invalidates_first_scene_of_chapter(self):
+        context = await self.generator.get_context(self.first, self.db)
+        self.assertEqual(context["prev_summaries"], ["入门", "试炼"])
+        ch0 = Chapter(novel_id=self.novel.id, order_index=2, title="插入")
+        self.ch2.order_index = 3
+        self.db.add(ch0)
+        await self.db.commit()
+        context = await self.generator.get_context(self.first, self.db)
+        self.assertEqual(context["prev_summaries"], ["【故事背景】：少年踏上修仙路"])
+
+    async def test_lore_indexing_invalidates(self):
+        await self.generator.get_context(self.target, self.db)
+        with patch.object(knowledge_index.async_rag, "add_knowledge_many", new=AsyncMock(return_value=1)):
+            await knowledge_index.index_lore([Lore(id="l1", novel_id=self.novel.id, title="剑冢")])
+        await self._assert_rebuilt(self.target, True)
+
+    async def test_rollback_does_not_invalidate(self):
+        await self.generator.get_context(self.target, self.db)
+        self.first.summary = "未提交"
+        await self.db.flush()
+        await self.db.rollback()
+        await self.db.refresh(self.target)
+        await self._assert_rebuilt(self.target, False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models import Chapter, Character, Novel, Relationship, Scene
+from app.services import generator
+from app.services.generator import SceneGenerator
+
+
+class BuildContextQueryTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.db = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)()
+
+        self.novel = Novel(title="测试", premise="少年踏上修仙路")
+        self.db.add(self.novel)
+        await self.db.flush()
+        self.ch1 = Chapter(novel_id=self.novel.id, order_index=1, title="一")
+        self.ch2 = Chapter(novel_id=self.novel.id, order_index=2, title="二")
+        self.db.add_all([self.ch1, self.ch2])
+        await self.db.flush()
+        self.db.add_all([Scene(chapter_id=self.ch1.id, order_index=i, summary=f"一-{i}") for i in range(1, 6)])
+        self.db.add_all([Scene(chapter_id=self.ch2.id, order_index=i, summary=f"二-{i}") for i in range(1, 8)])
+        await self.db.commit()
+
+        self.queries = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._count)
+        self.generator = SceneGenerator(llm=None)
+        rag_patcher = patch.object(generator.async_rag, "retrieve_hybrid_many", new=AsyncMock(return_value=[]))
+        rag_patcher.start()
+        self.addCleanup(rag_patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        await self.engine.dispose()
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries.append(statement)
+
+    async def _scene_with_cast(self, size, order_index=8):
+        cast = [Character(novel_id=self.novel.id, name=f"角色{i}") for i in range(size)]
+        self.db.add_all(cast)
+        await self.db.flush()
+        self.db.add_all(
+            Relationship(novel_id=self.novel.id, character_a_id=a.id, character_b_id=b.id)
+            for a, b in zip(cast, cast[1:])
+        )
+        scene = Scene(
+            chapter_id=self.ch2.id, order_index=order_index, beat_description="论剑",
+            characters_present=[c.id for c in cast],
+        )
+        self.db.add(scene)
+        await self.db.commit()
+        return scene
+
+    async def _queries_for(self, scene):
+        self.queries.clear()
+        context = await self.generator._build_context(scene, self.db)
+        return len(self.queries), context
+
+    async def test_query_count_is_flat_as_cast_grows(self):
+        counts = {}
+        for size in (2, 5, 20):
+            counts[size], context = await self._queries_for(await self._scene_with_cast(size))
+            self.assertEqual(len(context["character_contexts"]), size)
+            self.assertEqual(len(context["relationships"]), size - 1)
+        self.assertEqual(set(counts.values()), {4}, counts)
+
+    async def test_same_chapter_window_keeps_last_five_in_order(self):
+        count, context = await self._queries_for(await self._scene_with_cast(0))
+        self.assertEqual(context["prev_summaries"], [f"二-{i}" for i in range(3, 8)])
+        self.assertEqual(count, 2)
+
+    async def test_first_scene_falls_back_to_previous_chapter_in_one_window(self):
+        scene = await self._scene_with_cast(0, order_index=0)
+        count, context = await self._queries_for(scene)
+        self.assertEqual(context["prev_summaries"], ["一-3", "一-4", "一-5"])
+        self.assertEqual(count, 2)
+
+    async def test_first_chapter_uses_premise(self):
+        scene = Scene(chapter_id=self.ch1.id, order_index=0)
+        self.db.add(scene)
+        await self.db.commit()
+        count, context = await self._queries_for(scene)
+        self.assertEqual(context["prev_summaries"], ["【故事背景】：少年踏上修仙路"])
+        self.assertEqual(count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
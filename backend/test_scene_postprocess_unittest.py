@@ -42,9 +42,9 @@ class ScenePostprocessTests(unittest.IsolatedAsyncioTestCase):
             "generate_summary",
             new=AsyncMock(return_value="摘要"),
         ) as mock_summary, patch.object(
-            scene_postprocess.rag_service,
+            scene_postprocess.async_rag,
             "add_knowledge",
-            new=MagicMock(),
+            new=AsyncMock(),
         ) as mock_add:
             await scene_postprocess.summarize_scene("scene-1")
 
@@ -61,9 +61,9 @@ class ScenePostprocessTests(unittest.IsolatedAsyncioTestCase):
             "AsyncSessionLocal",
             return_value=_AsyncSessionCtx(db),
         ), patch.object(
-            scene_postprocess.rag_service,
+            scene_postprocess.async_rag,
             "add_knowledge",
-            new=MagicMock(),
+            new=AsyncMock(),
         ) as mock_add:
             await scene_postprocess.update_scene_summary_in_rag("scene-1", "手动摘要")
 
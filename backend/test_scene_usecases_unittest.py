@@ -35,7 +35,7 @@ class SceneUsecasesTests(unittest.IsolatedAsyncioTestCase):
             "generate_summary",
             new=AsyncMock(return_value="摘要"),
         ) as mock_summary, patch.object(
-            scene_usecases.rag_service, "add_knowledge", new=MagicMock()
+            scene_usecases.async_rag, "add_knowledge", new=AsyncMock()
         ) as mock_add, patch.object(
             scene_usecases, "get_llm_config_from_db", new=AsyncMock(return_value=fake_config)
         ):
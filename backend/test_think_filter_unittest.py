@@ -0,0 +1,51 @@
+import unittest
+
+from app.services.think_filter import ThinkTagFilter, filter_stream, strip_think
+
+
+def run_chunks(chunks, strip_bold=True):
+    f = ThinkTagFilter(strip_bold=strip_bold)
+    out = [f.feed(c) for c in chunks]
+    out.append(f.flush())
+    return "".join(out)
+
+
+class ThinkTagFilterTests(unittest.TestCase):
+    def test_tags_split_across_chunks(self):
+        chunks = ["开头<thi", "nk>推理过程</th", "ink>正文", "结尾"]
+        self.assertEqual(run_chunks(chunks), "开头正文结尾")
+
+    def test_every_split_point_matches_whole_text(self):
+        text = "前文<think>想一想**</think>**林远**看着<think>再想</think>窗外"
+        expected = "前文林远看着窗外"
+        for i in range(len(text) + 1):
+            for j in range(i, len(text) + 1):
+                self.assertEqual(run_chunks([text[:i], text[i:j], text[j:]]), expected, (i, j))
+
+    def test_bold_marker_split_across_chunks(self):
+        self.assertEqual(run_chunks(["他*", "*笑了*", "*"]), "他笑了")
+        self.assertEqual(run_chunks(["单个*", "星号"]), "单个*星号")
+
+    def test_keep_bold_when_disabled(self):
+        self.assertEqual(run_chunks(["**粗", "体**<think>x</think>"], strip_bold=False), "**粗体**")
+
+    def test_unclosed_think_swallows_rest(self):
+        self.assertEqual(run_chunks(["正文<think>没有结束", "的思考"]), "正文")
+
+    def test_partial_tag_at_end_is_flushed(self):
+        self.assertEqual(run_chunks(["比较 a <th"]), "比较 a <th")
+        self.assertEqual(strip_think("x < y"), "x < y")
+
+
+class ThinkFilterStreamTests(unittest.IsolatedAsyncioTestCase):
+    async def test_filter_stream_skips_empty_pieces(self):
+        async def source():
+            for chunk in ["<think>", "隐藏", "</think>", "可见"]:
+                yield chunk
+
+        out = [c async for c in filter_stream(source())]
+        self.assertEqual(out, ["可见"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,7 +14,7 @@ export const novelApi = {
   update: (id, data) => api.put(`/novels/${id}`, data),
   delete: (id) => api.delete(`/novels/${id}`),
   generateOutline: (id, data) => api.post(`/novels/${id}/outline`, data),
-  getRagSummaries: (id) => api.get(`/novels/${id}/rag/summaries`),
+  getRagSummaries: (id, params) => api.get(`/novels/${id}/rag/summaries`, { params }),
   updateRagSummary: (novelId, docId, data) => api.put(`/novels/${novelId}/rag/summaries/${docId}`, data),
   deleteRagSummary: (novelId, docId) => api.delete(`/novels/${novelId}/rag/summaries/${docId}`),
   export: (id) => api.get(`/novels/${id}/export`, { responseType: 'blob' }),